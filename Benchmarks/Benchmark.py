@@ -0,0 +1,231 @@
+'''Benchmarks of the stages of the toolchain on the programs of the repository: the Cars game (section 9) for the tokenizer,
+   both compilation engines and the VM translator, and the programs of section 4 and the translated game for the assembler.
+   Each workload can be scaled up by replicas of its files, with their class names and labels renamed, or the game can be
+   replaced by a program of any size made by JackGenerator, to measure how each stage scales.
+   The results can be saved as a baseline, and a later run compared with it fails when a benchmark gets slower'''
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "Toolchain"))
+import JackToolchain
+import JackTokenizer
+from JackGenerator import JackGenerator
+
+CARS_DIRECTORY = os.path.join(ROOT_DIRECTORY, 'Section 09 - "Cars" Game')
+ASSEMBLY_DIRECTORY = os.path.join(ROOT_DIRECTORY, "Section 04 - Assembly Programs")
+COMPILER_I_DIRECTORY = os.path.join(ROOT_DIRECTORY, "Section 10 - Compiler (I)")
+
+THRESHOLD = 0.10    # a benchmark regresses when its throughput is lower than the baseline's by more than this
+MIN_RUN_SECONDS = 0.05  # a timed run repeats a short workload until it takes at least this long, so the timer's resolution doesn't matter
+
+# A benchmark: its name, the unit of its throughput, the amount of units in a run, and a function that does a run
+Benchmark = namedtuple("Benchmark", ["name", "unit", "amount", "run"])
+
+
+def readFiles(directory, extension):
+    '''Returns a dictionary of the names and contents of the files with the given extension in the directory, sorted by name'''
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(extension):
+            with open(os.path.join(directory, name), "r") as input:
+                files[name] = input.read()
+    return files
+
+
+def replicate(files, scale, names):
+    '''Returns the files and scale - 1 replicas of them, where each of the given names (classes or labels)
+       is renamed name_i in the code and in the files' names of replica i'''
+    if scale == 1 or not names:
+        return dict(files)
+    pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True)) + r")\b")
+    replicas = dict(files)
+    for i in range(2, scale + 1):
+        for fileName, code in files.items():
+            replicas[pattern.sub(rf"\1_{i}", fileName)] = pattern.sub(rf"\1_{i}", code)
+    return replicas
+
+
+def assemblyLabels(code):
+    '''Returns the labels declared in assembly code'''
+    return set(re.findall(r"^\s*\(([^)]+)\)", code, re.MULTILINE))
+
+
+class Workloads:
+    '''The inputs of the benchmarks, at a given scale, and the modules of the stages'''
+
+    def __init__(self, scale, temporaryDirectory, generatedLines=None, seed=0):
+        '''generatedLines replaces the game by a generated program of about that many lines'''
+        toolchain = JackToolchain.JackToolchain()
+        self.toolchain = toolchain
+        self.tokenizer = JackTokenizer
+        self.compilerI = JackToolchain.loadSection(COMPILER_I_DIRECTORY, ["CompilationEngine"])["CompilationEngine"]
+
+        if generatedLines is None:
+            programName = "Cars"
+            jackFiles = readFiles(CARS_DIRECTORY, ".jack")
+            vmFiles = readFiles(CARS_DIRECTORY, ".vm")
+        else:
+            programName = "Generated"
+            jackFiles = JackGenerator(seed).generate(generatedLines)
+            vmFiles = {fileName.rpartition(".")[0] + ".vm": toolchain.compileClass(fileName, code)
+                       for fileName, code in jackFiles.items()}
+        classNames = {fileName.rpartition(".")[0] for fileName in jackFiles}
+        self.jackFiles = replicate(jackFiles, scale, classNames)
+        self.vmFiles = replicate(vmFiles, scale, classNames)
+
+        # the compiler of section 10 reads files, so the replicas are written to a temporary directory
+        self.directory = temporaryDirectory
+        for fileName, code in self.jackFiles.items():
+            with open(os.path.join(self.directory, fileName), "w") as output:
+                output.write(code)
+
+        self.jackLines = sum(code.count("\n") + 1 for code in self.jackFiles.values())
+        self.tokens = sum(len(self.tokenizer.TokenStream(self.tokenizer.tokenize(code))) for code in self.jackFiles.values())
+        self.vmCommands = sum(1 for code in self.vmFiles.values() for line in code.splitlines()
+                              if line.partition("//")[0].strip())
+
+        # the programs of section 4 (replicated with their labels renamed) and the translated game (or generated program)
+        self.assemblyPrograms = {}
+        for fileName, code in readFiles(ASSEMBLY_DIRECTORY, ".asm").items():
+            replicas = replicate({fileName: code}, scale, assemblyLabels(code))
+            self.assemblyPrograms[fileName] = "\n".join(replicas.values())
+        self.assemblyPrograms[programName + ".asm"] = self.translate()
+        self.instructions = {fileName: len(self.toolchain.assemblyParser.parseProgram(code.splitlines())[0])
+                             for fileName, code in self.assemblyPrograms.items()}
+
+    def tokenize(self):
+        for fileName, code in self.jackFiles.items():
+            self.tokenizer.JackTokenizer(fileName, code)
+
+    def compileToXML(self):
+        for fileName in self.jackFiles:
+            inputFile = os.path.join(self.directory, fileName)
+            self.compilerI.CompilationEngine(inputFile, inputFile.rpartition(".")[0]).compileClass()
+
+    def compileToVM(self):
+        for fileName, code in self.jackFiles.items():
+            self.toolchain.compileClass(fileName, code)
+
+    def translate(self):
+        return self.toolchain.translate(list(self.vmFiles.items()))
+
+    def assemble(self, fileName):
+        return self.toolchain.assemble(self.assemblyPrograms[fileName])
+
+    def benchmarks(self):
+        '''Returns the list of Benchmarks'''
+        benchmarks = [Benchmark("tokenizer", "tokens", self.tokens, self.tokenize),
+                      Benchmark("compiler (I) to XML", "lines", self.jackLines, self.compileToXML),
+                      Benchmark("compiler (II) to VM", "lines", self.jackLines, self.compileToVM),
+                      Benchmark("VM translator", "commands", self.vmCommands, self.translate)]
+        for fileName in self.assemblyPrograms:
+            benchmarks.append(Benchmark(f"assembler ({fileName})", "instructions", self.instructions[fileName],
+                                        lambda fileName=fileName: self.assemble(fileName)))
+        return benchmarks
+
+
+def _timeLoops(benchmark, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        benchmark.run()
+    return time.perf_counter() - start
+
+
+def measure(benchmark, repeat):
+    '''Runs the benchmark repeat times, and once more under tracemalloc for its peak memory. Returns the statistics
+       of the runs. The number of loops of a run is doubled until it takes MIN_RUN_SECONDS, which also warms it up.
+       The throughput is that of the fastest run, which is the least disturbed by the rest of the machine'''
+
+    loops = 1
+    while _timeLoops(benchmark, loops) < MIN_RUN_SECONDS:
+        loops *= 2
+    times = [_timeLoops(benchmark, loops) / loops for _ in range(repeat)]
+
+    tracemalloc.start()
+    benchmark.run()
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"unit": benchmark.unit,
+            "amount": benchmark.amount,
+            "loops": loops,
+            "min seconds": min(times),
+            "median seconds": statistics.median(times),
+            "stdev seconds": statistics.stdev(times) if repeat > 1 else 0.0,
+            "throughput": benchmark.amount / min(times),     # units per second
+            "peak memory bytes": peakMemory}
+
+
+def compare(results, baseline, threshold):
+    '''Returns the lines of a comparison of the results with the baseline, and the number of regressions'''
+    lines = []
+    regressions = 0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name}: not in the baseline")
+            continue
+        change = result["throughput"] / base["throughput"] - 1
+        regressed = change < -threshold
+        regressions += regressed
+        lines.append(f"{name}: {change:+.1%} throughput{'  REGRESSION' if regressed else ''}")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Benchmarks the tokenizer, the compilers, the VM translator and the assembler")
+    argumentParser.add_argument("--scale", type=int, default=1, help="number of replicas of each workload (default: 1)")
+    argumentParser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each benchmark (default: 5)")
+    argumentParser.add_argument("--generate", type=int, metavar="LINES",
+                                help="replace the Cars game by a generated program of about this many lines (see JackGenerator.py)")
+    argumentParser.add_argument("--seed", type=int, default=0, help="the seed of the generated program (default: 0)")
+    argumentParser.add_argument("--only", help="run only the benchmarks whose names contain this")
+    argumentParser.add_argument("--save", help="write the results to this JSON file, to be used as a baseline")
+    argumentParser.add_argument("--baseline", help="compare the results with this JSON file, and fail on a regression")
+    argumentParser.add_argument("--threshold", type=float, default=THRESHOLD,
+                                help=f"throughput loss (a fraction) that counts as a regression (default: {THRESHOLD})")
+    arguments = argumentParser.parse_args()
+
+    temporaryDirectory = tempfile.mkdtemp(prefix="jackbench")
+    try:
+        workloads = Workloads(arguments.scale, temporaryDirectory, arguments.generate, arguments.seed)
+        results = {}
+        for benchmark in workloads.benchmarks():
+            if arguments.only is not None and arguments.only not in benchmark.name:
+                continue
+            result = results[benchmark.name] = measure(benchmark, arguments.repeat)
+            print(f"{benchmark.name:32} {result['throughput']:14,.0f} {benchmark.unit}/s"
+                  f"  best {result['min seconds'] * 1000:9.3f} ms"
+                  f"  stdev {result['stdev seconds'] / result['median seconds']:6.1%}"
+                  f"  peak {result['peak memory bytes'] / 1024:9,.0f} KiB")
+    finally:
+        shutil.rmtree(temporaryDirectory)
+
+    report = {"scale": arguments.scale, "generate": arguments.generate, "seed": arguments.seed, "repeat": arguments.repeat, "python": sys.version.split()[0], "results": results}
+    if arguments.save is not None:
+        with open(arguments.save, "w") as output:
+            json.dump(report, output, indent=1)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, "r") as input:
+            baseline = json.load(input)
+        if baseline["scale"] != arguments.scale:
+            sys.exit(f"the baseline was measured at scale {baseline['scale']}, not {arguments.scale}")
+        if (baseline.get("generate"), baseline.get("seed", 0)) != (arguments.generate, arguments.seed):
+            sys.exit("the baseline was measured on another program (see --generate and --seed)")
+        lines, regressions = compare(results, baseline["results"], arguments.threshold)
+        print("\n".join(lines))
+        if regressions:
+            sys.exit(f"{regressions} benchmark(s) regressed by more than {arguments.threshold:.0%}")
\ No newline at end of file
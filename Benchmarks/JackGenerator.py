@@ -0,0 +1,180 @@
+'''Generates synthetic Jack programs of any size, for the benchmarks: valid classes that use the whole grammar the compiler
+   supports (fields and statics, constructors, functions and methods, arrays, strings, nested expressions, calls,
+   if/else and while). The program is made for compiling, not for running.
+   The same seed and sizes always give the same program'''
+
+import os
+import random
+import argparse
+
+OPERATORS = ["+", "-", "*", "/", "&", "|", "<", ">", "="]
+UNARY_OPERATORS = ["-", "~"]
+STRINGS = ["hello", "score: ", "game over", "", "x = ", "Jack"]
+
+
+class JackGenerator:
+    '''Generates the classes of a program. The shape is set by the number of subroutines per class, the number of
+       statements per subroutine, and the depths of expressions and of nested statements'''
+
+    def __init__(self, seed=0, subroutines=8, statements=12, expressionDepth=2, nestingDepth=2):
+        self.random = random.Random(seed)
+        self.subroutines = subroutines
+        self.statements = statements
+        self.expressionDepth = expressionDepth
+        self.nestingDepth = nestingDepth
+        self.classes = []       # the names of the planned classes
+        self.functions = {}     # class --> [(function name, number of arguments)]
+        self.methods = {}       # class --> [(method name, number of arguments)]
+
+    def plan(self, nClasses):
+        '''Decides the names of the classes and their subroutines, so the classes can call each other'''
+        rand = self.random
+        for i in range(len(self.classes), nClasses):
+            className = f"Class{i}"
+            self.classes.append(className)
+            nFunctions = rand.randint(1, max(1, self.subroutines // 2))
+            self.functions[className] = [(f"function{j}", rand.randint(0, 3)) for j in range(nFunctions)]
+            self.methods[className] = [(f"method{j}", rand.randint(0, 3)) for j in range(self.subroutines - nFunctions)]
+
+    # Expressions
+
+    def _expression(self, scope, depth):
+        rand = self.random
+        code = self._term(scope, depth)
+        for _ in range(rand.randint(0, 2) if depth > 0 else 0):
+            code += f" {rand.choice(OPERATORS)} {self._term(scope, depth - 1)}"
+        return code
+
+    def _term(self, scope, depth):
+        rand = self.random
+        choice = rand.randrange(10) if depth > 0 else rand.randrange(4)
+        if choice == 0:
+            return str(rand.choice([0, 1, 2, 7, 100, rand.randint(0, 32767)]))
+        elif choice == 1:
+            return rand.choice(["true", "false", "null"] + (["this"] if scope["this"] else []))
+        elif choice == 2 or choice == 3:
+            return rand.choice(scope["ints"])
+        elif choice == 4:
+            return f'"{rand.choice(STRINGS)}"'
+        elif choice == 5:
+            return f"array[{self._expression(scope, depth - 1)}]"
+        elif choice == 6:
+            return f"({self._expression(scope, depth - 1)})"
+        elif choice == 7:
+            return f"{rand.choice(UNARY_OPERATORS)}{self._term(scope, depth - 1)}"
+        return self._call(scope, depth - 1)
+
+    def _call(self, scope, depth):
+        '''A call of a function of any class, or of a method of this class (on this or on another object)'''
+        rand = self.random
+        className = scope["class"]
+        arguments = lambda nArgs: ", ".join(self._expression(scope, depth) for _ in range(nArgs))
+        choice = rand.randrange(3)
+        if choice == 0 or not self.methods[className]:
+            calledClass = rand.choice(self.classes)
+            name, nArgs = rand.choice(self.functions[calledClass])
+            return f"{calledClass}.{name}({arguments(nArgs)})"
+        name, nArgs = rand.choice(self.methods[className])
+        if choice == 1 and scope["this"]:
+            return f"{name}({arguments(nArgs)})"
+        return f"object.{name}({arguments(nArgs)})"
+
+    # Statements
+
+    def _statements(self, scope, indent, nesting, count):
+        return [line for _ in range(count) for line in self._statement(scope, indent, nesting)]
+
+    def _statement(self, scope, indent, nesting):
+        rand = self.random
+        depth = self.expressionDepth
+        choice = rand.randrange(8) if nesting > 0 else rand.randrange(4)
+        if choice == 0 or choice == 1:
+            return [f"{indent}let {rand.choice(scope['ints'])} = {self._expression(scope, depth)};"]
+        elif choice == 2:
+            return [f"{indent}let array[{self._expression(scope, depth - 1)}] = {self._expression(scope, depth)};"]
+        elif choice == 3:
+            return [f"{indent}do {self._call(scope, depth - 1)};"]
+        elif choice == 4 or choice == 5:
+            lines = [f"{indent}if ({self._expression(scope, depth)}) {{"]
+            lines += self._statements(scope, indent + "    ", nesting - 1, rand.randint(1, 3))
+            if rand.random() < 0.5:
+                lines.append(f"{indent}}} else {{")
+                lines += self._statements(scope, indent + "    ", nesting - 1, rand.randint(1, 3))
+            return lines + [f"{indent}}}"]
+        lines = [f"{indent}while ({self._expression(scope, depth)}) {{"]
+        lines += self._statements(scope, indent + "    ", nesting - 1, rand.randint(1, 3))
+        return lines + [f"{indent}}}"]
+
+    # Classes
+
+    def _subroutine(self, className, kind, name, nArgs, fields, statics):
+        rand = self.random
+        arguments = [f"argument{k}" for k in range(nArgs)]
+        locals = [f"local{k}" for k in range(rand.randint(1, 4))]
+        hasThis = kind != "function"
+        scope = {"class": className, "this": hasThis, "ints": arguments + locals + statics + (fields if hasThis else [])}
+
+        returnType = className if kind == "constructor" else "int"
+        lines = [f"    {kind} {returnType} {name}({', '.join('int ' + argument for argument in arguments)}) {{",
+                 f"        var int {', '.join(locals)};",
+                 "        var Array array;",
+                 f"        var {className} object;",
+                 f"        let array = Array.new({rand.randint(1, 100)});"]
+        if kind == "constructor":
+            lines += [f"        let {field} = {self._expression(scope, 1)};" for field in fields]
+            lines.append("        let object = this;")
+        else:
+            lines.append(f"        let object = {className}.new();")
+        lines += self._statements(scope, "        ", self.nestingDepth, self.statements)
+        lines.append("        return this;" if kind == "constructor" else f"        return {self._expression(scope, self.expressionDepth)};")
+        return lines + ["    }", ""]
+
+    def generateClass(self, className):
+        '''Returns the Jack code of one of the planned classes'''
+        rand = self.random
+        fields = [f"field{k}" for k in range(rand.randint(1, 4))]
+        statics = [f"static{k}" for k in range(rand.randint(0, 2))]
+
+        lines = [f"class {className} {{"]
+        if statics:
+            lines.append(f"    static int {', '.join(statics)};")
+        lines += [f"    field int {', '.join(fields)};", ""]
+        lines += self._subroutine(className, "constructor", "new", 0, fields, statics)
+        for name, nArgs in self.functions[className]:
+            lines += self._subroutine(className, "function", name, nArgs, fields, statics)
+        for name, nArgs in self.methods[className]:
+            lines += self._subroutine(className, "method", name, nArgs, fields, statics)
+        return "\n".join(lines) + "}\n"
+
+    def generate(self, lines):
+        '''Returns a program of about the given number of lines, as a dictionary of file names and Jack code'''
+        files = {}
+        total = 0
+        nClasses = 1
+        while total < lines:
+            self.plan(nClasses)     # the new class can be called by the classes that come after it
+            className = self.classes[-1]
+            files[className + ".jack"] = code = self.generateClass(className)
+            total += code.count("\n")
+            nClasses += 1
+        return files
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Generates a synthetic Jack program for the benchmarks")
+    argumentParser.add_argument("outputDirectory")
+    argumentParser.add_argument("--lines", type=int, default=10000, help="about how many lines to generate (default: 10000)")
+    argumentParser.add_argument("--seed", type=int, default=0)
+    argumentParser.add_argument("--subroutines", type=int, default=8, help="subroutines per class (default: 8)")
+    argumentParser.add_argument("--statements", type=int, default=12, help="statements per subroutine (default: 12)")
+    argumentParser.add_argument("--expression-depth", type=int, default=2, help="depth of nested terms (default: 2)")
+    argumentParser.add_argument("--nesting-depth", type=int, default=2, help="depth of nested if and while statements (default: 2)")
+    arguments = argumentParser.parse_args()
+
+    generator = JackGenerator(arguments.seed, arguments.subroutines, arguments.statements,
+                              arguments.expression_depth, arguments.nesting_depth)
+    os.makedirs(arguments.outputDirectory, exist_ok=True)
+    for fileName, code in generator.generate(arguments.lines).items():
+        with open(os.path.join(arguments.outputDirectory, fileName), "w") as output:
+            output.write(code)
\ No newline at end of file
@@ -1,3 +1,47 @@
+instructionCodes = {}   # full C-instruction text (dest=comp;jump) --> 16-bit binary code
+
+
+def _buildInstructionCodes():
+    '''Precomputes the binary codes of every dest=comp;jump combination of the mnemonics in the Code tables'''
+    code = Code()
+    compStrings = list(code.compCode) + [compString.replace("A", "M") for compString in code.compCode if "A" in compString]
+    for destString in code.destCode:
+        destPrefix = "" if destString == "null" else destString + "="
+        for compString in compStrings:
+            for jumpString in code.jumpCode:
+                jumpSuffix = "" if jumpString == "null" else ";" + jumpString
+                instructionCodes[destPrefix + compString + jumpSuffix] = code.instruction(destString, compString, jumpString)
+
+
+def instructionTable():
+    '''Returns the table of C-instruction binary codes, building it on first use'''
+    if not instructionCodes:
+        _buildInstructionCodes()
+    return instructionCodes
+
+
+def encode(command):
+    '''Returns the 16-bit binary code of the given C-instruction (without whitespaces and comments).
+       Forms missing from the table (e.g. dest registers written in another order, as in "DM=D+1")
+       are translated once and memoized'''
+    word = instructionTable().get(command)
+    if word is None:
+        code = Code()
+        destString, hasDest, rest = command.partition("=")
+        if not hasDest:
+            destString, rest = "null", destString
+        compString, hasJump, jumpString = rest.partition(";")
+        if not hasJump:
+            jumpString = "null"
+        for knownDest in code.destCode:
+            if sorted(knownDest) == sorted(destString):
+                destString = knownDest
+                break
+        word = code.instruction(destString, compString, jumpString)
+        instructionCodes[command] = word
+    return word
+
+
 class Code:
     '''Translates Hack assembly language mnemonics into binary codes'''
 
@@ -24,7 +68,10 @@ class Code:
                             "D-A" : "010011",
                             "A-D" : "000111",
                             "D&A" : "000000",
-                            "D|A" : "010101"    }
+                            "D|A" : "010101",
+                            "A+D" : "000010",   # commutative forms of the above
+                            "A&D" : "000000",
+                            "A|D" : "010101"    }
         self.destCode = {   "null" : "000",
                             "M"    : "001",
                             "D"    : "010",
@@ -32,7 +79,8 @@ class Code:
                             "A"    : "100",
                             "AM"   : "101",
                             "AD"   : "110",
-                            "ADM"  : "111"      }
+                            "ADM"  : "111",
+                            "AMD"  : "111"      }
         self.jumpCode = {   "null" : "000",
                             "JGT"  : "001",
                             "JEQ"  : "010",
@@ -53,4 +101,9 @@ class Code:
 
     def jump(self, jumpString):
         '''Returns the binary code of the jump mnemonic'''
-        return self.jumpCode[jumpString]
\ No newline at end of file
+        return self.jumpCode[jumpString]
+
+    def instruction(self, destString, compString, jumpString):
+        '''Returns the 16-bit binary code of the C-instruction with the given mnemonics, together with the "a" bit'''
+        AorM = "1" if "M" in compString else "0"
+        return "111" + AorM + self.comp(compString) + self.dest(destString) + self.jump(jumpString)
\ No newline at end of file
@@ -1,10 +1,20 @@
 '''Reads as input a text file named Prog.asm, containing a Hack assembly program,
    and produces as output a text file named Prog.hack, containing the translated Hack machine code'''
 
+import os
 import sys
+import time
+import argparse
 import Parser
 import Code
 import SymbolTable
+import HackBinary
+# Instrumentation and SourceMap are shared by the sections: they are in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import Instrumentation
+import SourceMap
 
 def symbolTableInit(symbolTable):
     '''Initializes the symbol table with all the predefined symbols and their pre-allocated RAM addresses'''
@@ -47,81 +57,177 @@ def replaceLabels(fileParser, symbolTable):
             
     fileParser.file.seek(0)
 
-# Create a SymbolTable object and initialize it with the predefined symbols
-symbolTable = SymbolTable.SymbolTable()
-symbolTableInit(symbolTable)
+def assembleProgram(instructions, labels):
+    '''Translates a program parsed by Parser.parseProgram into a list of 16-bit binary codes, one per instruction'''
 
-# Get .asm file name from input and open a .hack with the same name
-inputFilePath = sys.argv[1]
-outputFilePath = inputFilePath.rpartition(".")[0] + ".hack"
-outputFile = open(outputFilePath, "w")
+    # Create a SymbolTable object and initialize it with the predefined symbols and the program's labels
+    symbolTable = SymbolTable.SymbolTable()
+    symbolTableInit(symbolTable)
+    for label, address in labels.items():
+        symbolTable.addEntry(label, address)
 
-# Create a Parser object to parse the input .asm file and replace labels with ROM addresses
-fileParser = Parser.Parser(inputFilePath)
-replaceLabels(fileParser, symbolTable)
+    nextFreeRAMAddress = 16
 
-nextFreeRAMAddress = 16
+    # Each distinct instruction is translated only once
+    aInstructionCodes = {}
+    cInstructionCodes = Code.instructionTable()
+    words = []
 
-# Parse each line seperately
-while fileParser.hasMoreLines():
+    for instructionType, text in instructions:
 
-    fileParser.advance()
+        if instructionType == Parser.C_INSTRUCTION:
+            word = cInstructionCodes.get(text) or Code.encode(text)
 
-    if fileParser.instructionType() == "C_INSTRUCTION":
+        else:
+            word = aInstructionCodes.get(text)
+            if word is None:
+                symbol = text
 
-        code = Code.Code()
+                # check if address or symbol
+                if not symbol.isnumeric():
 
-        instructionType = "111"
-        AorM = "0"
+                    # if the symbol is not defined, add a new variable
+                    if not symbolTable.contains(symbol):
+                        symbolTable.addEntry(symbol, nextFreeRAMAddress)
+                        nextFreeRAMAddress += 1
+                    symbol = symbolTable.getAddress(symbol)
 
-        # get binary code of dest mnemonic
-        destString = fileParser.dest()
-        destBin = code.dest(destString)
+                # convert decimal to a 15-bit binary number
+                word = "0" + bin(int(symbol))[2:].rjust(15, "0")
+                aInstructionCodes[text] = word
+
+        words.append(word)
+
+    return words
+
+def assemble(inputFilePath, outputFilePath, formats=(HackBinary.HACK,), byteOrder=HackBinary.LITTLE, instrumentation=None,
+             sourceMap=False):
+    '''Reads the whole .asm file at once, translates it in memory and writes the program in each of the given formats.
+       outputFilePath is the path of the output files without an extension.
+       instrumentation (an Instrumentation) gets the time of each step and the numbers of instructions, labels and bytes.
+       With sourceMap, the map of the ROM addresses to the lines of the .asm file is written to outputFilePath.map'''
+
+    start = time.perf_counter()
+    with open(inputFilePath, "r") as inputFile:
+        lines = inputFile.read().splitlines()
+    instructions, labels = Parser.parseProgram(lines)
+    parsed = time.perf_counter()
+    binaryCodes = assembleProgram(instructions, labels)
+    assembled = time.perf_counter()
+    written = writeProgram(binaryCodes, outputFilePath, formats, byteOrder)
+    if sourceMap:
+        Parser.mapProgram(lines, os.path.basename(inputFilePath)).write(outputFilePath + SourceMap.EXTENSION)
+
+    if instrumentation is not None:
+        instrumentation.addTime("parse", inputFilePath, parsed - start)
+        instrumentation.count("parse", inputFilePath, "instructions", len(instructions))
+        instrumentation.addTime("assemble", inputFilePath, assembled - parsed)
+        instrumentation.count("assemble", inputFilePath, "labels resolved", len(labels))
+        instrumentation.addTime("write", inputFilePath, time.perf_counter() - assembled)
+        instrumentation.count("write", inputFilePath, "bytes written", written)
+
+def writeProgram(binaryCodes, outputFilePath, formats=(HackBinary.HACK,), byteOrder=HackBinary.LITTLE):
+    '''Writes the binary codes of a program in each of the given formats, and returns the number of bytes written.
+       outputFilePath is the path of the output files without an extension'''
+
+    if HackBinary.HACK in formats:
+        with open(f"{outputFilePath}.{HackBinary.HACK}", "w") as outputFile:
+            outputFile.write("".join(binaryCode + "\n" for binaryCode in binaryCodes))
+
+    if HackBinary.BIN in formats or HackBinary.HACKBIN in formats:
+        words = HackBinary.toWords(binaryCodes)
+        if HackBinary.BIN in formats:
+            HackBinary.writeRaw(f"{outputFilePath}.{HackBinary.BIN}", words, byteOrder)
+        if HackBinary.HACKBIN in formats:
+            HackBinary.writeHackBin(f"{outputFilePath}.{HackBinary.HACKBIN}", words)
+
+    return sum(os.path.getsize(f"{outputFilePath}.{outputFormat}") for outputFormat in set(formats))
+
+def assembleStream(inputFilePath, outputFilePath):
+    '''Translates the .asm file line by line with a Parser object, reading it twice (the first pass resolves the labels)'''
+
+    # Create a SymbolTable object and initialize it with the predefined symbols
+    symbolTable = SymbolTable.SymbolTable()
+    symbolTableInit(symbolTable)
+
+    outputFile = open(outputFilePath, "w")
+
+    # Create a Parser object to parse the input .asm file and replace labels with ROM addresses
+    fileParser = Parser.Parser(inputFilePath)
+    replaceLabels(fileParser, symbolTable)
+
+    nextFreeRAMAddress = 16
+
+    # Parse each line seperately
+    while fileParser.hasMoreLines():
+        fileParser.advance()
 
-        # get binary code of comp mnemonic, together with the "a" bit
-        compString = fileParser.comp()
-        if "M" in compString:
-            AorM = "1"
-        compBin = code.comp(compString)
+        if fileParser.instructionType() == "C_INSTRUCTION":
 
-        # get binary code of jump mnemonic
-        jumpString = fileParser.jump()
-        jumpBin = code.jump(jumpString)
+            # write the binary code to the .hack file
+            outputFile.write(Code.encode(fileParser.currentCommand) + "\n")
 
-        # write the binary code to the .hack file
-        # if fileParser.hasMoreLines():
-        outputFile.write(instructionType + AorM + compBin + destBin + jumpBin + "\n")
-        # else:
-            # outputFile.write(instructionType + AorM + compBin + destBin + jumpBin)
+        elif fileParser.instructionType() == "A_INSTRUCTION":
 
-    elif fileParser.instructionType() == "A_INSTRUCTION":
+            symbol = fileParser.symbol()
 
-        symbol = fileParser.symbol()
+            # check if address or symbol
+            if not symbol.isnumeric():
 
-        # check if address or symbol
-        if not symbol.isnumeric():
+                    # if the symbol is defined get its address
+                    if symbolTable.contains(symbol):
+                        symbol = symbolTable.getAddress(symbol)
 
-                # if the symbol is defined get its address
-                if symbolTable.contains(symbol):
-                    symbol = symbolTable.getAddress(symbol)
+                    # else, add a new symbol and get its address
+                    else:
+                        symbolTable.addEntry(symbol, nextFreeRAMAddress)
+                        nextFreeRAMAddress += 1
+                        symbol = symbolTable.getAddress(symbol)
 
-                # else, add a new symbol and get its address
-                else:
-                    symbolTable.addEntry(symbol, nextFreeRAMAddress)
-                    nextFreeRAMAddress += 1
-                    symbol = symbolTable.getAddress(symbol)
+            instructionType = "0"
+
+            # convert decimal to a 15-bit binary number
+            addressBin = bin(int(symbol))[2:]
+            addressBin15 = addressBin.rjust(15, "0")
+
+            # write the binary code to the .hack file
+            # if fileParser.hasMoreLines():
+            outputFile.write(instructionType + addressBin15 + "\n")
+            # else:
+                # outputFile.write(instructionType + addressBin15)
+
+    fileParser.file.close()
+    outputFile.close()
+
+
+if __name__ == "__main__":
 
-        instructionType = "0"
+    argumentParser = argparse.ArgumentParser(description="Translates a Hack assembly program (Prog.asm) into Hack machine code (Prog.hack)")
+    argumentParser.add_argument("inputFilePath", help="the .asm file to translate")
+    argumentParser.add_argument("--stream", action="store_true", help="parse the file line by line instead of loading it into memory (.hack output only)")
+    argumentParser.add_argument("--format", action="append", choices=HackBinary.FORMATS, dest="formats",
+                                help="output format, may be given more than once: hack (text, the default), bin (raw 16-bit words) or hackbin (memory-mappable image)")
+    argumentParser.add_argument("--byteorder", choices=[HackBinary.LITTLE, HackBinary.BIG], default=HackBinary.LITTLE, help="byte order of the bin format")
+    argumentParser.add_argument("--report", help="write the time of each step and the counters to this file (.json or .csv)")
+    argumentParser.add_argument("--source-map", action="store_true", help=f"write the map of the ROM addresses to the .asm lines (Prog{SourceMap.EXTENSION})")
+    arguments = argumentParser.parse_args()
+    instrumentation = Instrumentation.Instrumentation() if arguments.report else None
+    formats = arguments.formats or [HackBinary.HACK]
 
-        # convert decimal to a 15-bit binary number
-        addressBin = bin(int(symbol))[2:]
-        addressBin15 = addressBin.rjust(15, "0")
+    # The output files get the same name as the .asm file
+    outputFilePath = arguments.inputFilePath.rpartition(".")[0]
 
-        # write the binary code to the .hack file
-        # if fileParser.hasMoreLines():
-        outputFile.write(instructionType + addressBin15 + "\n")
-        # else:
-            # outputFile.write(instructionType + addressBin15)
+    if arguments.stream:
+        if formats != [HackBinary.HACK]:
+            argumentParser.error("--stream only writes the hack format")
+        if arguments.source_map:
+            argumentParser.error("--stream doesn't write a source map")
+        start = time.perf_counter()
+        assembleStream(arguments.inputFilePath, outputFilePath + ".hack")
+        if instrumentation is not None:
+            instrumentation.addTime("assemble (stream)", arguments.inputFilePath, time.perf_counter() - start)
+    else:
+        assemble(arguments.inputFilePath, outputFilePath, formats, arguments.byteorder, instrumentation, arguments.source_map)
 
-fileParser.file.close()
-outputFile.close()
\ No newline at end of file
+    if instrumentation is not None:
+        instrumentation.writeReport(arguments.report)
\ No newline at end of file
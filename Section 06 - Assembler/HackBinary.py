@@ -0,0 +1,98 @@
+'''Reads and writes Hack machine code in its binary forms:
+   raw 16-bit words (.bin) in little or big endian order, and the memory-mappable .hackbin image,
+   which is a 16 bytes header followed by the program's words in little endian order'''
+
+import array
+import mmap
+import struct
+import sys
+
+HACK = "hack"           # text, a line of 16 '0'/'1' characters per instruction
+BIN = "bin"             # raw 16-bit words
+HACKBIN = "hackbin"     # header + little endian 16-bit words
+FORMATS = [HACK, BIN, HACKBIN]
+
+LITTLE = "little"
+BIG = "big"
+
+HACKBIN_MAGIC = b"HACKBIN\0"
+HACKBIN_VERSION = 1
+HACKBIN_HEADER = struct.Struct("<8sHHI")    # magic, version, byte order of the words (0 = little), number of words
+
+
+def toWords(binaryCodes):
+    '''Converts a list of 16 characters binary codes into an array of unsigned 16-bit words'''
+    return array.array("H", [int(binaryCode, 2) for binaryCode in binaryCodes])
+
+
+def _ordered(words, byteOrder):
+    '''Returns the words as an array in the given byte order'''
+    if byteOrder != sys.byteorder:
+        words = array.array("H", words)     # swap a copy, not the caller's array
+        words.byteswap()
+    return words
+
+
+def writeRaw(fileName, words, byteOrder=LITTLE):
+    '''Writes the words as raw 16-bit values in the given byte order'''
+    with open(fileName, "wb") as output:
+        output.write(_ordered(words, byteOrder).tobytes())
+
+
+def writeHackBin(fileName, words):
+    '''Writes the words as a .hackbin image'''
+    with open(fileName, "wb") as output:
+        output.write(HACKBIN_HEADER.pack(HACKBIN_MAGIC, HACKBIN_VERSION, 0, len(words)))
+        output.write(_ordered(words, LITTLE).tobytes())
+
+
+def readRaw(fileName, byteOrder=LITTLE):
+    '''Reads a file of raw 16-bit words in the given byte order into an array'''
+    words = array.array("H")
+    with open(fileName, "rb") as image:
+        data = image.read()
+    if len(data) % 2:
+        raise ValueError(f"{fileName} is truncated: it has an odd number of bytes")
+    words.frombytes(data)
+    return _ordered(words, byteOrder)
+
+
+def readHackBin(fileName):
+    '''Maps a .hackbin image into memory and returns its words.
+       On little endian machines the result is a zero-copy memoryview of the mapped file'''
+    with open(fileName, "rb") as image:
+        if not image.seek(0, 2):
+            raise ValueError(f"{fileName} is not a version {HACKBIN_VERSION} .hackbin image")     # an empty file can't be mapped
+        mapped = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, byteOrder, count = HACKBIN_HEADER.unpack_from(mapped)
+    except struct.error:        # shorter than the header
+        magic = version = None
+    if magic != HACKBIN_MAGIC or version != HACKBIN_VERSION:
+        raise ValueError(f"{fileName} is not a version {HACKBIN_VERSION} .hackbin image")
+    if len(mapped) < HACKBIN_HEADER.size + 2 * count:
+        raise ValueError(f"{fileName} is truncated: its header gives {count} words")
+
+    words = memoryview(mapped)[HACKBIN_HEADER.size:HACKBIN_HEADER.size + 2 * count].cast("H")
+    storedOrder = LITTLE if byteOrder == 0 else BIG
+    if storedOrder != sys.byteorder:
+        words = array.array("H", words)
+        words.byteswap()
+    return words
+
+
+def readHack(fileName):
+    '''Reads a text .hack file into an array of words'''
+    with open(fileName, "r") as program:
+        return toWords(program.read().split())
+
+
+def readProgram(fileName, byteOrder=LITTLE):
+    '''Reads a program in any of the formats, according to the file's extension'''
+    extension = fileName.rpartition(".")[2]
+    if extension == HACKBIN:
+        return readHackBin(fileName)
+    elif extension == BIN:
+        return readRaw(fileName, byteOrder)
+    return readHack(fileName)
@@ -0,0 +1,377 @@
+'''Executes Hack machine code (a .hack, .bin or .hackbin file produced by HackAssembler.py).
+   The ROM is predecoded into parallel opcode and operand arrays, so the main loop
+   never looks at instruction bits, and the RAM is a preallocated array of 16-bit words.
+   In the block mode, straight-line runs of instructions are compiled into Python functions'''
+
+import sys
+import time
+import array
+import hashlib
+import argparse
+import collections
+import Code
+import HackBinary
+import HackMemory
+from HackMemory import SCREEN, KBD
+
+ROM_SIZE = 32768
+ADDRESS_MASK = 0x7FFF   # only the 15 low bits of A address the memory and the ROM
+
+# Predecoded opcodes: A-instructions get A_LOAD, and C-instructions get their 7 comp bits ("a" bit included) plus one
+A_LOAD = 0
+
+# Bits of the C-instruction operand: the 3 dest bits and then the 3 jump bits
+DEST_A = 0b100000
+DEST_D = 0b010000
+DEST_M = 0b001000
+JUMP_LT = 0b100
+JUMP_EQ = 0b010
+JUMP_GT = 0b001
+JUMP_ALWAYS = 0b111
+
+
+JUMP_CONDITIONS = ["False", "value > 0", "value == 0", "value >= 0", "value < 0", "value != 0", "value <= 0", "True"]
+
+
+def _compExpression(compString):
+    '''Returns a Python expression template computing the given comp mnemonic on 16-bit signed values,
+       where {x} stands for D and {y} for A or M'''
+    expression = compString.replace("D", "{x}").replace("A", "{y}").replace("!", "~")
+    if "+" in expression or "-" in expression:     # arithmetic may overflow, wrap it to 16 bits
+        expression = f"((({expression}) + 32768) & 65535) - 32768"
+    return expression
+
+
+def _aluFunction(compString):
+    '''Creates a function of (D, A or M) computing the given comp mnemonic on 16-bit signed values'''
+    return eval(f"lambda x, y: {_compExpression(compString).format(x='x', y='y')}")
+
+
+def _aluControlFunction(controlBits):
+    '''Creates a function of (x, y) that follows the ALU's zx, nx, zy, ny, f and no control bits.
+       Used for the comp codes that have no mnemonic'''
+    zx, nx, zy, ny, f, no = [bit == "1" for bit in controlBits]
+
+    def alu(x, y):
+        if zx:
+            x = 0
+        if nx:
+            x = ~x
+        if zy:
+            y = 0
+        if ny:
+            y = ~y
+        out = x + y if f else x & y
+        if no:
+            out = ~out
+        return ((out + 32768) & 65535) - 32768
+
+    return alu
+
+
+def _aluTable():
+    '''Returns a list of the ALU functions indexed by opcode (the 7 comp bits of a C-instruction plus one)'''
+    code = Code.Code()
+    functions = {controlBits: _aluControlFunction(controlBits) for controlBits in (format(bits, "06b") for bits in range(64))}
+    for compString, controlBits in code.compCode.items():
+        functions[controlBits] = _aluFunction(compString)
+    table = [None]
+    for aBit in range(2):
+        for bits in range(64):
+            table.append(functions[format(bits, "06b")])
+    return table
+
+
+ALU = _aluTable()
+COMP_EXPRESSIONS = {int(controlBits, 2): _compExpression(compString) for compString, controlBits in Code.Code().compCode.items()}
+
+MAX_COMPILED_ROMS = 8   # the ROMs whose compiled blocks are kept, the least recently loaded ones are dropped first
+_compiledBlocks = collections.OrderedDict()     # ROM hash --> the blocks compiled for that ROM, by start address
+
+
+def predecode(program):
+    '''Splits each instruction word into an opcode and an operand.
+       Returns the arrays of the opcodes and of the operands (the value of an A-instruction, or the dest and jump bits)'''
+    if len(program) > ROM_SIZE:
+        raise ValueError(f"the program has {len(program)} instructions, but the ROM only holds {ROM_SIZE}")
+
+    opcodes = array.array("B", bytes(len(program)))
+    operands = array.array("H", bytes(2 * len(program)))
+    for address, word in enumerate(program):
+        if word & 0x8000:   # C-instruction: 111a cccc ccdd djjj
+            opcodes[address] = ((word >> 6) & 0x7F) + 1
+            operands[address] = word & 0x3F
+        else:
+            opcodes[address] = A_LOAD
+            operands[address] = word
+    return opcodes, operands
+
+
+def findLeaders(opcodes, operands):
+    '''Returns the addresses that start a basic block: the first instruction, every instruction that follows a jump,
+       and every jump target loaded by the A-instruction right before a jump (the program's labels)'''
+    leaders = {0}
+    for address in range(len(opcodes)):
+        if opcodes[address] != A_LOAD and operands[address] & JUMP_ALWAYS:
+            leaders.add(address + 1)
+            if address > 0 and opcodes[address - 1] == A_LOAD:
+                leaders.add(operands[address - 1])
+    return leaders
+
+
+class BlockCompiler:
+    '''Compiles the basic blocks of a predecoded ROM into Python functions.
+       A block runs from its start address to its first jump, or up to the next leader, and its function
+       takes and returns the registers: block(a, d, ram, dirtyWords) --> (next pc, a, d)'''
+
+    def __init__(self, opcodes, operands):
+        '''Prepares the compilation of the given ROM, sharing the blocks already compiled for an identical ROM'''
+        self.opcodes = opcodes
+        self.operands = operands
+        self.leaders = findLeaders(opcodes, operands)
+        romHash = hashlib.sha1(opcodes.tobytes() + operands.tobytes()).hexdigest()
+        self.blocks = _compiledBlocks.pop(romHash, {})
+        _compiledBlocks[romHash] = self.blocks
+        while len(_compiledBlocks) > MAX_COMPILED_ROMS:
+            _compiledBlocks.popitem(last=False)
+
+    def block(self, start):
+        '''Returns the (function, number of instructions, halts) entry of the block that starts at the given address'''
+        entry = self.blocks.get(start)
+        if entry is None:
+            entry = self.blocks[start] = self._compile(start)
+        return entry
+
+    def _compile(self, start):
+        '''Generates and compiles the Python function of the block that starts at the given address'''
+        opcodes = self.opcodes
+        operands = self.operands
+        romSize = len(opcodes)
+
+        lines = [f"def block_{start}(a, d, ram, dirtyWords):"]
+        knownA = None       # the value of A when it was set by an A-instruction of this block
+        endsWithJump = False
+        address = start
+
+        while address < romSize:
+            if address != start and address in self.leaders:
+                break
+
+            opcode = opcodes[address]
+            operand = operands[address]
+            address += 1
+
+            if opcode == A_LOAD:
+                knownA = operand
+                continue
+
+            comp = opcode - 1
+            jump = operand & JUMP_ALWAYS
+
+            # M and the jump address refer to A before this instruction changes it
+            if knownA is None:
+                aValue = "a"
+                memory = "address"
+                if comp & 64 or operand & DEST_M or jump:
+                    lines.append("    address = a & 32767")
+            else:
+                aValue = str(knownA)
+                memory = str(knownA & ADDRESS_MASK)
+
+            expression = COMP_EXPRESSIONS.get(comp & 63)
+            if expression is None:
+                expression = f"alu[{opcode}]({{x}}, {{y}})"
+            lines.append(f"    value = {expression.format(x='d', y=f'ram[{memory}]' if comp & 64 else aValue)}")
+
+            if operand & DEST_M:
+                lines.append(f"    ram[{memory}] = value")
+                if knownA is None:
+                    lines.append(f"    if {SCREEN} <= address < {KBD}:")
+                    lines.append(f"        dirtyWords.add(address - {SCREEN})")
+                elif SCREEN <= knownA < KBD:
+                    lines.append(f"    dirtyWords.add({knownA - SCREEN})")
+            if operand & DEST_A:
+                lines.append("    a = value")
+                knownA = None
+            if operand & DEST_D:
+                lines.append("    d = value")
+
+            if jump:
+                endsWithJump = True
+                if knownA is not None:
+                    lines.append(f"    a = {knownA}")
+                lines.append(f"    if {JUMP_CONDITIONS[jump]}:")
+                lines.append(f"        return {memory}, a, d")
+                break
+
+        if knownA is not None and not endsWithJump:
+            lines.append(f"    a = {knownA}")
+        lines.append(f"    return {address}, a, d")
+
+        # "(END) @END 0;JMP" makes a block that only jumps to itself
+        halts = (address - start == 2 and opcodes[start] == A_LOAD and operands[start] == start
+                 and opcodes[start + 1] != A_LOAD and operands[start + 1] & JUMP_ALWAYS == JUMP_ALWAYS)
+
+        namespace = {"alu": ALU}
+        exec("\n".join(lines), namespace)
+        return namespace[f"block_{start}"], address - start, halts
+
+
+class HackEmulator:
+    '''Simulates the Hack computer running a program loaded into its ROM'''
+
+    def __init__(self, program, compileBlocks=False):
+        '''Loads the program (a sequence of 16-bit words) into the ROM and resets the computer.
+           With compileBlocks, the program runs as compiled basic blocks instead of instruction by instruction'''
+        self.opcodes, self.operands = predecode(program)
+        self.memory = HackMemory.HackMemory()
+        self.ram = self.memory.ram
+        self.blockCompiler = BlockCompiler(self.opcodes, self.operands) if compileBlocks else None
+        self.reset()
+
+    def reset(self):
+        '''Resets the registers and the program counter (the RAM keeps its contents, as in the hardware)'''
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+
+    def run(self, maxCycles):
+        '''Executes up to maxCycles instructions, or until the program halts in an "(END) @END 0;JMP" loop
+           or runs past the end of the ROM. Returns the number of instructions executed.
+           In the block mode, the last block may run a few instructions past maxCycles'''
+        if self.blockCompiler:
+            return self._runBlocks(maxCycles)
+        return self._runInstructions(maxCycles)
+
+    def _runBlocks(self, maxCycles):
+        '''Executes the program a compiled basic block at a time'''
+
+        blocks = self.blockCompiler.blocks
+        compileBlock = self.blockCompiler.block
+        ram = self.ram
+        dirtyWords = self.memory.dirtyWords
+        romSize = len(self.opcodes)
+        a, d, pc = self.a, self.d, self.pc
+        cycles = 0
+
+        while cycles < maxCycles:
+            entry = blocks.get(pc)
+            if entry is None:
+                if pc >= romSize:
+                    self.halted = True
+                    break
+                entry = compileBlock(pc)
+            function, length, halts = entry
+            pc, a, d = function(a, d, ram, dirtyWords)
+            cycles += length
+            if halts:
+                self.halted = True
+                break
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        return cycles
+
+    def _runInstructions(self, maxCycles):
+        '''Executes the program an instruction at a time'''
+
+        opcodes = self.opcodes
+        operands = self.operands
+        ram = self.ram
+        dirtyWords = self.memory.dirtyWords
+        alu = ALU
+        romSize = len(opcodes)
+        a, d, pc = self.a, self.d, self.pc
+        cycles = 0
+
+        while cycles < maxCycles:
+            if pc >= romSize:
+                self.halted = True
+                break
+            cycles += 1
+
+            opcode = opcodes[pc]
+            operand = operands[pc]
+
+            if opcode == A_LOAD:
+                a = operand
+                pc += 1
+                continue
+
+            if opcode > 64:     # the "a" bit is set, comp reads M
+                value = alu[opcode](d, ram[a & ADDRESS_MASK])
+            else:
+                value = alu[opcode](d, a)
+
+            target = a & ADDRESS_MASK   # M and the jump address refer to A before this instruction changes it
+            if operand & DEST_M:
+                ram[target] = value
+                if SCREEN <= target < KBD:
+                    dirtyWords.add(target - SCREEN)
+            if operand & DEST_A:
+                a = value
+            if operand & DEST_D:
+                d = value
+
+            jump = operand & JUMP_ALWAYS
+            if jump and (jump == JUMP_ALWAYS
+                         or (value < 0 and jump & JUMP_LT)
+                         or (value == 0 and jump & JUMP_EQ)
+                         or (value > 0 and jump & JUMP_GT)):
+                if target == pc - 1 and opcodes[target] == A_LOAD and operands[target] == target:
+                    self.halted = True      # "(END) @END 0;JMP"
+                    pc = target
+                    break
+                pc = target
+            else:
+                pc += 1
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        return cycles
+
+
+def _ramAssignment(text):
+    '''Parses an ADDRESS=VALUE command line argument, where ADDRESS may be a number or R0-R15, SCREEN or KBD'''
+    address, _, value = text.partition("=")
+    names = {f"R{i}": i for i in range(16)}
+    names.update(SP=0, LCL=1, ARG=2, THIS=3, THAT=4, SCREEN=SCREEN, KBD=KBD)
+    return names[address] if address in names else int(address), int(value)
+
+
+def _ramRange(text):
+    '''Parses a FIRST-LAST (or a single ADDRESS) command line argument'''
+    first, _, last = text.partition("-")
+    return int(first), int(last or first)
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Runs a Hack program and reports the emulation speed")
+    argumentParser.add_argument("program", help="a .hack, .bin or .hackbin file")
+    argumentParser.add_argument("--cycles", type=int, default=10_000_000, help="maximum number of instructions to execute")
+    argumentParser.add_argument("--blocks", action="store_true", help="compile the program's basic blocks into Python functions")
+    argumentParser.add_argument("--set", type=_ramAssignment, action="append", default=[], metavar="ADDRESS=VALUE", help="initial RAM value, e.g. R0=6")
+    argumentParser.add_argument("--key", type=int, default=0, help="code of the key held down on the keyboard")
+    argumentParser.add_argument("--screenshot", metavar="PNG", help="file to save the screen to when done")
+    argumentParser.add_argument("--ram", type=_ramRange, action="append", default=[], metavar="FIRST-LAST", help="RAM range to print when done")
+    arguments = argumentParser.parse_args()
+
+    emulator = HackEmulator(HackBinary.readProgram(arguments.program), arguments.blocks)
+    for address, value in arguments.set:
+        emulator.memory.write(address, value)
+    emulator.memory.setKey(arguments.key)
+
+    start = time.perf_counter()
+    cycles = emulator.run(arguments.cycles)
+    elapsed = time.perf_counter() - start
+
+    print(f"{cycles} cycles in {elapsed:.3f} s ({cycles / elapsed if elapsed else 0:,.0f} cycles/s), "
+          f"{'halted' if emulator.halted else 'stopped'} at pc={emulator.pc}")
+    for first, last in arguments.ram:
+        for address in range(first, last + 1):
+            print(f"RAM[{address}] = {emulator.ram[address]}")
+    if arguments.screenshot:
+        HackMemory.ScreenFrame(emulator.memory).savePNG(arguments.screenshot)
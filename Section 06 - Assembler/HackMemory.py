@@ -0,0 +1,101 @@
+'''The data memory of the Hack computer: the RAM, the screen memory map and the keyboard register.
+   Writes to the screen are tracked by word, so a frame renderer only needs to redraw the words that changed'''
+
+import array
+import struct
+import zlib
+
+RAM_SIZE = 32768        # the whole 15-bit address space, of which the Hack platform uses 24577 words
+SCREEN = 16384
+KBD = 24576
+SCREEN_WORDS = KBD - SCREEN
+SCREEN_ROWS = 256
+SCREEN_COLUMNS = 512
+WORDS_PER_ROW = SCREEN_COLUMNS // 16
+
+
+class HackMemory:
+    '''Holds the RAM as a preallocated array of 16-bit words, and the set of screen words written since the last frame.
+       The emulator writes to ram directly and adds the offsets of the screen words it writes to dirtyWords'''
+
+    def __init__(self):
+        '''Creates a cleared memory'''
+        self.ram = array.array("h", bytes(2 * RAM_SIZE))
+        self.dirtyWords = set()     # offsets (0 - 8191) of the changed screen words
+
+    def write(self, address, value):
+        '''Writes a word, keeping track of screen changes. Used for writes from outside the emulator'''
+        self.ram[address] = value
+        if SCREEN <= address < KBD:
+            self.dirtyWords.add(address - SCREEN)
+
+    def setKey(self, keyCode):
+        '''Sets the code of the currently pressed key (0 for none) in the keyboard register'''
+        self.ram[KBD] = keyCode
+
+    def screen(self):
+        '''Returns a zero-copy view of the 8K screen words'''
+        return memoryview(self.ram)[SCREEN:KBD]
+
+    def takeDirtyWords(self):
+        '''Returns the offsets of the screen words written since the last call, and starts tracking anew'''
+        dirtyWords = set(self.dirtyWords)
+        self.dirtyWords.clear()     # the emulator holds on to this set
+        return dirtyWords
+
+    def dirtyRows(self):
+        '''Returns the sorted screen rows that have changed words'''
+        return sorted({offset // WORDS_PER_ROW for offset in self.dirtyWords})
+
+
+def _pixelBytes(bits):
+    '''Converts 8 screen bits (pixel 0 in the lowest bit, 1 is black) into a PNG byte (pixel 0 in the highest bit, 1 is white)'''
+    reversedBits = int(format(bits, "08b")[::-1], 2)
+    return reversedBits ^ 0xFF
+
+
+PIXEL_BYTES = bytes(_pixelBytes(bits) for bits in range(256))
+
+
+class ScreenFrame:
+    '''Keeps a 1-bit image of the screen, laid out as the rows of a PNG image, and updates it from the dirty screen words'''
+
+    def __init__(self, memory):
+        '''Creates the image of the given memory's screen, drawing it in full once'''
+        self.memory = memory
+        self.rowSize = 1 + SCREEN_COLUMNS // 8      # each PNG row starts with a filter type byte (0, none)
+        self.image = bytearray(self.rowSize * SCREEN_ROWS)
+        memory.takeDirtyWords()
+        self._draw(range(SCREEN_WORDS))
+
+    def update(self):
+        '''Redraws the screen words written since the last update. Returns the number of words redrawn'''
+        dirtyWords = self.memory.takeDirtyWords()
+        self._draw(dirtyWords)
+        return len(dirtyWords)
+
+    def _draw(self, offsets):
+        '''Copies the given screen words into the image'''
+        screen = self.memory.screen()
+        image = self.image
+        rowSize = self.rowSize
+        for offset in offsets:
+            word = screen[offset] & 0xFFFF
+            position = (offset // WORDS_PER_ROW) * rowSize + 1 + (offset % WORDS_PER_ROW) * 2
+            image[position] = PIXEL_BYTES[word & 0xFF]
+            image[position + 1] = PIXEL_BYTES[word >> 8]
+
+    def png(self):
+        '''Returns the current image as the contents of a PNG file'''
+        def chunk(chunkType, data):
+            return struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data))
+
+        header = struct.pack(">IIBBBBB", SCREEN_COLUMNS, SCREEN_ROWS, 1, 0, 0, 0, 0)   # 1-bit grayscale
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(self.image)))
+                + chunk(b"IEND", b""))
+
+    def savePNG(self, fileName):
+        '''Updates the image and writes it to a PNG file'''
+        self.update()
+        with open(fileName, "wb") as output:
+            output.write(self.png())
@@ -0,0 +1,239 @@
+'''Profiles a Hack program compiled from Jack: runs it in the emulator's block mode, counting the executions of each
+   ROM address, and samples the call stack of the VM functions by walking the saved frames.
+   Reports the exclusive and inclusive instruction counts of each function (the (Class.function) labels of the
+   VM translator's code), the stacks in the folded format of flame graphs, and, with a source map, the hottest Jack lines'''
+
+import os
+import sys
+import time
+import array
+import argparse
+import Parser
+import HackBinary
+import HackEmulator
+# SourceMap is shared by the sections: it is in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import SourceMap
+
+SAMPLE_INTERVAL = 1000      # the number of instructions between two samples of the call stack
+MAX_DEPTH = 1024            # the number of frames a stack walk stops at (the saved frames may be corrupt)
+BOOTSTRAP = "$$BOOT"        # the code before the first function: the bootstrap code of the VM translator
+LCL = 1
+RETURN_ADDRESS_OFFSET = 5   # a frame saves the return address at LCL-5 and the caller's LCL at LCL-4
+SAVED_LCL_OFFSET = 4
+
+
+def isFunctionLabel(label):
+    '''Tells whether a label starts a function: a VM function (Class.function, as CodeWriter.writeFunction writes it),
+       the code the translator shares between the functions ($$CALL and $$RETURN) or the end loop (END).
+       The other labels of the translator (Class.function$label, File$ret.0, $$BOOT$ret.0) are inside a function'''
+    if label.startswith("$$"):
+        return "$" not in label[2:]
+    return "$" not in label and ("." in label or label == "END")
+
+
+class HackProfiler:
+    '''Runs a program in the block mode of a HackEmulator and counts the entries of each block in a preallocated array.
+       A block always runs to its end, so the entries of the blocks give the exact number of executions of each address.
+       The stack of functions is sampled every sampleInterval instructions: the block that runs through a sample point
+       is charged with sampleInterval instructions (for each point it runs through), in the stack read at its start
+       from the frames the VM code saves in the RAM. A block is sampled in proportion to its length, and with an interval
+       of 1, every block is charged with its own instructions'''
+
+    def __init__(self, program, labels, sampleInterval=SAMPLE_INTERVAL):
+        '''Loads the program (a sequence of 16-bit words) into an emulator.
+           labels (a dictionary of the program's labels and their ROM addresses) tell the functions apart'''
+        self.emulator = HackEmulator.HackEmulator(program, compileBlocks=True)
+        self.sampleInterval = sampleInterval
+        romSize = len(self.emulator.opcodes)
+        self.entries = array.array("Q", bytes(8 * romSize))     # the number of times each block started at each address
+        self.stacks = {}            # a stack (a tuple of function names, from the outermost) --> the instructions sampled in it
+        self.nextSample = 0         # the emulator's cycles at the next sample point
+        self.previousPc = None      # the start of the last block that ran, whose function jumped to the shared code
+
+        # the function of each address, as an index in functionNames
+        self.functionNames = [BOOTSTRAP]
+        self.functionOf = array.array("H", bytes(2 * romSize))
+        starts = sorted((address, label) for label, address in labels.items() if isFunctionLabel(label) and address < romSize)
+        for index, (start, label) in enumerate(starts):
+            end = starts[index + 1][0] if index + 1 < len(starts) else romSize
+            if start == end:
+                continue        # another label at the same address
+            self.functionOf[start:end] = array.array("H", [len(self.functionNames)]) * (end - start)
+            self.functionNames.append(label)
+        # the code that the functions share ($$CALL and $$RETURN) runs in the frame of the function that jumped to it
+        self.sharedCode = {index for index, name in enumerate(self.functionNames) if name.startswith("$$") and name != BOOTSTRAP}
+
+    def run(self, maxCycles):
+        '''Executes up to maxCycles instructions, or until the program halts, as HackEmulator.run does in the block mode,
+           counting the blocks and sampling the stack. Returns the number of instructions executed'''
+
+        emulator = self.emulator
+        blocks = emulator.blockCompiler.blocks
+        compileBlock = emulator.blockCompiler.block
+        ram = emulator.ram
+        dirtyWords = emulator.memory.dirtyWords
+        entries = self.entries
+        romSize = len(emulator.opcodes)
+        a, d, pc = emulator.a, emulator.d, emulator.pc
+        previousPc = self.previousPc
+        sampleInterval = self.sampleInterval
+        cycles = 0
+        nextSample = self.nextSample - emulator.cycles      # in the cycles of this run
+
+        while cycles < maxCycles:
+            entry = blocks.get(pc)
+            if entry is None:
+                if pc >= romSize:
+                    emulator.halted = True
+                    break
+                entry = compileBlock(pc)
+            function, length, halts = entry
+            if cycles + length > nextSample:        # the block runs through the next sample point
+                samples = (cycles + length - nextSample - 1) // sampleInterval + 1
+                self._sample(pc, previousPc, samples * sampleInterval)
+                nextSample += samples * sampleInterval
+            entries[pc] += 1
+            previousPc = pc
+            pc, a, d = function(a, d, ram, dirtyWords)
+            cycles += length
+            if halts:
+                emulator.halted = True
+                break
+
+        self.nextSample = emulator.cycles + nextSample
+        emulator.a, emulator.d, emulator.pc = a, d, pc
+        emulator.cycles += cycles
+        self.previousPc = previousPc
+        return cycles
+
+    def stack(self, pc, previousPc=None):
+        '''Returns the names of the functions on the stack when the program is at the start of the block at the given
+           address, from the outermost. The current function is pc's, and each frame (from the one LCL points to) holds
+           the return address into its caller and the caller's LCL. The caller is the function of the call's jump, right
+           before the return address (which may be the first address of the next function). The walk ends at the
+           bootstrap code, which called the first function.
+           In the shared code of calls and returns, LCL is still the frame of the function that jumped there, which is
+           the function of the block before (previousPc), so that function is on the stack under the shared code'''
+        ram = self.emulator.ram
+        functionOf = self.functionOf
+        names = self.functionNames
+        stack = [names[functionOf[pc]]] if pc < len(functionOf) else [BOOTSTRAP]
+        if (pc < len(functionOf) and functionOf[pc] in self.sharedCode and previousPc is not None
+                and functionOf[previousPc] not in self.sharedCode):
+            stack.append(names[functionOf[previousPc]])
+        frame = ram[LCL]
+        for _ in range(MAX_DEPTH):
+            if frame < RETURN_ADDRESS_OFFSET:
+                break
+            callAddress = (ram[frame - RETURN_ADDRESS_OFFSET] & HackEmulator.ADDRESS_MASK) - 1
+            if not 0 <= callAddress < len(functionOf) or functionOf[callAddress] == 0:
+                break
+            stack.append(names[functionOf[callAddress]])
+            frame = ram[frame - SAVED_LCL_OFFSET]
+        stack.reverse()
+        return tuple(stack)
+
+    def _sample(self, pc, previousPc, weight):
+        '''Adds weight instructions to the stack at the start of the block at the given address, after the block at previousPc'''
+        stack = self.stack(pc, previousPc)
+        self.stacks[stack] = self.stacks.get(stack, 0) + weight
+
+    def counts(self):
+        '''Returns the number of executions of each ROM address, in an array'''
+        counts = array.array("Q", bytes(8 * len(self.entries)))
+        blocks = self.emulator.blockCompiler.blocks
+        for start, entries in enumerate(self.entries):
+            if entries:
+                for address in range(start, start + blocks[start][1]):
+                    counts[address] += entries
+        return counts
+
+    def functions(self, counts=None):
+        '''Returns a dictionary of the functions and their (exclusive, inclusive) instruction counts. The exclusive counts
+           (the instructions of the function itself) are exact, and the inclusive counts (with the functions it called)
+           are estimated from the samples'''
+        counts = self.counts() if counts is None else counts
+        exclusive = [0] * len(self.functionNames)
+        functionOf = self.functionOf
+        for address, count in enumerate(counts):
+            if count:
+                exclusive[functionOf[address]] += count
+        inclusive = {}
+        for stack, weight in self.stacks.items():
+            for name in set(stack):
+                inclusive[name] = inclusive.get(name, 0) + weight
+        return {name: (exclusive[index], inclusive.get(name, 0))
+                for index, name in enumerate(self.functionNames) if exclusive[index] or name in inclusive}
+
+    def folded(self):
+        '''Returns the sampled stacks in the folded format of flame graphs: a line of "outer;...;inner instructions" per stack'''
+        return "".join(f"{';'.join(stack)} {weight}\n" for stack, weight in sorted(self.stacks.items()))
+
+    def lines(self, sourceMap, counts=None):
+        '''Returns a dictionary of the Origins of the source map (Jack lines, for a composed map) and their instruction counts'''
+        counts = self.counts() if counts is None else counts
+        lines = {}
+        for address, count in enumerate(counts):
+            if count:
+                origin = sourceMap.lookup(address)
+                if origin is not None:
+                    lines[origin] = lines.get(origin, 0) + count
+        return lines
+
+
+def readLabels(fileName):
+    '''Returns the labels of an assembly program and their ROM addresses'''
+    with open(fileName, "r") as input:
+        return Parser.parseProgram(input.read().splitlines())[1]
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Runs a Hack program compiled from Jack, and reports the instructions spent in each function")
+    argumentParser.add_argument("program", help="a .hack, .bin or .hackbin file")
+    argumentParser.add_argument("--asm", help="the program's .asm file, for its function labels (default: the program's name with .asm)")
+    argumentParser.add_argument("--map", help=f"a source map of the program (Prog{SourceMap.EXTENSION}), to report the hottest Jack lines")
+    argumentParser.add_argument("--cycles", type=int, default=10_000_000, help="maximum number of instructions to execute")
+    argumentParser.add_argument("--interval", type=int, default=SAMPLE_INTERVAL,
+                                help=f"instructions between two samples of the stack (default: {SAMPLE_INTERVAL}; 1 samples every block)")
+    argumentParser.add_argument("--set", type=HackEmulator._ramAssignment, action="append", default=[], metavar="ADDRESS=VALUE", help="initial RAM value, e.g. R0=6")
+    argumentParser.add_argument("--key", type=int, default=0, help="code of the key held down on the keyboard")
+    argumentParser.add_argument("--top", type=int, default=20, help="number of functions and lines to report (default: 20)")
+    argumentParser.add_argument("--folded", metavar="FILE", help="write the sampled stacks in the folded format of flame graphs to this file")
+    arguments = argumentParser.parse_args()
+
+    try:
+        labels = readLabels(arguments.asm or arguments.program.rpartition(".")[0] + ".asm")
+        sourceMap = SourceMap.resolve(arguments.map) if arguments.map else None
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+
+    profiler = HackProfiler(HackBinary.readProgram(arguments.program), labels, arguments.interval)
+    for address, value in arguments.set:
+        profiler.emulator.memory.write(address, value)
+    profiler.emulator.memory.setKey(arguments.key)
+
+    start = time.perf_counter()
+    cycles = profiler.run(arguments.cycles)
+    elapsed = time.perf_counter() - start
+    print(f"{cycles} cycles in {elapsed:.3f} s ({cycles / elapsed if elapsed else 0:,.0f} cycles/s), "
+          f"{'halted' if profiler.emulator.halted else 'stopped'} at pc={profiler.emulator.pc}")
+
+    counts = profiler.counts()
+    total = sum(counts) or 1
+    functions = profiler.functions(counts)
+    print(f"\n{'exclusive':>14} {'':>6} {'inclusive':>14} {'':>6}  function")
+    for name, (exclusive, inclusive) in sorted(functions.items(), key=lambda item: -item[1][0])[:arguments.top]:
+        print(f"{exclusive:14,} {exclusive / total:6.1%} {inclusive:14,} {inclusive / total:6.1%}  {name}")
+
+    if sourceMap is not None:
+        print(f"\n{'instructions':>14} {'':>6}  line")
+        for origin, count in sorted(profiler.lines(sourceMap, counts).items(), key=lambda item: -item[1])[:arguments.top]:
+            print(f"{count:14,} {count / total:6.1%}  {os.path.basename(origin.file)}:{origin.line} ({origin.symbol})")
+
+    if arguments.folded is not None:
+        with open(arguments.folded, "w") as output:
+            output.write(profiler.folded())
\ No newline at end of file
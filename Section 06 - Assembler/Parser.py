@@ -1,3 +1,60 @@
+import os
+import sys
+# SourceMap is shared by the sections: it is in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import SourceMap
+
+A_INSTRUCTION = "A_INSTRUCTION"
+C_INSTRUCTION = "C_INSTRUCTION"
+L_INSTRUCTION = "L_INSTRUCTION"
+
+
+def parseProgram(lines):
+    '''Parses a complete assembly program in a single pass over its lines.
+       Returns a compact list of (instructionType, text) pairs - the symbol or decimal of each A-instruction,
+       or the whole C-instruction - and a dictionary of the program's labels and their ROM addresses'''
+
+    instructions = []
+    labels = {}
+
+    for line in lines:
+        command = line.partition("//")[0].strip()   # remove comments and surrounding whitespaces
+        if not command:     # a comment or an empty line
+            continue
+        if " " in command or "\t" in command:
+            command = ''.join(command.split())      # remove inner whitespaces
+
+        if command[0] == '@':
+            instructions.append((A_INSTRUCTION, command[1:]))
+        elif command[0] == '(':
+            labels[command[1:-1]] = len(instructions)   # the ROM address of the next instruction
+        else:
+            instructions.append((C_INSTRUCTION, command))
+
+    return instructions, labels
+
+
+def mapProgram(lines, fileName):
+    '''Returns the SourceMap of a program: the ROM address of each instruction, mapped to its line in the file
+       (named fileName in the map) and to the last label before it'''
+
+    sourceMap = SourceMap.SourceMap()
+    address = 0
+    label = ""
+    for lineNumber, line in enumerate(lines, 1):
+        command = line.partition("//")[0].strip()
+        if not command:
+            continue
+        if command[0] == '(':
+            label = ''.join(command.split())[1:-1]
+        else:
+            sourceMap.add(address, fileName, lineNumber, label)
+            address += 1
+    return sourceMap
+
+
 class Parser:
     '''Encapsulates access to the input code.
        Reads an assembly language command, parses it, and provides convenient
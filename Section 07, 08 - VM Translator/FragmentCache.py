@@ -0,0 +1,88 @@
+import os
+import sys
+import hashlib
+# SourceMap and ObjectStore are shared by the sections: they are in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import SourceMap
+import ObjectStore
+
+CACHE_DIRECTORY = ".vmcache"        # created in the directory of the translated files
+MAX_CACHE_BYTES = 32 * 1024 * 1024  # least recently used fragments are evicted past this size
+FRAGMENT = ".asm"                   # the extensions of the files of a cached fragment: its assembly code and its map
+FRAGMENT_MAP = ".asm" + SourceMap.EXTENSION
+
+# The modules whose code determines the translator's output and its source maps: a change in any of them invalidates
+# the whole cache. They are in this directory, but for SourceMap, which is given by its path
+TRANSLATOR_MODULES = ["VMTranslator.py", "PeepholeOptimizer.py", os.path.join(TOOLCHAIN_DIRECTORY, "SourceMap.py")]
+
+
+def translatorHash():
+    '''Returns a hash of the source code of the translator modules'''
+    return ObjectStore.hashFiles(os.path.dirname(os.path.abspath(__file__)), TRANSLATOR_MODULES)
+
+
+class FragmentCache:
+    '''An on-disk cache of the assembly code of .vm files (fragments). A fragment is stored under a hash of the file's
+       name and code, of the translation options and of the translator, so an unchanged file isn't translated again.
+       The manifest entry of a fragment holds the counts of the optimizer, for its report'''
+
+    def __init__(self, directory, maxBytes=MAX_CACHE_BYTES):
+        '''Opens (or creates) the cache of the given directory'''
+        self.translator = translatorHash()
+        self.objects = ObjectStore.ObjectStore(os.path.join(directory, CACHE_DIRECTORY), [FRAGMENT, FRAGMENT_MAP], maxBytes,
+                                               {"translator": self.translator})
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, inputFile, options=""):
+        '''Returns the cache key of the given .vm file, or None if it can't be read.
+           The file's name is a part of the key, since its static variables and labels are named after it.
+           options describes the translation options, the optimizer's rules (PeepholeOptimizer.signature()) included'''
+        try:
+            with open(inputFile, "rb") as input:
+                code = input.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(f"{self.translator}\n{options}\n{os.path.basename(inputFile)}\n".encode())
+        digest.update(code)
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''Returns the cached fragment of the given key, or None if it isn't in the cache'''
+        if key not in self.objects:
+            self.misses += 1
+            return None
+        try:
+            fragment = self.objects.read(key, FRAGMENT).decode()
+        except OSError:                                         # the object was deleted
+            self.misses += 1
+            return None
+        self.objects.touch(key)
+        self.hits += 1
+        return fragment
+
+    def getMap(self, key):
+        '''Returns the SourceMap of the cached fragment of the given key, or None if it was cached without one'''
+        try:
+            return SourceMap.SourceMap.fromBytes(self.objects.read(key, FRAGMENT_MAP), self.objects.fileName(key, FRAGMENT_MAP))
+        except (OSError, ValueError):
+            return None
+
+    def optimizerCounts(self, key):
+        '''Returns the counts of the optimizer (PeepholeOptimizer.counts()) stored with the fragment of the given key,
+           or None if it was stored without them'''
+        return self.objects.entries.get(key, {}).get("optimizer")
+
+    def put(self, key, fragment, sourceMap=None, optimizerCounts=None):
+        '''Stores the given fragment (and its SourceMap and the counts of the optimizer that optimized it, if given)
+           under the given key'''
+        files = {FRAGMENT: fragment.encode()}
+        if sourceMap is not None:
+            files[FRAGMENT_MAP] = sourceMap.toBytes()
+        self.objects.write(key, files, optimizer=optimizerCounts)
+
+    def save(self):
+        '''Evicts the least recently used fragments until the cache fits in its size, and writes the manifest'''
+        self.objects.save()
\ No newline at end of file
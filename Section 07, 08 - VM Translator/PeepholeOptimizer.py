@@ -0,0 +1,266 @@
+'''A peephole optimizer for the assembly code of the VM translator.
+   Each rule matches a short sequence of instructions at the end of the optimized code and replaces it
+   with a shorter equivalent one, so the code is optimized as it is written, and rules apply to the results of other rules.
+   A sequence never spans a label, since jumping into its middle would skip the replaced instructions'''
+
+
+class Rule:
+    '''A rewrite rule: a name, the number of lines it looks at, and a function that gets these lines
+       and returns their replacement, or None if it doesn't apply to them.
+       lastLines, if given, are the only last lines the rule can match, which saves trying it on the others'''
+
+    def __init__(self, name, size, rewrite, lastLines=None):
+        self.name = name
+        self.size = size
+        self.rewrite = rewrite
+        self.lastLines = lastLines
+
+
+def _isNumber(line):
+    '''Checks if the line is an A-instruction with a number'''
+    return line[0] == "@" and line[1:].isdigit()
+
+
+def _writesA(line):
+    '''Checks if the line is a C-instruction with A in its dest'''
+    return "=" in line and "A" in line.partition("=")[0]
+
+
+def _decrementAndLoad(lines):
+    # SP-- then A=SP  -->  both at once
+    if lines == ["@SP", "M=M-1", "A=M"]:
+        return ["@SP", "AM=M-1"]
+    return None
+
+
+def _pushD(lines):
+    # RAM[SP] <-- D, SP++  -->  SP++, RAM[SP-1] <-- D, leaving A=SP-1 (the top of the stack)
+    if lines == ["@SP", "A=M", "M=D", "@SP", "M=M+1"]:
+        return ["@SP", "M=M+1", "A=M-1", "M=D"]
+    return None
+
+
+PUSHED_D = ["@SP", "M=M+1", "A=M-1", "M=D"]     # the code of push D, after the "push D" rule
+
+
+def _readPushedValue(lines):
+    # after pushing D, A already points to the top of the stack, and D holds its value
+    if lines[4:] == ["@SP", "A=M-1", "D=M"] and lines[:4] == PUSHED_D:
+        return PUSHED_D
+    # push D then pop it into D: SP is left as it was
+    if lines[4:] == ["@SP", "AM=M-1", "D=M"] and lines[:4] == PUSHED_D:
+        return ["@SP", "A=M", "M=D"]
+    return None
+
+
+def _pushPopToAddress(lines):
+    # push D then pop it, and store it in an address that doesn't depend on D  -->  D is stored there (and above the stack, as before)
+    for storeSize in (2, 3, 4, 5):
+        start = len(lines) - 7 - storeSize
+        store = lines[start + 7:]
+        if (lines[start + 4:start + 7] == ["@SP", "AM=M-1", "D=M"] and lines[start:start + 4] == PUSHED_D
+                and store[0][0] == "@" and all(line.startswith("A=") for line in store[1:-1])):
+            return lines[:start] + ["@SP", "A=M", "M=D"] + store
+    return None
+
+
+# The end of the code of binary arithmetic commands after pushing D: the code of the next command never reads
+# A or D before setting them, so it only needs to apply the operator to the new top of the stack
+PUSHED_D_OPERATIONS = {("A=A-1", "M=D+M", "D=A+1", "@SP", "M=D"): "M=D+M",
+                       ("A=A-1", "M=M-D", "D=A+1", "@SP", "M=D"): "M=M-D",
+                       ("A=A-1", "M=D&M", "@SP", "M=M-1"): "M=D&M",
+                       ("A=A-1", "M=D|M", "@SP", "M=M-1"): "M=D|M"}
+
+
+def _operateOnPushedD(lines):
+    # push D, then add, sub, and or or  -->  the top of the stack is changed in place
+    for size in (4, 5):
+        operation = PUSHED_D_OPERATIONS.get(tuple(lines[-size:]))
+        if operation is not None and lines[-size - 4:-size] == PUSHED_D:
+            return lines[:-size - 4] + ["@SP", "A=M-1", operation]
+    return None
+
+
+POP_THROUGH_R13 = ["@R13", "M=D", "@SP", "AM=M-1", "D=M", "@R13", "A=M", "M=D"]     # R13 <-- D, pop into RAM[R13]
+SEGMENT_POINTERS = ("@LCL", "@ARG", "@THIS", "@THAT")
+INDEX_ADDITIONS = (["D=M", "@1", "D=D+A"], ["D=M", "@2", "D=D+A"])
+
+
+def _popToSegment(lines):
+    # R13 <-- RAM[X]+i, pop into RAM[R13], for i < 3  -->  pop into RAM[RAM[X]+i], A is incremented i times
+    # (X is a segment's pointer: reading it after the pop would be wrong for SP, which the pop changes)
+    if lines[-8:] != POP_THROUGH_R13:
+        return None
+    if lines[-10] in SEGMENT_POINTERS and lines[-9] == "D=M":
+        return lines[:-10] + ["@SP", "AM=M-1", "D=M", lines[-10], "A=M", "M=D"]
+    if lines[-12] in SEGMENT_POINTERS and lines[-11:-8] in INDEX_ADDITIONS:
+        increments = ["A=M+1"] + ["A=A+1"] * (int(lines[-10][1:]) - 1)
+        return lines[:-12] + ["@SP", "AM=M-1", "D=M", lines[-12]] + increments + ["M=D"]
+    return None
+
+
+def _redundantLoad(lines):
+    # @X, an instruction that doesn't change A, @X  -->  the second @X is dropped
+    first, middle, second, last = lines
+    if first == second and first[0] == "@" and middle[0] not in "@(" and not _writesA(middle):
+        return [first, middle, last]
+    return None
+
+
+def _smallConstant(lines):
+    # D <-- 0 or 1 through A, when the next instruction loads A anyway  -->  D <-- 0 or 1 directly
+    if lines[1] == "D=A" and lines[0] in ("@0", "@1") and lines[2][0] == "@":
+        return ["D=" + lines[0][1], lines[2]]
+    return None
+
+
+def _constantAddress(lines):
+    # the address of temp i or pointer i is a constant: base+i is computed here, not at run time
+    base, loadBase, index, add, last = lines
+    if loadBase == "D=A" and _isNumber(base) and _isNumber(index):
+        address = f"@{int(base[1:]) + int(index[1:])}"
+        if add == "A=D+A" and last == "D=M":            # RAM[base+i] is read into D
+            return [address, "D=M"]
+        if add == "D=D+A" and last[0] == "@":           # base+i is stored, through D
+            return [address, "D=A", last]
+    return None
+
+
+def _popToConstantAddress(lines):
+    # R13 <-- address, pop into RAM[R13]  -->  pop into RAM[address]
+    if (_isNumber(lines[0]) and lines[1:] == ["D=A", "@R13", "M=D", "@SP", "AM=M-1", "D=M", "@R13", "A=M", "M=D"]):
+        return ["@SP", "AM=M-1", "D=M", lines[0], "M=D"]
+    return None
+
+
+def _smallIndex(lines):
+    # RAM[RAM[X]+0] or RAM[RAM[X]+1] is read into D  -->  the index is added in A
+    if lines[0] == "D=M" and lines[2] == "A=D+A" and lines[3] == "D=M" and lines[1] in ("@0", "@1"):
+        return ["A=M" if lines[1] == "@0" else "A=M+1", "D=M"]
+    return None
+
+
+def _addZero(lines):
+    # D <-- D+0, when the next instruction loads A anyway  -->  nothing
+    if lines[0] == "@0" and lines[1] == "D=D+A" and lines[2][0] == "@":
+        return [lines[2]]
+    return None
+
+
+# The rules, in the order they are tried. A rule comes before the rules that would spoil its pattern
+RULES = [
+    Rule("push D then read or pop the top of the stack", 7, _readPushedValue, {"D=M"}),
+    Rule("push D then pop", 12, _pushPopToAddress, {"M=D"}),
+    Rule("push D then add, sub, and or or", 9, _operateOnPushedD, {"M=D", "M=M-1"}),
+    Rule("redundant A load", 4, _redundantLoad),
+    Rule("SP-- then A=SP", 3, _decrementAndLoad, {"A=M"}),
+    Rule("push D", 5, _pushD, {"M=M+1"}),
+    Rule("constant 0 or 1", 3, _smallConstant),
+    Rule("constant temp or pointer address", 5, _constantAddress),
+    Rule("pop to a constant address", 10, _popToConstantAddress, {"M=D"}),
+    Rule("pop to segment index 0, 1 or 2", 12, _popToSegment, {"M=D"}),
+    Rule("segment index 0 or 1", 4, _smallIndex, {"D=M"}),
+    Rule("add 0", 3, _addZero),
+]
+
+
+class PeepholeOptimizer:
+    '''Optimizes assembly code that is given to it in parts, one line per instruction or label.
+       The last lines of each part are held back, so a sequence that spans two parts is still matched'''
+
+    def __init__(self, rules=None):
+        '''Creates an optimizer with the given rules (default: RULES)'''
+        self.rules = RULES if rules is None else rules
+        self.window = 2 * max((rule.size for rule in self.rules), default=1)
+        self.lines = []                                     # optimized lines that weren't returned yet
+        self.origins = []                                   # the number of the input line that each of them comes from
+        self.returnedOrigins = []                           # the origins of the lines that feed or finish returned last
+        self.hits = {rule.name: 0 for rule in self.rules}   # number of times each rule was applied
+        self.linesIn = 0
+        self.linesOut = 0
+
+    def _add(self, line, origin):
+        '''Adds a line to the optimized code and applies the rules to its end, again after every rewrite.
+           The lines that replace a sequence come from the origin of its first line'''
+        lines = self.lines
+        origins = self.origins
+        lines.append(line)
+        origins.append(origin)
+        rules = self.rules
+        hits = self.hits
+        rewritten = True
+        while rewritten:
+            rewritten = False
+            last = lines[-1]
+            if last[0] == "(":      # a label ends every sequence, and starts none that ends with it
+                return
+            for rule in rules:
+                if rule.lastLines is not None and last not in rule.lastLines:
+                    continue
+                size = rule.size
+                if len(lines) < size:
+                    continue
+                tail = lines[-size:]
+                if any(line[0] == "(" for line in tail[:-1]):
+                    continue
+                replacement = rule.rewrite(tail)
+                if replacement is not None:
+                    lines[-size:] = replacement
+                    origins[-size:] = [origins[-size]] * len(replacement)
+                    hits[rule.name] += 1
+                    rewritten = bool(lines)
+                    break
+
+    def feed(self, lines):
+        '''Optimizes the given lines, and returns the optimized lines that no rule can change anymore.
+           The input lines are numbered from 0 in the order they are fed, and returnedOrigins tells where the returned ones come from'''
+        for origin, line in enumerate(lines, self.linesIn):
+            self._add(line, origin)
+        self.linesIn += len(lines)
+        done = self.lines[:-self.window]
+        del self.lines[:-self.window]
+        self.returnedOrigins = self.origins[:len(done)]
+        del self.origins[:len(done)]
+        self.linesOut += len(done)
+        return done
+
+    def finish(self):
+        '''Returns the rest of the optimized lines'''
+        done = self.lines
+        self.lines = []
+        self.returnedOrigins = self.origins
+        self.origins = []
+        self.linesOut += len(done)
+        return done
+
+    def copy(self):
+        '''Returns a new optimizer with the same rules, and no code or counts yet'''
+        return PeepholeOptimizer(self.rules)
+
+    def signature(self):
+        '''Returns a description of the rules (their names, sizes and rewrite functions), which tells cached code
+           optimized with other rules apart'''
+        return ";".join(f"{rule.name}:{rule.size}:{rule.rewrite.__module__}.{rule.rewrite.__qualname__}" for rule in self.rules)
+
+    def counts(self):
+        '''Returns the hits of the rules and the numbers of lines in and out, in a dictionary that can be stored as JSON'''
+        return {"hits": dict(self.hits), "linesIn": self.linesIn, "linesOut": self.linesOut}
+
+    def mergeCounts(self, counts):
+        '''Adds the counts of code optimized with the same rules (as counts returned them) to this optimizer's'''
+        for name, hits in counts["hits"].items():
+            self.hits[name] = self.hits.get(name, 0) + hits
+        self.linesIn += counts["linesIn"]
+        self.linesOut += counts["linesOut"]
+
+    def merge(self, other):
+        '''Adds the counts of another optimizer with the same rules (which optimized other code) to this one's'''
+        self.mergeCounts(other.counts())
+
+    def report(self):
+        '''Returns the lines of a report of the rules' hits and the number of lines before and after the optimization'''
+        report = [f"{hits:8} {name}" for name, hits in self.hits.items()]
+        saved = self.linesIn - self.linesOut
+        report.append(f"{self.linesIn} lines --> {self.linesOut} lines "
+                      f"({saved / self.linesIn if self.linesIn else 0:.1%} removed)")
+        return report
\ No newline at end of file
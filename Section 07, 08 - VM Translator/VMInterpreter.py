@@ -0,0 +1,343 @@
+'''Executes VM programs (a .vm file or a directory of .vm files) without translating them to Hack assembly.
+   The commands are parsed once into integer bytecode, with segments, labels and functions resolved
+   to addresses, and run on a RAM that follows the standard VM mapping (stack from 256, frames on the stack).
+   Math.multiply and Math.divide are executed natively'''
+
+import sys
+import os
+import time
+import argparse
+import VMTranslator
+
+RAM_SIZE = 32768
+SP = 0
+LCL = 1
+ARG = 2
+THIS = 3
+THAT = 4
+POINTER_BASE = 3
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+
+# Opcodes, ordered by how often they usually run
+PUSH_CONSTANT = 0
+PUSH_LOCAL = 1
+PUSH_ARGUMENT = 2
+PUSH_RAM = 3        # static, temp and pointer, whose addresses are known when loading
+POP_LOCAL = 4
+POP_RAM = 5
+PUSH_THIS = 6
+PUSH_THAT = 7
+POP_THIS = 8
+POP_THAT = 9
+POP_ARGUMENT = 10
+ADD = 11
+SUB = 12
+IF_GOTO = 13
+GOTO = 14
+NOT = 15
+NEG = 16
+EQ = 17
+GT = 18
+LT = 19
+AND = 20
+OR = 21
+CALL = 22
+FUNCTION = 23
+RETURN = 24
+MULTIPLY = 25       # native Math.multiply
+DIVIDE = 26         # native Math.divide
+CALL_UNDEFINED = 27
+
+ARITHMETIC_OPCODES = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT, "lt": LT, "and": AND, "or": OR, "not": NOT}
+PUSH_OPCODES = {"local": PUSH_LOCAL, "argument": PUSH_ARGUMENT, "this": PUSH_THIS, "that": PUSH_THAT}
+POP_OPCODES = {"local": POP_LOCAL, "argument": POP_ARGUMENT, "this": POP_THIS, "that": POP_THAT}
+NATIVE_FUNCTIONS = {("Math.multiply", 2): MULTIPLY, ("Math.divide", 2): DIVIDE}
+
+RETURN_TO_HOST = -1     # the return address of the entry function
+
+
+class VMProgram:
+    '''Loads the .vm files of a program and encodes their commands as bytecode:
+       a list of opcodes and a parallel list of arguments'''
+
+    def __init__(self, inputPath):
+        '''Parses the given .vm file, or all the .vm files in the given directory'''
+        if os.path.isdir(inputPath):
+            files = [os.path.join(inputPath, file) for file in sorted(os.listdir(inputPath)) if file.endswith(".vm")]
+        else:
+            files = [inputPath]
+
+        self.opcodes = []
+        self.arguments = []
+        self.functions = {}     # function name --> address of its function command
+        self.callSites = []     # (called function name, nArgs) of each CALL
+        self.names = []         # function name of each command, for error messages
+
+        labels = {}             # (function name, label) --> address
+        jumps = []              # (address, function name, label) of each goto and if-goto
+        nextStatic = STATIC_BASE
+
+        for file in files:
+            staticCount = 0
+            functionName = os.path.basename(file).rpartition(".")[0]    # commands before the first function
+
+            for commandType, arg1, arg2 in VMTranslator.Parser(file).commands():
+                address = len(self.opcodes)
+
+                if commandType == VMTranslator.C_ARITHMETIC:
+                    self._emit(ARITHMETIC_OPCODES[arg1], 0, functionName)
+
+                elif commandType == VMTranslator.C_PUSH or commandType == VMTranslator.C_POP:
+                    index = arg2
+                    if arg1 == "constant":
+                        self._emit(PUSH_CONSTANT, index, functionName)
+                        continue
+                    if arg1 == "static":
+                        ramAddress = nextStatic + index
+                        staticCount = max(staticCount, index + 1)
+                    elif arg1 == "temp":
+                        ramAddress = TEMP_BASE + index
+                    elif arg1 == "pointer":
+                        ramAddress = POINTER_BASE + index
+                    else:
+                        opcodes = PUSH_OPCODES if commandType == VMTranslator.C_PUSH else POP_OPCODES
+                        self._emit(opcodes[arg1], index, functionName)
+                        continue
+                    self._emit(PUSH_RAM if commandType == VMTranslator.C_PUSH else POP_RAM, ramAddress, functionName)
+
+                elif commandType == VMTranslator.C_LABEL:
+                    labels[(functionName, arg1)] = address
+
+                elif commandType == VMTranslator.C_GOTO or commandType == VMTranslator.C_IF:
+                    jumps.append((address, functionName, arg1))
+                    self._emit(GOTO if commandType == VMTranslator.C_GOTO else IF_GOTO, 0, functionName)
+
+                elif commandType == VMTranslator.C_FUNCTION:
+                    functionName = arg1
+                    self.functions[functionName] = address
+                    self._emit(FUNCTION, arg2, functionName)
+
+                elif commandType == VMTranslator.C_RETURN:
+                    self._emit(RETURN, 0, functionName)
+
+                elif commandType == VMTranslator.C_CALL:
+                    nArgs = arg2
+                    native = NATIVE_FUNCTIONS.get((arg1, nArgs))
+                    if native is not None:
+                        self._emit(native, 0, functionName)
+                    else:
+                        self._emit(CALL, len(self.callSites), functionName)
+                        self.callSites.append((arg1, nArgs))
+
+            nextStatic += staticCount
+
+        # Resolve the labels and the called functions into addresses
+        for address, functionName, label in jumps:
+            if (functionName, label) not in labels:
+                raise ValueError(f"{functionName}: goto to an undefined label {label}")
+            self.arguments[address] = labels[(functionName, label)]
+        for address, opcode in enumerate(self.opcodes):
+            if opcode == CALL and self.callSites[self.arguments[address]][0] not in self.functions:
+                self.opcodes[address] = CALL_UNDEFINED      # fails only if it is executed
+
+    def _emit(self, opcode, argument, functionName):
+        '''Appends an instruction to the bytecode'''
+        self.opcodes.append(opcode)
+        self.arguments.append(argument)
+        self.names.append(functionName)
+
+
+class VMInterpreter:
+    '''Runs a loaded VMProgram'''
+
+    def __init__(self, program, entry=None):
+        '''Prepares the RAM and the stack. The program starts by calling the entry function (by default Sys.init,
+           or Main.main if there is no Sys.init), or, if the program has neither, at its first command'''
+        self.program = program
+        self.ram = [0] * RAM_SIZE
+        self.ram[SP] = STACK_BASE
+        self.halted = False
+        self.returned = False   # halted by returning from the entry function
+        self.steps = 0
+        self.pc = 0
+
+        if entry is None:
+            entry = "Sys.init" if "Sys.init" in program.functions else "Main.main" if "Main.main" in program.functions else None
+        if entry is not None:
+            if entry not in program.functions:
+                raise ValueError(f"the program has no function {entry}")
+            self._callEntry(program.functions[entry])
+
+    def _callEntry(self, address):
+        '''Calls the entry function with no arguments, as the bootstrap code does'''
+        ram = self.ram
+        sp = ram[SP]
+        ram[sp:sp + 5] = [RETURN_TO_HOST, ram[LCL], ram[ARG], ram[THIS], ram[THAT]]
+        ram[ARG] = sp
+        ram[LCL] = sp + 5
+        ram[SP] = sp + 5
+        self.pc = address
+
+    def returnValue(self):
+        '''Returns the value that the entry function returned (the top of the stack)'''
+        return self.ram[self.ram[SP] - 1]
+
+    def run(self, maxSteps):
+        '''Executes up to maxSteps VM commands, or until the program halts: returns from the entry function,
+           or loops on a goto to itself (as Sys.halt does). Returns the number of commands executed'''
+
+        opcodes = self.program.opcodes
+        arguments = self.program.arguments
+        callSites = self.program.callSites
+        functions = self.program.functions
+        ram = self.ram
+        sp, lcl, arg = ram[SP], ram[LCL], ram[ARG]
+        pc = self.pc
+        steps = 0
+        end = len(opcodes)
+
+        while steps < maxSteps:
+            if pc >= end:
+                self.halted = True
+                break
+            opcode = opcodes[pc]
+            argument = arguments[pc]
+            pc += 1
+            steps += 1
+
+            if opcode == PUSH_CONSTANT:
+                ram[sp] = argument
+                sp += 1
+            elif opcode == PUSH_LOCAL:
+                ram[sp] = ram[lcl + argument]
+                sp += 1
+            elif opcode == PUSH_ARGUMENT:
+                ram[sp] = ram[arg + argument]
+                sp += 1
+            elif opcode == PUSH_RAM:
+                ram[sp] = ram[argument]
+                sp += 1
+            elif opcode == POP_LOCAL:
+                sp -= 1
+                ram[lcl + argument] = ram[sp]
+            elif opcode == POP_RAM:
+                sp -= 1
+                ram[argument] = ram[sp]
+            elif opcode == PUSH_THIS:
+                ram[sp] = ram[(ram[THIS] + argument) & 0x7FFF]
+                sp += 1
+            elif opcode == PUSH_THAT:
+                ram[sp] = ram[(ram[THAT] + argument) & 0x7FFF]
+                sp += 1
+            elif opcode == POP_THIS:
+                sp -= 1
+                ram[(ram[THIS] + argument) & 0x7FFF] = ram[sp]
+            elif opcode == POP_THAT:
+                sp -= 1
+                ram[(ram[THAT] + argument) & 0x7FFF] = ram[sp]
+            elif opcode == POP_ARGUMENT:
+                sp -= 1
+                ram[arg + argument] = ram[sp]
+            elif opcode == ADD:
+                sp -= 1
+                ram[sp - 1] = ((ram[sp - 1] + ram[sp] + 32768) & 0xFFFF) - 32768
+            elif opcode == SUB:
+                sp -= 1
+                ram[sp - 1] = ((ram[sp - 1] - ram[sp] + 32768) & 0xFFFF) - 32768
+            elif opcode == IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = argument
+            elif opcode == GOTO:
+                if argument == pc - 1:      # an endless loop, as in Sys.halt
+                    pc = argument
+                    self.halted = True
+                    break
+                pc = argument
+            elif opcode == NOT:
+                ram[sp - 1] = ~ram[sp - 1]
+            elif opcode == NEG:
+                ram[sp - 1] = ((32768 - ram[sp - 1]) & 0xFFFF) - 32768
+            elif opcode == EQ:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+            elif opcode == GT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+            elif opcode == LT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+            elif opcode == AND:
+                sp -= 1
+                ram[sp - 1] = ram[sp - 1] & ram[sp]
+            elif opcode == OR:
+                sp -= 1
+                ram[sp - 1] = ram[sp - 1] | ram[sp]
+            elif opcode == CALL:
+                functionName, nArgs = callSites[argument]
+                ram[sp:sp + 5] = [pc, lcl, arg, ram[THIS], ram[THAT]]
+                arg = sp - nArgs
+                sp += 5
+                lcl = sp
+                pc = functions[functionName]
+            elif opcode == FUNCTION:
+                ram[sp:sp + argument] = [0] * argument
+                sp += argument
+            elif opcode == RETURN:
+                frame = lcl
+                returnAddress = ram[frame - 5]
+                ram[arg] = ram[sp - 1]
+                sp = arg + 1
+                ram[THAT] = ram[frame - 1]
+                ram[THIS] = ram[frame - 2]
+                arg = ram[frame - 3]
+                lcl = ram[frame - 4]
+                if returnAddress == RETURN_TO_HOST:
+                    self.halted = self.returned = True
+                    break
+                pc = returnAddress
+            elif opcode == MULTIPLY:
+                sp -= 1
+                ram[sp - 1] = ((ram[sp - 1] * ram[sp] + 32768) & 0xFFFF) - 32768
+            elif opcode == DIVIDE:
+                sp -= 1
+                if ram[sp] == 0:
+                    raise ZeroDivisionError(f"{self.program.names[pc - 1]}: Math.divide by zero")
+                quotient = abs(ram[sp - 1]) // abs(ram[sp])     # rounds toward zero, as the OS does
+                if (ram[sp - 1] < 0) != (ram[sp] < 0):
+                    quotient = -quotient
+                ram[sp - 1] = ((quotient + 32768) & 0xFFFF) - 32768
+            else:   # CALL_UNDEFINED
+                raise RuntimeError(f"{self.program.names[pc - 1]}: call to an undefined function {callSites[argument][0]}")
+
+        ram[SP], ram[LCL], ram[ARG] = sp, lcl, arg
+        self.pc = pc
+        self.steps += steps
+        return steps
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Runs a VM program and reports the execution speed")
+    argumentParser.add_argument("inputPath", help="a .vm file or a directory of .vm files")
+    argumentParser.add_argument("--steps", type=int, default=10_000_000, help="maximum number of VM commands to execute")
+    argumentParser.add_argument("--entry", help="function to start with (default: Sys.init, or Main.main)")
+    argumentParser.add_argument("--ram", action="append", default=[], metavar="FIRST-LAST", help="RAM range to print when done")
+    arguments = argumentParser.parse_args()
+
+    interpreter = VMInterpreter(VMProgram(arguments.inputPath), arguments.entry)
+
+    start = time.perf_counter()
+    steps = interpreter.run(arguments.steps)
+    elapsed = time.perf_counter() - start
+
+    print(f"{steps} commands in {elapsed:.3f} s ({steps / elapsed if elapsed else 0:,.0f} commands/s), "
+          f"{'halted' if interpreter.halted else 'stopped'}")
+    if interpreter.returned:
+        print(f"returned {interpreter.returnValue()}")
+    for ramRange in arguments.ram:
+        first, _, last = ramRange.partition("-")
+        for address in range(int(first), int(last or first) + 1):
+            print(f"RAM[{address}] = {interpreter.ram[address]}")
@@ -1,597 +1,964 @@
 import sys
 import os
+import time
+import argparse
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import PeepholeOptimizer
+import FragmentCache
+# Instrumentation and SourceMap are shared by the sections: they are in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import Instrumentation
+import SourceMap
+from collections import namedtuple
+
+C_ARITHMETIC = "C_ARITHMETIC"
+C_PUSH = "C_PUSH"
+C_POP = "C_POP"
+C_LABEL = "C_LABEL"
+C_GOTO = "C_GOTO"
+C_IF = "C_IF"
+C_FUNCTION = "C_FUNCTION"
+C_RETURN = "C_RETURN"
+C_CALL = "C_CALL"
+
+COMMAND_TYPES = {"push": C_PUSH, "pop": C_POP, "label": C_LABEL, "goto": C_GOTO, "if-goto": C_IF,
+                 "function": C_FUNCTION, "return": C_RETURN, "call": C_CALL}
+ARITHMETIC_COMMANDS = {"add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"}
+
+# A parsed VM command: its type, its first argument (the command itself for C_ARITHMETIC)
+# and its second argument as an int (None for commands without one)
+VMCommand = namedtuple("VMCommand", ["commandType", "arg1", "arg2"])
+
 
 class Parser:
     '''Handles the parsing of a single .vm file, and encapsulates access to the input code.
-       It reads VM commands, parses them, and provides convenient access to their components.
+       Each line is split once into an immutable VMCommand, classified by its first word.
        In addition, it removes all white space and comments.'''
 
     file = ""               # .vm file to process
-    currentCommand = ""     # current line of the file
-
-    def __init__(self, fileName):
-        '''Opens the input file'''
-        self.file = open(fileName, "r")
-        self.currentCommand = ""
+    currentCommand = None   # current VMCommand
+    lineNumber = 0          # line of the current command in the file
+
+    def __init__(self, fileName, lines=None):
+        '''Opens the input file, or parses the given lines of VM code (fileName only names them then)'''
+        self.file = open(fileName, "r") if lines is None else None
+        self.lines = lines
+        self.fileName = fileName
+        self.currentCommand = None
+        self.lineNumber = 0
+        self.parsedLines = {}       # line text --> VMCommand, as programs repeat the same commands many times
+        self._remaining = self.commands()
+        self._next = None
+
+    def commands(self):
+        '''Generates the VMCommand of each command in the file, and closes it at its end'''
+        parsedLines = self.parsedLines
+        for lineNumber, line in enumerate(self.file if self.lines is None else self.lines, 1):
+            command = parsedLines.get(line)
+            if command is None:
+                command = parsedLines[line] = self._parse(line, lineNumber)
+            if command:
+                self.lineNumber = lineNumber
+                yield command
+        if self.file is not None:
+            self.file.close()
+
+    def _parse(self, line, lineNumber):
+        '''Returns the VMCommand of the given line, or an empty tuple if it is a comment or an empty line'''
+        words = line.partition("//")[0].split()     # remove comments and whitespaces
+        if not words:
+            return ()
+
+        commandType = COMMAND_TYPES.get(words[0])
+        try:
+            if commandType is None:
+                if words[0] not in ARITHMETIC_COMMANDS:
+                    raise ValueError(f"unknown command {words[0]}")
+                return VMCommand(C_ARITHMETIC, words[0], None)
+            elif commandType == C_RETURN:
+                return VMCommand(C_RETURN, None, None)
+            elif commandType == C_PUSH or commandType == C_POP or commandType == C_FUNCTION or commandType == C_CALL:
+                return VMCommand(commandType, words[1], int(words[2]))
+            else:
+                return VMCommand(commandType, words[1], None)
+        except (ValueError, IndexError) as error:
+            raise ValueError(f"{self.fileName}:{lineNumber}: invalid VM command \"{line.strip()}\" ({error})")
 
     def hasMoreLines(self):
         '''Checks if there are more commands in the input'''
-        currentPos = self.file.tell()
-        hasNextLine = bool(self.file.readline())
-        self.file.seek(currentPos)
-        return hasNextLine
+        if self._next is None:
+            self._next = next(self._remaining, None)
+        return self._next is not None
 
     def advance(self):
         '''Reads the next command from the input (if exists) and makes it the current command'''
         if self.hasMoreLines():
-            self.currentCommand = self.file.readline()
+            self.currentCommand = self._next
+            self._next = None
 
     def commandType(self):
         '''Returns the type of the current VM command'''
-        self.currentCommand = self.currentCommand.partition("//")[0]    # remove comments
-        self.currentCommand = self.currentCommand.strip()               # remove whitespaces before and after the string
-        if not self.currentCommand:     # currentCommand is a comment or an empty line
-            return ""
-        elif "push" in self.currentCommand:
-            return "C_PUSH"
-        elif "pop" in self.currentCommand:
-            return "C_POP"
-        elif "label" in self.currentCommand:
-            return "C_LABEL"
-        elif "if-goto" in self.currentCommand:
-            return "C_IF"
-        elif "goto" in self.currentCommand:
-            return "C_GOTO"
-        elif "function" in self.currentCommand:
-            return "C_FUNCTION"
-        elif "return" in self.currentCommand:
-            return "C_RETURN"
-        elif "call" in self.currentCommand:
-            return "C_CALL"
-        else:
-            return "C_ARITHMETIC"
+        return self.currentCommand.commandType
 
     def arg1(self):
         '''Returns the first argument of the current command'''
-        if self.commandType() == "C_ARITHMETIC":    # return the command itself
-            return self.currentCommand.split()[0]
-        elif not self.commandType() == "C_RETURN":
-            return self.currentCommand.split()[1]
+        return self.currentCommand.arg1
 
     def arg2(self):
         '''Returns the second argument of the current command'''
-        if self.commandType() == "C_PUSH" or self.commandType() == "C_POP" or self.commandType() == "C_FUNCTION" or self.commandType() == "C_CALL":
-            return self.currentCommand.split()[2]
+        return self.currentCommand.arg2
+
+
+# Assembly code fragments, shared by all the commands that use them
+
+# RAM[SP] <-- D, SP++
+PUSH_D = ("@SP\n"
+          "A=M\n"
+          "M=D\n"
+          "@SP\n"
+          "M=M+1\n")
+
+# SP--, D <-- RAM[SP]
+POP_D = ("@SP\n"
+         "M=M-1\n"
+         "A=M\n"
+         "D=M\n")
+
+# R13 <-- D, SP--, RAM[R13] <-- RAM[SP]
+POP_TO_ADDRESS_IN_D = ("@R13\n"
+                       "M=D\n"
+                       "@SP\n"
+                       "M=M-1\n"
+                       "A=M\n"
+                       "D=M\n"
+                       "@R13\n"
+                       "A=M\n"
+                       "M=D\n")
+
+ARITHMETIC_CODE = {
+    # RAM[SP-2] <-- RAM[SP-1]+RAM[SP-2], SP--
+    "add": ("@SP\n"
+            "A=M-1\n"
+            "D=M\n"
+            "A=A-1\n"
+            "M=D+M\n"
+            "D=A+1\n"
+            "@SP\n"
+            "M=D\n"),
+    # RAM[SP-2] <-- RAM[SP-2]-RAM[SP-1], SP--
+    "sub": ("@SP\n"
+            "A=M-1\n"
+            "D=M\n"
+            "A=A-1\n"
+            "M=M-D\n"
+            "D=A+1\n"
+            "@SP\n"
+            "M=D\n"),
+    # RAM[SP-1] <-- -RAM[SP-1]
+    "neg": ("@SP\n"
+            "A=M-1\n"
+            "M=-M\n"),
+    # RAM[SP-2] <-- RAM[SP-1]&RAM[SP-2], SP--
+    "and": ("@SP\n"
+            "A=M-1\n"
+            "D=M\n"
+            "A=A-1\n"
+            "M=D&M\n"
+            "@SP\n"
+            "M=M-1\n"),
+    # RAM[SP-2] <-- RAM[SP-1]|RAM[SP-2], SP--
+    "or": ("@SP\n"
+           "A=M-1\n"
+           "D=M\n"
+           "A=A-1\n"
+           "M=D|M\n"
+           "@SP\n"
+           "M=M-1\n"),
+    # RAM[SP-1] <-- !RAM[SP-1]
+    "not": ("@SP\n"
+            "A=M-1\n"
+            "M=!M\n")
+}
+
+# SP--, D <-- the difference of the two top values, the result defaults to True (-1),
+# and is changed to False (0) unless the jump is taken
+COMPARISON_CODE = ("@SP\n"
+                   "AM=M-1\n"
+                   "D=M\n"
+                   "A=A-1\n"
+                   "D={difference}\n"
+                   "M=-1\n"
+                   "@{label}\n"
+                   "D;{jump}\n"
+                   "@SP\n"
+                   "A=M-1\n"
+                   "M=0\n"
+                   "({label})\n")
+COMPARISONS = {"eq": ("D-M", "EQ", "JEQ"), "gt": ("M-D", "GT", "JGT"), "lt": ("M-D", "LT", "JLT")}
+
+SEGMENT_SYMBOLS = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+BASE_ADDRESSES = {"temp": 5, "pointer": 3}
+
+# RAM[LCL+i] <-- 0, SP++
+INIT_LOCAL_CODE = ("@LCL\n"
+                   "D=M\n"
+                   "@{index}\n"
+                   "A=D+A\n"
+                   "M=0\n"
+                   "@SP\n"
+                   "M=M+1\n")
+
+# push LCL, ARG, THIS and THAT
+SAVE_FRAME_CODE = "".join(f"@{pointer}\nD=M\n" + PUSH_D for pointer in ["LCL", "ARG", "THIS", "THAT"])
+
+RETURN_CODE = (# endFrame=LCL
+               "@LCL\n"
+               "D=M\n"
+               "@endFrame\n"
+               "M=D\n"
+               # retAddr=*(endFrame-5)
+               "D=M\n"
+               "@5\n"
+               "A=D-A\n"
+               "D=M\n"
+               "@retAddr\n"
+               "M=D\n"
+               # *ARG=pop()
+               "@SP\n"
+               "M=M-1\n"
+               "A=M\n"
+               "D=M\n"
+               "@ARG\n"
+               "A=M\n"
+               "M=D\n"
+               # SP=ARG+1
+               "@ARG\n"
+               "D=M+1\n"
+               "@SP\n"
+               "M=D\n"
+               # THAT = *(endFrame-1)
+               "@endFrame\n"
+               "D=M\n"
+               "A=D-1\n"
+               "D=M\n"
+               "@THAT\n"
+               "M=D\n"
+               # THIS = *(endFrame-2)
+               "@endFrame\n"
+               "D=M\n"
+               "@2\n"
+               "A=D-A\n"
+               "D=M\n"
+               "@THIS\n"
+               "M=D\n"
+               # ARG = *(endFrame-3)
+               "@endFrame\n"
+               "D=M\n"
+               "@3\n"
+               "A=D-A\n"
+               "D=M\n"
+               "@ARG\n"
+               "M=D\n"
+               # LCL = *(endFrame-4)
+               "@endFrame\n"
+               "D=M\n"
+               "@4\n"
+               "A=D-A\n"
+               "D=M\n"
+               "@LCL\n"
+               "M=D\n"
+               # goto retAddr
+               "@retAddr\n"
+               "A=M\n"
+               "0;JMP\n")
+
+# The shared call and return subroutines, used with sharedCalls: a call site puts the called function's address in R13,
+# the number of arguments in R14 and the return address in D, and jumps to CALL_STUB. A return just jumps to RETURN_STUB
+CALL_STUB = "$$CALL"
+RETURN_STUB = "$$RETURN"
+
+SHARED_CALL_CODE = (f"({CALL_STUB})\n"
+                    # push the return address (D), LCL, ARG, THIS and THAT
+                    + PUSH_D + SAVE_FRAME_CODE +
+                    # ARG=SP-5-nArgs
+                    "@R14\n"
+                    "D=M\n"
+                    "@5\n"
+                    "D=D+A\n"
+                    "@SP\n"
+                    "D=M-D\n"
+                    "@ARG\n"
+                    "M=D\n"
+                    # LCL=SP
+                    "@SP\n"
+                    "D=M\n"
+                    "@LCL\n"
+                    "M=D\n"
+                    # goto function
+                    "@R13\n"
+                    "A=M\n"
+                    "0;JMP\n")
+
+SHARED_RETURN_CODE = f"({RETURN_STUB})\n" + RETURN_CODE
+
+# The code used with cacheTop, where the value at the top of the stack may be kept in D instead of in RAM[SP-1]
+
+# RAM[SP] <-- D, SP++ (the top of the stack is moved from D to RAM)
+SPILL_D = ("@SP\n"
+           "M=M+1\n"
+           "A=M-1\n"
+           "M=D\n")
+
+# SP--, D <-- RAM[SP] (the top of the stack is moved from RAM to D)
+LOAD_D = ("@SP\n"
+          "AM=M-1\n"
+          "D=M\n")
+
+# D <-- RAM[SP-1] op D, SP--, and D <-- op D
+CACHED_ARITHMETIC_CODE = {"add": "@SP\nAM=M-1\nD=D+M\n",
+                          "sub": "@SP\nAM=M-1\nD=M-D\n",
+                          "and": "@SP\nAM=M-1\nD=D&M\n",
+                          "or": "@SP\nAM=M-1\nD=D|M\n",
+                          "neg": "D=-D\n",
+                          "not": "D=!D\n"}
+
+# D <-- RAM[SP-1]-D, SP--, then D <-- -1 if the jump is taken, and 0 otherwise
+CACHED_COMPARISON_CODE = ("@SP\n"
+                          "AM=M-1\n"
+                          "D=M-D\n"
+                          "@{label}\n"
+                          "D;{jump}\n"
+                          "D=0\n"
+                          "@{label}_END\n"
+                          "0;JMP\n"
+                          "({label})\n"
+                          "D=-1\n"
+                          "({label}_END)\n")
+
+MAX_INCREMENTS = 6      # popping to a segment index up to this is done by incrementing A, and through R13 and R14 above it
+
+FLUSH_FRAGMENTS = 8192      # number of buffered code fragments that triggers a write to the output file
+
+# Labels are scoped: VM labels by their function (function$label), and the labels the translator creates by their
+# file (File$EQ0, File$ret.0), so the code of a file doesn't depend on the files translated before it.
+# The VM labels before the first function of a file are scoped by File$ (File$$label), apart from the translator's.
+# The labels of the bootstrap code are scoped by this name, which can't be a file's name
+BOOTSTRAP_SCOPE = "$$BOOT"
 
 
 class CodeWriter:
-    '''Translates VM commands into Hack assembly code'''
+    '''Translates VM commands into Hack assembly code.
+       The code fragments are collected in a buffer that is written to the output file in large chunks,
+       or, when there is no output file, taken by the caller with takeLines()'''
 
-    output = ""
-    labelIndex = 0      # used to create different labels
+    output = None
+    labelIndex = 0      # used to create different labels in the current file
     returnIndex = 0
     currentFileName = ""
-
-    def __init__(self, fileName, isDir):
-        '''Opens the output file and writes the bootstrap code'''
-        self.output = open(fileName, "w")
+    currentFunction = ""
+    labelScope = ""     # the prefix of the VM labels: the current function, or File$ before the first function
+
+    def __init__(self, fileName, isDir, sharedCalls=False, optimizer=None, cacheTop=False, bootstrap=True):
+        '''Opens the output file (if fileName is not None) and writes the bootstrap code (unless bootstrap is False).
+           With sharedCalls, calls and returns jump to a single copy of their code instead of inlining it.
+           optimizer (a PeepholeOptimizer) rewrites the code before it is written.
+           With cacheTop, the top of the stack is kept in D between commands, and is spilled to RAM
+           before labels, jumps, calls and returns'''
+        self.output = open(fileName, "w") if fileName is not None else None
+        self.buffer = []
+        self.linesTaken = 0         # the number of lines that takeLines returned, before the optimizer
+        self.bufferLines = 0        # the number of lines in the first countedFragments fragments of the buffer
+        self.countedFragments = 0
         self.labelIndex = 0
         self.returnIndex = 0
-        self.currentFileName = fileName
+        self.currentFileName = BOOTSTRAP_SCOPE
+        self.currentFunction = BOOTSTRAP_SCOPE
+        self.labelScope = BOOTSTRAP_SCOPE
+        self.pushPopCode = {}   # (command, segment, index) --> code, for the current file
+        self.sharedCalls = sharedCalls
+        self.optimizer = optimizer
+        self.cacheTop = cacheTop
+        self.topInD = False     # with cacheTop, whether the top of the stack is in D now
+
+        if not bootstrap:
+            return
 
         # bootstrap code
-        stream = ("@256\n"
-                  "D=A\n"
-                  "@SP\n"
-                  "M=D\n")
-        self.output.write(stream)
+        self._write("@256\n"
+                    "D=A\n"
+                    "@SP\n"
+                    "M=D\n")
 
         if isDir:       # this condition was added in order to pass the testing on the submission server
-            self.writeCall("Sys.init", "0")
+            self.writeCall("Sys.init", 0)
+
+    def _write(self, fragment):
+        '''Appends a code fragment to the buffer, and writes the buffer to the output file when it is full'''
+        buffer = self.buffer
+        buffer.append(fragment)
+        if len(buffer) >= FLUSH_FRAGMENTS and self.output is not None:
+            self.flush()
+
+    def flush(self, final=False):
+        '''Writes the buffered code to the output file. final tells the optimizer to give the lines it holds back'''
+        if self.optimizer is None:
+            self.output.write("".join(self.buffer))
+            self.buffer.clear()
+        else:
+            self.output.write("".join(line + "\n" for line in self.takeLines(final)))
+
+    def takeLines(self, final=False, origins=None):
+        '''Returns the lines of the buffered code (without the line breaks) and empties the buffer.
+           origins (a list) gets the position (see position()) of the line that each returned line comes from'''
+        lines = "".join(self.buffer).splitlines()
+        self.buffer.clear()
+        taken = self.linesTaken
+        self.linesTaken += len(lines)
+        self.bufferLines = self.countedFragments = 0
+        if self.optimizer is not None:
+            offset = taken - self.optimizer.linesIn     # the optimizer numbers the lines from the first it was fed
+            lines = self.optimizer.feed(lines)
+            if origins is not None:
+                origins.extend(origin + offset for origin in self.optimizer.returnedOrigins)
+            if final:
+                lines += self.optimizer.finish()
+                if origins is not None:
+                    origins.extend(origin + offset for origin in self.optimizer.returnedOrigins)
+        elif origins is not None:
+            origins.extend(range(taken, taken + len(lines)))
+        return lines
+
+    def position(self):
+        '''Returns the number of lines of code written so far (before the optimizer), which is the position
+           of the next line, for a writer whose code is taken with takeLines'''
+        buffer = self.buffer
+        for fragment in buffer[self.countedFragments:]:
+            self.bufferLines += fragment.count("\n")
+        self.countedFragments = len(buffer)
+        return self.linesTaken + self.bufferLines
+
+    def _spill(self):
+        '''Moves the top of the stack from D to RAM, if it is in D'''
+        if self.topInD:
+            self._write(SPILL_D)
+            self.topInD = False
 
     def setFileName(self, fileName):
         '''Informs that the translation of a new .vm file has started'''
+        self._spill()
         self.currentFileName = os.path.basename(fileName).rpartition(".")[0]
+        self.currentFunction = self.currentFileName
+        self.labelScope = self.currentFileName + "$"    # File$$label can't be one of the translator's File$EQ0 or File$ret.0
+        self.labelIndex = 0
+        self.returnIndex = 0
+        self.pushPopCode = {}   # static variables are named after the file
+
+    def endFile(self):
+        '''Informs that the translation of the current .vm file has ended, so its code doesn't leave the top of the stack in D'''
+        self._spill()
 
     def writeArithmetic(self, command):
         '''Writes the assembly code that is the translation of the given arithmetic command'''
 
-        if command == "add":
-            # RAM[SP-2] <-- RAM[SP-1]+RAM[SP-2]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "M=D+M\n"
-                      "D=A+1\n")
-            # SP--
-            stream += ("@SP\n"
-                       "M=D\n")
-
-        elif command == "sub":
-            # RAM[SP-2] <-- RAM[SP-2]-RAM[SP-1]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "M=M-D\n"
-                      "D=A+1\n")
-            # SP--
-            stream += ("@SP\n"
-                       "M=D\n")
-
-        elif command == "neg":
-            # RAM[SP-1] <-- -RAM[SP-1]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "M=-M\n")
-
-        elif command == "eq":
-            # D <-- RAM[SP-1] - RAM[SP-2]
-            stream = ("@SP\n"
-                      "AM=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "D=D-M\n"
-                      "M=-1\n"     # default value is True (-1)
-                      f"@EQ{self.labelIndex}\n"
-                      "D;JEQ\n")
-            # If not equal
-            stream += ("@SP\n"
-                       "A=M-1\n"
-                       "M=0\n"      # change to False (0)
-                       f"(EQ{self.labelIndex})\n")
+        if self.cacheTop:
+            self._writeCachedArithmetic(command)
+            return
 
+        code = ARITHMETIC_CODE.get(command)
+        if code is None:
+            difference, label, jump = COMPARISONS[command]
+            code = COMPARISON_CODE.format(difference=difference, label=f"{self.currentFileName}${label}{self.labelIndex}", jump=jump)
             self.labelIndex += 1
 
-        elif command == "gt":
-            # D <-- RAM[SP-2] - RAM[SP-1]
-            stream = ("@SP\n"
-                      "AM=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "D=M-D\n"
-                      "M=-1\n"     # default value is True (-1)
-                      f"@GT{self.labelIndex}\n"
-                      "D;JGT\n")
-            # If not greater than
-            stream += ("@SP\n"
-                       "A=M-1\n"
-                       "M=0\n"      # change to False (0)
-                       f"(GT{self.labelIndex})\n")
+        self._write(code)
 
-            self.labelIndex += 1
+    def _writeCachedArithmetic(self, command):
+        '''Writes the code of an arithmetic command that takes its last operand from D, and leaves its result in D'''
 
-        elif command == "lt":
-            # D <-- RAM[SP-2] - RAM[SP-1]
-            stream = ("@SP\n"
-                      "AM=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "D=M-D\n"
-                      "M=-1\n"     # default value is True (-1)
-                      f"@LT{self.labelIndex}\n"
-                      "D;JLT\n")
-            # If not less than
-            stream += ("@SP\n"
-                       "A=M-1\n"
-                       "M=0\n"      # change to False (0)
-                       f"(LT{self.labelIndex})\n")
+        if not self.topInD:
+            self._write(LOAD_D)
+        self.topInD = True
 
+        code = CACHED_ARITHMETIC_CODE.get(command)
+        if code is None:
+            _, label, jump = COMPARISONS[command]
+            code = CACHED_COMPARISON_CODE.format(label=f"{self.currentFileName}${label}{self.labelIndex}", jump=jump)
             self.labelIndex += 1
 
-        elif command == "and":
-            # RAM[SP-2] <-- RAM[SP-1]&RAM[SP-2]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "M=D&M\n")
-            # SP--
-            stream += ("@SP\n"
-                       "M=M-1\n")
-
-        elif command == "or":
-            # RAM[SP-2] <-- RAM[SP-1]|RAM[SP-2]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "D=M\n"
-                      "A=A-1\n"
-                      "M=D|M\n")
-            # SP--
-            stream += ("@SP\n"
-                       "M=M-1\n")
-
-        elif command == "not":
-            # RAM[SP-1] <-- !RAM[SP-1]
-            stream = ("@SP\n"
-                      "A=M-1\n"
-                      "M=!M\n")
-
-        self.output.write(stream)
+        self._write(code)
 
     def writePushPop(self, command, segment, index):
         '''Writes the assembly code that is the translation of the given command, where command is either C_PUSH or C_POP'''
 
-        if segment == "constant":
-            if command == "C_PUSH":
-                # RAM[SP] <-- i
-                stream = (f"@{index}\n"
-                          "D=A\n"
-                          "@SP\n"
-                          "A=M\n"
-                          "M=D\n")
-                # SP++
-                stream += ("@SP\n"
-                           "M=M+1\n")
-
-        elif segment == "local" or segment == "argument" or segment == "this" or segment == "that":
-            # Translate segment to RAM label
-            if segment == "local":
-                segment = "LCL"
-            elif segment == "argument":
-                segment = "ARG"
-            elif segment == "this" or segment == "that":
-                segment = segment.upper()
-
-            if command == "C_PUSH":
-                # RAM[SP] <-- RAM[segment+i]
-                stream = (f"@{segment}\n"
-                          "D=M\n"
-                          f"@{index}\n"
-                          "A=D+A\n"
-                          "D=M\n"
-                          "@SP\n"
-                          "A=M\n"
-                          "M=D\n")
-                # SP++
-                stream += ("@SP\n"
-                           "M=M+1\n")
-
-            elif command == "C_POP":
-                # R13 <-- segment+1
-                stream = (f"@{segment}\n"
-                          "D=M\n"
-                          f"@{index}\n"
-                          "D=D+A\n"
-                          "@R13\n"
-                          "M=D\n")
-                # SP--
-                stream += ("@SP\n"
-                           "M=M-1\n")
-                # RAM[R13] <-- RAM[SP]
-                stream += ("A=M\n"
-                           "D=M\n"
-                           "@R13\n"
-                           "A=M\n"
-                           "M=D\n")
+        key = (command, segment, index)
+        code = self.pushPopCode.get(key)
+        if code is None:
+            code = self.pushPopCode[key] = self._pushPopCode(command, segment, index)
+
+        if self.cacheTop:
+            if command == C_PUSH:
+                self._spill()           # the pushed value replaces the top of the stack in D
+                self.topInD = True
+            else:
+                if not self.topInD:
+                    self._write(LOAD_D)
+                self.topInD = False
+
+        self._write(code)
+
+    def _pushPopCode(self, command, segment, index):
+        '''Returns the assembly code of a push or a pop command'''
+
+        if self.cacheTop:
+            return self._cachedPushPopCode(command, segment, index)
+
+        if segment == "constant" and command == C_PUSH:
+            # RAM[SP] <-- i, SP++
+            return f"@{index}\nD=A\n" + PUSH_D
+
+        elif segment in SEGMENT_SYMBOLS:
+            symbol = SEGMENT_SYMBOLS[segment]
+            if command == C_PUSH:
+                # RAM[SP] <-- RAM[segment+i], SP++
+                return f"@{symbol}\nD=M\n@{index}\nA=D+A\nD=M\n" + PUSH_D
+            else:
+                # R13 <-- segment+i, SP--, RAM[R13] <-- RAM[SP]
+                return f"@{symbol}\nD=M\n@{index}\nD=D+A\n" + POP_TO_ADDRESS_IN_D
+
+        elif segment == "static":
+            if command == C_PUSH:
+                # RAM[SP] <-- RAM["fileName.index"], SP++
+                return f"@{self.currentFileName}.{index}\nD=M\n" + PUSH_D
+            else:
+                # SP--, RAM["fileName.index"] <-- RAM[SP]
+                return POP_D + f"@{self.currentFileName}.{index}\nM=D\n"
+
+        elif segment in BASE_ADDRESSES:
+            baseAddress = BASE_ADDRESSES[segment]
+            if command == C_PUSH:
+                # RAM[SP] <-- RAM[baseAddress+index], SP++
+                return f"@{baseAddress}\nD=A\n@{index}\nA=D+A\nD=M\n" + PUSH_D
+            else:
+                # R13 <-- baseAddress+i, SP--, RAM[R13] <-- RAM[SP]
+                return f"@{baseAddress}\nD=A\n@{index}\nD=D+A\n" + POP_TO_ADDRESS_IN_D
+
+        raise ValueError(f"{self.currentFileName}: cannot {'push' if command == C_PUSH else 'pop'} segment {segment}")
+
+    def _cachedPushPopCode(self, command, segment, index):
+        '''Returns the code that loads the pushed value into D, or that stores the popped value in D'''
+
+        if segment == "constant" and command == C_PUSH:
+            return f"@{index}\nD=A\n"
+
+        elif segment in SEGMENT_SYMBOLS:
+            symbol = SEGMENT_SYMBOLS[segment]
+            if index <= MAX_INCREMENTS:
+                # A <-- RAM[segment]+i
+                address = f"@{symbol}\n" + ("A=M\n" if index == 0 else "A=M+1\n" + "A=A+1\n" * (index - 1))
+                return address + ("D=M\n" if command == C_PUSH else "M=D\n")
+            elif command == C_PUSH:
+                return f"@{symbol}\nD=M\n@{index}\nA=D+A\nD=M\n"
+            else:
+                # R13 <-- D, R14 <-- segment+i, RAM[R14] <-- R13
+                return (f"@R13\nM=D\n@{symbol}\nD=M\n@{index}\nD=D+A\n@R14\nM=D\n"
+                        "@R13\nD=M\n@R14\nA=M\nM=D\n")
 
         elif segment == "static":
+            return f"@{self.currentFileName}.{index}\n" + ("D=M\n" if command == C_PUSH else "M=D\n")
+
+        elif segment in BASE_ADDRESSES:
+            return f"@{BASE_ADDRESSES[segment] + index}\n" + ("D=M\n" if command == C_PUSH else "M=D\n")
 
-            if command == "C_PUSH":
-                # RAM[SP] <-- RAM["fileName.index"]
-                stream = (f"@{self.currentFileName}.{index}\n"
-                          "D=M\n"
-                          "@SP\n"
-                          "A=M\n"
-                          "M=D\n")
-                # SP++
-                stream += ("@SP\n"
-                           "M=M+1\n")
-
-            elif command == "C_POP":
-                # SP--
-                stream = ("@SP\n"
-                          "M=M-1\n")
-                # RAM["fileName.index"] <-- RAM[SP]
-                stream += ("A=M\n"
-                           "D=M\n"
-                           f"@{self.currentFileName}.{index}\n"
-                           "M=D\n")
-
-        elif segment == "temp" or segment == "pointer":
-
-            if segment == "temp":
-                baseAddress = 5
-            else:   # segment == "pointer"
-                baseAddress = 3
-
-            if command == "C_PUSH":
-                # D <-- RAM[baseAddress+index]
-                stream = (f"@{baseAddress}\n"
-                          "D=A\n"
-                          f"@{index}\n"
-                          "A=D+A\n"
-                          "D=M\n")
-                # RAM[SP] <-- D
-                stream += ("@SP\n"
-                           "A=M\n"
-                           "M=D\n")
-                # SP++
-                stream += ("@SP\n"
-                           "M=M+1\n")
-
-            elif command == "C_POP":
-                # R13 <-- baseAddress+i
-                stream = (f"@{baseAddress}\n"
-                          "D=A\n"
-                          f"@{index}\n"
-                          "D=D+A\n"
-                          "@R13\n"
-                          "M=D\n")
-                # SP--
-                stream += ("@SP\n"
-                           "M=M-1\n")
-                # RAM[R13] <-- RAM[SP]
-                stream += ("A=M\n"
-                           "D=M\n"
-                           "@R13\n"
-                           "A=M\n"
-                           "M=D\n")
-
-        self.output.write(stream)
+        raise ValueError(f"{self.currentFileName}: cannot {'push' if command == C_PUSH else 'pop'} segment {segment}")
 
     def writeLabel(self, label):
         '''Writes assembly code that affects the label command'''
-        stream = (f"({label})\n")
-        self.output.write(stream)
+        self._spill()       # the code that jumps here keeps the whole stack in RAM
+        self._write(f"({self.labelScope}${label})\n")
 
     def writeGoto(self, label):
         '''Writes assembly code that affects the goto command'''
-        stream = (f"@{label}\n"
-                  "0;JMP\n")
-        self.output.write(stream)
+        self._spill()
+        self._write(f"@{self.labelScope}${label}\n"
+                    "0;JMP\n")
 
     def writeIf(self, label):
         '''Writes assembly code that affects the if-goto command'''
-        stream = ("@SP\n"
-                  "AM=M-1\n"
-                  "D=M\n"
-                  f"@{label}\n"
-                  "D;JNE\n")
-        self.output.write(stream)
+        label = f"{self.labelScope}${label}"
+        if self.topInD:
+            self.topInD = False
+            self._write(f"@{label}\n"
+                        "D;JNE\n")
+            return
+        self._write("@SP\n"
+                    "AM=M-1\n"
+                    "D=M\n"
+                    f"@{label}\n"
+                    "D;JNE\n")
 
     def writeFunction(self, functionName, nVars):
         '''Writes assembly code that affects the function command'''
-
-        nVars = (int)(nVars)
-        stream = (f"({functionName})\n")
-
-        for i in range(nVars):
-            stream += ("@LCL\n"
-                       "D=M\n"
-                       f"@{i}\n"
-                       "A=D+A\n"
-                       "M=0\n"
-                       "@SP\n"
-                       "M=M+1\n")
-
-        self.output.write(stream)
+        self._spill()
+        self.currentFunction = self.labelScope = functionName
+        self._write(f"({functionName})\n")
+        for i in range(int(nVars)):
+            self._write(INIT_LOCAL_CODE.format(index=i))
 
     def writeCall(self, functionName, nVars):
         '''Writes assembly code that affects the call command'''
 
-        # push returnAddress
-        stream = (f"@{functionName}$ret.{self.returnIndex}\n"
-                  "D=A\n"
-                  "@SP\n"
-                  "A=M\n"
-                  "M=D\n"
-                  "@SP\n"
-                  "M=M+1\n")
-
-        # push LCL
-        stream += ("@LCL\n"
-                   "D=M\n"
-                   "@SP\n"
-                   "A=M\n"
-                   "M=D\n"
-                   "@SP\n"
-                   "M=M+1\n")
-
-        # push ARG
-        stream += ("@ARG\n"
-                   "D=M\n"
-                   "@SP\n"
-                   "A=M\n"
-                   "M=D\n"
-                   "@SP\n"
-                   "M=M+1\n")
-
-        # push THIS
-        stream += ("@THIS\n"
-                   "D=M\n"
-                   "@SP\n"
-                   "A=M\n"
-                   "M=D\n"
-                   "@SP\n"
-                   "M=M+1\n")
-
-        # push THAT
-        stream += ("@THAT\n"
-                   "D=M\n"
-                   "@SP\n"
-                   "A=M\n"
-                   "M=D\n"
-                   "@SP\n"
-                   "M=M+1\n")
-
-        # ARG=SP–5–nVars
-        stream += ("@5\n"
-                   "D=A\n"
-                   f"@{nVars}\n"
-                   "D=D+A\n"
-                   "@SP\n"
-                   "D=M-D\n"
-                   "@ARG\n"
-                   "M=D\n")
-
-        # LCL=SP
-        stream += ("@SP\n"
-                   "D=M\n"
-                   "@LCL\n"
-                   "M=D\n")
-
-        # goto functionName
-        stream += (f"@{functionName}\n"
-                   "0;JMP\n")
-
-        # (returnAddress)
-        stream += (f"({functionName}$ret.{self.returnIndex})\n")
-
-        self.output.write(stream)
-
+        self._spill()
+        returnAddress = f"{self.currentFileName}$ret.{self.returnIndex}"
         self.returnIndex += 1
 
+        if self.sharedCalls:
+            # R13 <-- functionName, R14 <-- nVars, D <-- returnAddress, goto CALL_STUB, (returnAddress)
+            self._write(f"@{functionName}\n"
+                        "D=A\n"
+                        "@R13\n"
+                        "M=D\n"
+                        + (f"@R14\nM={nVars}\n" if int(nVars) in (0, 1) else f"@{nVars}\nD=A\n@R14\nM=D\n")
+                        + f"@{returnAddress}\n"
+                        "D=A\n"
+                        f"@{CALL_STUB}\n"
+                        "0;JMP\n"
+                        f"({returnAddress})\n")
+            return
+
+        # push returnAddress, LCL, ARG, THIS and THAT
+        self._write(f"@{returnAddress}\nD=A\n" + PUSH_D + SAVE_FRAME_CODE)
+
+        # ARG=SP-5-nVars, LCL=SP, goto functionName, (returnAddress)
+        self._write("@5\n"
+                    "D=A\n"
+                    f"@{nVars}\n"
+                    "D=D+A\n"
+                    "@SP\n"
+                    "D=M-D\n"
+                    "@ARG\n"
+                    "M=D\n"
+                    "@SP\n"
+                    "D=M\n"
+                    "@LCL\n"
+                    "M=D\n"
+                    f"@{functionName}\n"
+                    "0;JMP\n"
+                    f"({returnAddress})\n")
+
     def writeReturn(self):
         '''Writes assembly code that affects the return command'''
+        self._spill()
+        if self.sharedCalls:
+            self._write(f"@{RETURN_STUB}\n"
+                        "0;JMP\n")
+        else:
+            self._write(RETURN_CODE)
 
-        # endFrame=LCL
-        stream = ("@LCL\n"
-                  "D=M\n"
-                  "@endFrame\n"
-                  "M=D\n")
-
-        # retAddr=*(endFrame-5)
-        stream += ("D=M\n"
-                   "@5\n"
-                   "A=D-A\n"
-                   "D=M\n"
-                   "@retAddr\n"
-                   "M=D\n")
-
-        # *ARG=pop()
-        stream += ("@SP\n"
-                   "M=M-1\n"
-                   "A=M\n"
-                   "D=M\n"
-                   "@ARG\n"
-                   "A=M\n"
-                   "M=D\n")
-
-        # SP=ARG+1
-        stream += ("@ARG\n"
-                   "D=M+1\n"
-                   "@SP\n"
-                   "M=D\n")
-
-        # THAT = *(endFrame-1)
-        stream += ("@endFrame\n"
-                   "D=M\n"
-                   "A=D-1\n"
-                   "D=M\n"
-                   "@THAT\n"
-                   "M=D\n")
-
-        # THIS = *(endFrame-2)
-        stream += ("@endFrame\n"
-                   "D=M\n"
-                   "@2\n"
-                   "A=D-A\n"
-                   "D=M\n"
-                   "@THIS\n"
-                   "M=D\n")
-
-        # ARG = *(endFrame-3)
-        stream += ("@endFrame\n"
-                   "D=M\n"
-                   "@3\n"
-                   "A=D-A\n"
-                   "D=M\n"
-                   "@ARG\n"
-                   "M=D\n")
-
-        # LCL = *(endFrame-4)
-        stream += ("@endFrame\n"
-                   "D=M\n"
-                   "@4\n"
-                   "A=D-A\n"
-                   "D=M\n"
-                   "@LCL\n"
-                   "M=D\n")
+    def close(self):
+        '''Ends the code with a vacant infinite loop (followed by the shared call and return code, if used),
+           and writes it and closes the output file'''
 
-        # goto retAddr
-        stream += ("@retAddr\n"
-                   "A=M\n"
-                   "0;JMP\n")
+        self._spill()
+        self._write("(END)\n"
+                    "@END\n"
+                    "0;JMP\n")
+        if self.sharedCalls:
+            self._write(SHARED_CALL_CODE)
+            self._write(SHARED_RETURN_CODE)
 
-        self.output.write(stream)
+        if self.output is not None:
+            self.flush(final=True)
+            self.output.close()
 
-    def close(self):
-        '''Ends the file with a vacant infinite loop and closes it'''
 
-        stream = ("(END)\n"
-                  "@END\n"
-                  "0;JMP\n")
+def vmFiles(inputPath):
+    '''Returns the .vm files to translate: the given file, or the .vm files in the given directory, sorted by name
+       (os.listdir's order depends on the file system, and the output would depend on it)'''
+    if os.path.isdir(inputPath):
+        return [os.path.join(inputPath, file) for file in sorted(os.listdir(inputPath)) if file.endswith(".vm")]
+    return [inputPath]
 
-        self.output.write(stream)
 
-        self.output.close()
+def writeCommand(fileCodeWriter, commandType, arg1, arg2):
+    '''Generates the assembly code of a single VM command'''
 
+    if commandType == C_PUSH or commandType == C_POP:
+        fileCodeWriter.writePushPop(commandType, arg1, arg2)
 
-def mainLoop(inputFile, fileCodeWriter):
-    '''Marches through the VM commands in the input file and generate assembly code for each one of them'''
+    elif commandType == C_ARITHMETIC:
+        fileCodeWriter.writeArithmetic(arg1)
 
-    fileParser = Parser(inputFile)
-    fileCodeWriter.setFileName(inputFile)
+    elif commandType == C_LABEL:
+        fileCodeWriter.writeLabel(arg1)
 
-    while fileParser.hasMoreLines():
-        fileParser.advance()
-        commandType = fileParser.commandType()
+    elif commandType == C_GOTO:
+        fileCodeWriter.writeGoto(arg1)
 
-        if commandType == "C_ARITHMETIC":
-            command = fileParser.arg1()
-            fileCodeWriter.writeArithmetic(command)
+    elif commandType == C_IF:
+        fileCodeWriter.writeIf(arg1)
 
-        elif commandType == "C_PUSH" or commandType == "C_POP":
-            segment = fileParser.arg1()
-            index = fileParser.arg2()
-            fileCodeWriter.writePushPop(commandType, segment, index)
+    elif commandType == C_FUNCTION:
+        fileCodeWriter.writeFunction(arg1, arg2)
 
-        elif commandType == "C_LABEL":
-            label = fileParser.arg1()
-            fileCodeWriter.writeLabel(label)
+    elif commandType == C_RETURN:
+        fileCodeWriter.writeReturn()
 
-        elif commandType == "C_GOTO":
-            label = fileParser.arg1()
-            fileCodeWriter.writeGoto(label)
+    elif commandType == C_CALL:
+        fileCodeWriter.writeCall(arg1, arg2)
 
-        elif commandType == "C_IF":
-            label = fileParser.arg1()
-            fileCodeWriter.writeIf(label)
 
-        elif commandType == "C_FUNCTION":
-            functionName = fileParser.arg1()
-            nVars = fileParser.arg2()
-            fileCodeWriter.writeFunction(functionName, nVars)
+def mainLoop(inputFile, fileCodeWriter, lines=None, commandOrigins=None):
+    '''Marches through the VM commands in the input file (or in the given lines) and generate assembly code for each one of them.
+       Returns the number of commands.
+       commandOrigins (a list) gets the position of the code of each command in the writer, its line and its function'''
 
-        elif commandType == "C_RETURN":
-            fileCodeWriter.writeReturn()
+    fileParser = Parser(inputFile, lines)
+    fileCodeWriter.setFileName(inputFile)
 
-        elif commandType == "C_CALL":
-            functionName = fileParser.arg1()
-            nVars = fileParser.arg2()
-            fileCodeWriter.writeCall(functionName, nVars)
+    commands = 0
+    if commandOrigins is None:
+        for commandType, arg1, arg2 in fileParser.commands():
+            writeCommand(fileCodeWriter, commandType, arg1, arg2)
+            commands += 1
+    else:
+        for commandType, arg1, arg2 in fileParser.commands():
+            position = fileCodeWriter.position()
+            writeCommand(fileCodeWriter, commandType, arg1, arg2)
+            commandOrigins.append((position, fileParser.lineNumber, fileCodeWriter.currentFunction))
+            commands += 1
+    return commands
+
+
+def _mapFragment(sourceMap, fileName, commandOrigins, lineOrigins):
+    '''Adds to the source map the VM command that each line of a fragment comes from, given the commands' origins
+       and the lines' origins (as mainLoop and CodeWriter.takeLines give them)'''
+    positions = [position for position, _, _ in commandOrigins]
+    for lineIndex, origin in enumerate(lineOrigins):
+        command = bisect.bisect_right(positions, origin) - 1
+        if command < 0:
+            sourceMap.add(lineIndex, "", 0)
+        else:
+            _, line, function = commandOrigins[command]
+            sourceMap.add(lineIndex, fileName, line, function)
+
+
+def translateFile(inputFile, sharedCalls=False, optimizer=None, cacheTop=False, lines=None, instrumentation=None, sourceMap=None):
+    '''Translates a single .vm file (or the given lines of VM code, named after inputFile) on its own, and returns
+       its assembly code (a fragment, which the link step puts between the bootstrap code and the end code).
+       Its labels are scoped by the file, so it is the same whatever other files are translated with it.
+       instrumentation (an Instrumentation) gets the translation time and the numbers of commands and instructions.
+       sourceMap (a SourceMap) gets the VM line of each line of the fragment, counted from 0'''
+    start = time.perf_counter()
+    fileCodeWriter = CodeWriter(None, False, sharedCalls, optimizer, cacheTop, bootstrap=False)
+    commandOrigins = [] if sourceMap is not None else None
+    lineOrigins = [] if sourceMap is not None else None
+    commands = mainLoop(inputFile, fileCodeWriter, lines, commandOrigins)
+    fileCodeWriter.endFile()
+    fragmentLines = fileCodeWriter.takeLines(final=True, origins=lineOrigins)
+    fragment = "".join(line + "\n" for line in fragmentLines)
+    if sourceMap is not None:
+        _mapFragment(sourceMap, os.path.basename(inputFile), commandOrigins, lineOrigins)
+
+    if instrumentation is not None:
+        instrumentation.addTime("translate", inputFile, time.perf_counter() - start)
+        instrumentation.count("translate", inputFile, "VM commands", commands)
+        labels = fragment.count("(")    # a parenthesis only appears in a label
+        instrumentation.count("translate", inputFile, "asm instructions", fragment.count("\n") - labels)
+        instrumentation.count("translate", inputFile, "asm labels", labels)
+    return fragment
+
+
+def _translateInProcess(inputFile, sharedCalls, optimizer, cacheTop, instrument, mapSource):
+    '''Translates a file in a worker process with the given optimizer (a copy of the caller's, or None), and returns
+       its fragment, the optimizer, its Instrumentation (or None) and its SourceMap (or None)'''
+    instrumentation = Instrumentation.Instrumentation() if instrument else None
+    sourceMap = SourceMap.SourceMap() if mapSource else None
+    fragment = translateFile(inputFile, sharedCalls, optimizer, cacheTop, instrumentation=instrumentation, sourceMap=sourceMap)
+    return fragment, optimizer, instrumentation, sourceMap
+
+
+def translateProgram(inputPath, outputFile, sharedCalls=False, optimizer=None, cacheTop=False, cache=None, jobs=1,
+                     instrumentation=None, sourceMaps=False):
+    '''Translates a .vm file or a directory of .vm files into the output file: each file is translated into a fragment,
+       or restored from the cache (a FragmentCache) if it didn't change, and the fragments are linked in the order
+       of the files' names. With jobs > 1, the files are translated in that many processes.
+       optimizer (a PeepholeOptimizer) gets the counts of every file, those of the cached files being stored with them.
+       instrumentation (an Instrumentation) gets the timings and the counters of the stages.
+       With sourceMaps, the map of the lines of the output file to the VM lines is written next to it'''
+
+    inputFiles = vmFiles(inputPath)
+    fragments = {}
+    fragmentMaps = {}
+    optimizerCounts = {}    # the counts of the optimizer on each file, stored in the cache for the report
+    keys = {}
+    if cache is not None:
+        # The key of a fragment depends on the options that change its code, as this translation gets them
+        rules = optimizer.signature() if optimizer is not None else None
+        options = f"sharedCalls={sharedCalls} cacheTop={cacheTop} rules={rules}"
+        for inputFile in inputFiles:
+            start = time.perf_counter()
+            keys[inputFile] = key = cache.key(inputFile, options)
+            fragment = cache.get(key) if key is not None else None
+            if fragment is not None and sourceMaps:
+                fragmentMaps[inputFile] = cache.getMap(key)
+                if fragmentMaps[inputFile] is None:     # cached by a translation without maps
+                    fragment = None
+            if fragment is not None and optimizer is not None:
+                optimizerCounts[inputFile] = cache.optimizerCounts(key)
+                if optimizerCounts[inputFile] is None:
+                    fragment = None
+            if fragment is not None:
+                fragments[inputFile] = fragment
+                if instrumentation is not None:
+                    instrumentation.addTime("cache", inputFile, time.perf_counter() - start)
+                    instrumentation.count("cache", inputFile, "hits")
+
+    missing = [inputFile for inputFile in inputFiles if inputFile not in fragments]
+    if jobs <= 1 or len(missing) <= 1:
+        for inputFile in missing:
+            fragmentMaps[inputFile] = SourceMap.SourceMap() if sourceMaps else None
+            fileOptimizer = optimizer.copy() if optimizer is not None else None
+            fragments[inputFile] = translateFile(inputFile, sharedCalls, fileOptimizer, cacheTop, instrumentation=instrumentation,
+                                                 sourceMap=fragmentMaps[inputFile])
+            if optimizer is not None:
+                optimizerCounts[inputFile] = fileOptimizer.counts()
+    else:
+        # each process optimizes with its own copy of the optimizer (with its rules) and has its own Instrumentation,
+        # whose counts are added to the given ones
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(_translateInProcess, missing, [sharedCalls] * len(missing),
+                                   [optimizer.copy() if optimizer is not None else None] * len(missing), [cacheTop] * len(missing),
+                                   [instrumentation is not None] * len(missing), [sourceMaps] * len(missing))
+            for inputFile, (fragment, fileOptimizer, fileInstrumentation, fragmentMap) in zip(missing, results):
+                fragments[inputFile] = fragment
+                fragmentMaps[inputFile] = fragmentMap
+                if optimizer is not None:
+                    optimizerCounts[inputFile] = fileOptimizer.counts()
+                if instrumentation is not None:
+                    instrumentation.merge(fileInstrumentation)
+
+    if cache is not None:
+        for inputFile in missing:
+            if keys[inputFile] is not None:
+                cache.put(keys[inputFile], fragments[inputFile], fragmentMaps.get(inputFile), optimizerCounts.get(inputFile))
+    if optimizer is not None:
+        for inputFile in inputFiles:
+            optimizer.mergeCounts(optimizerCounts[inputFile])
+
+    link(outputFile, [fragments[inputFile] for inputFile in inputFiles], os.path.isdir(inputPath),
+         sharedCalls, optimizer, cacheTop, instrumentation,
+         [fragmentMaps[inputFile] for inputFile in inputFiles] if sourceMaps else None)
+    if cache is not None:
+        cache.save()
+
+
+def linkedCode(fragments, isDir, sharedCalls=False, optimizer=None, cacheTop=False):
+    '''Generates the code of the whole program: the bootstrap code, the given fragments and the end code
+       (followed by the shared call and return code, if used)'''
+
+    bootstrapWriter = CodeWriter(None, isDir, sharedCalls, optimizer, cacheTop)        # call Sys.init only for a directory
+    yield "".join(line + "\n" for line in bootstrapWriter.takeLines(final=True))
+    yield from fragments
+    endWriter = CodeWriter(None, False, sharedCalls, optimizer, cacheTop, bootstrap=False)
+    endWriter.close()
+    yield "".join(line + "\n" for line in endWriter.takeLines(final=True))
+
+
+def linkedSourceMap(pieceLines, fragmentMaps):
+    '''Returns the source map of the linked code, given the number of lines of each piece of code that linkedCode generated
+       and the source maps of the fragments. The lines of the bootstrap code and of the end code have no source'''
+    sourceMap = SourceMap.SourceMap()
+    lineNumber = 1
+    for piece, lines in enumerate(pieceLines):
+        sourceMap.add(lineNumber, "", 0, BOOTSTRAP_SCOPE if piece == 0 else "")
+        if 0 < piece <= len(fragmentMaps):
+            sourceMap.extend(fragmentMaps[piece - 1], lineNumber)
+        lineNumber += lines
+    return sourceMap
+
+
+def link(outputFile, fragments, isDir, sharedCalls=False, optimizer=None, cacheTop=False, instrumentation=None, fragmentMaps=None):
+    '''Writes the linked code of the given fragments to the output file. The file is replaced only when it is complete.
+       With the source maps of the fragments, the map of the output file is written next to it'''
+
+    start = time.perf_counter()
+    written = 0
+    pieceLines = []
+    temporaryName = f"{outputFile}.{os.getpid()}.tmp"
+    with open(temporaryName, "w") as output:
+        for code in linkedCode(fragments, isDir, sharedCalls, optimizer, cacheTop):
+            output.write(code)
+            written += len(code)
+            if fragmentMaps is not None:
+                pieceLines.append(code.count("\n"))
+    os.replace(temporaryName, outputFile)
+    if fragmentMaps is not None:
+        linkedSourceMap(pieceLines, fragmentMaps).write(outputFile + SourceMap.EXTENSION)
+
+    if instrumentation is not None:
+        instrumentation.addTime("link", outputFile, time.perf_counter() - start)
+        instrumentation.count("link", outputFile, "bytes written", written)     # the code is ASCII
+
+
+def streamTranslation(inputPath, sharedCalls=False, optimizer=None, cacheTop=False):
+    '''Translates a .vm file or a directory of .vm files, and generates the lines of the assembly code
+       (without line breaks) as they are produced, without writing any file'''
+
+    isDir = os.path.isdir(inputPath)
+    fileCodeWriter = CodeWriter(None, isDir, sharedCalls, optimizer, cacheTop)     # call Sys.init only for a directory
+
+    for inputFile in vmFiles(inputPath):
+        fileCodeWriter.setFileName(inputFile)
+        for commandType, arg1, arg2 in Parser(inputFile).commands():
+            writeCommand(fileCodeWriter, commandType, arg1, arg2)
+            if len(fileCodeWriter.buffer) >= FLUSH_FRAGMENTS:
+                yield from fileCodeWriter.takeLines()
+
+    fileCodeWriter.close()
+    yield from fileCodeWriter.takeLines(final=True)
 
 
 if __name__ == "__main__":
 
-    inputPath = sys.argv[1]
-    
+    argumentParser = argparse.ArgumentParser(description="Translates VM code into Hack assembly code")
+    argumentParser.add_argument("inputPath", help="a .vm file or a directory of .vm files")
+    argumentParser.add_argument("--shared-calls", action="store_true",
+                                help="jump to a single copy of the call and return code instead of inlining it (smaller ROM)")
+    argumentParser.add_argument("--optimize", action="store_true",
+                                help="rewrite redundant instruction sequences, and report how many times each rule applied")
+    argumentParser.add_argument("--cache-top", action="store_true",
+                                help="keep the top of the stack in D between commands (fewer memory accesses)")
+    argumentParser.add_argument("--no-cache", action="store_true",
+                                help=f"translate every file, without the {FragmentCache.CACHE_DIRECTORY} fragment cache")
+    argumentParser.add_argument("--jobs", type=int, default=1,
+                                help="number of processes that translate the files (default: 1)")
+    argumentParser.add_argument("--report", help="write the timings and the counters of each stage and file to this file (.json or .csv)")
+    argumentParser.add_argument("--source-map", action="store_true",
+                                help=f"write the map of the .asm lines to the VM lines (Prog.asm{SourceMap.EXTENSION})")
+    arguments = argumentParser.parse_args()
+
+    inputPath = arguments.inputPath
+    optimizer = PeepholeOptimizer.PeepholeOptimizer() if arguments.optimize else None
+
     # If the input is a directory, translate each .vm file in it under one .asm file
     if os.path.isdir(inputPath):
-        dirName = os.path.basename(inputPath)
+        dirName = os.path.basename(os.path.normpath(inputPath))
         outputFile = os.path.join(inputPath, dirName + ".asm")
-        fileCodeWriter = CodeWriter(outputFile, True)       # call Sys.init
-
-        for file in os.listdir(inputPath):
-            if file.endswith(".vm"):
-                inputFile = os.path.join(inputPath, file)
-                mainLoop(inputFile, fileCodeWriter)
-
+        cacheDirectory = inputPath
     else:
         outputFile = inputPath.rpartition('.')[0] + ".asm"
-        fileCodeWriter = CodeWriter(outputFile, False)      # don't call Sys.init
-        mainLoop(inputPath, fileCodeWriter)
+        cacheDirectory = os.path.dirname(inputPath) or "."
+
+    cache = None if arguments.no_cache else FragmentCache.FragmentCache(cacheDirectory)
+
+    instrumentation = Instrumentation.Instrumentation() if arguments.report else None
+    translateProgram(inputPath, outputFile, arguments.shared_calls, optimizer, arguments.cache_top, cache, arguments.jobs,
+                     instrumentation, arguments.source_map)
+    if instrumentation is not None:
+        instrumentation.writeReport(arguments.report)
 
-    fileCodeWriter.close()
\ No newline at end of file
+    if optimizer is not None:
+        print("\n".join(optimizer.report()))
\ No newline at end of file
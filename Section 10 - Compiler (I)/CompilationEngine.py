@@ -1,3 +1,9 @@
+import os
+import sys
+# JackTokenizer is shared by the compiler's sections: it is in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
 import JackTokenizer as Jt
 
 CONSTRUCTOR = "constructor"
@@ -356,18 +362,7 @@ class CompilationEngine:
         '''Private function used to process the tokens with their matching XML tags'''
 
         currentTokenType = self.tokenizer.tokenType()
-
-        # Set currentToken according to currentTokenType
-        if currentTokenType == Jt.KEYWORD:
-            currentToken = self.tokenizer.keyWord()
-        elif currentTokenType == Jt.SYMBOL:
-            currentToken = self.tokenizer.symbol()
-        elif currentTokenType == Jt.IDENTIFIER:
-            currentToken = self.tokenizer.identifier()
-        elif currentTokenType == Jt.INT_CONST:
-            currentToken = self.tokenizer.intVal()
-        elif currentTokenType == Jt.STRING_CONST:
-            currentToken = self.tokenizer.stringVal()
+        currentToken = self.tokenizer.value()
 
         if str != currentToken:
             raise Exception("Error")    # consider changing the message
@@ -0,0 +1,105 @@
+import os
+import sys
+import hashlib
+# SourceMap and ObjectStore are shared by the sections: they are in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import SourceMap
+import ObjectStore
+
+CACHE_DIRECTORY = ".jackcache"      # created in the directory of the compiled files
+MAX_CACHE_BYTES = 8 * 1024 * 1024   # least recently used objects are evicted past this size
+OBJECT = ".vm"                      # the extensions of the files of a cached class: its VM code and its map
+OBJECT_MAP = ".vm" + SourceMap.EXTENSION
+
+# The modules whose code determines the compiler's output and its source maps: a change in any of them invalidates
+# the whole cache. They are in this directory, but for JackTokenizer and SourceMap, which are given by their paths
+COMPILER_MODULES = [os.path.join(TOOLCHAIN_DIRECTORY, "JackTokenizer.py"), "SymbolTable.py", "Expression.py", "VMWriter.py",
+                    "CompilationEngine.py", os.path.join(TOOLCHAIN_DIRECTORY, "SourceMap.py")]
+
+
+def compilerHash():
+    '''Returns a hash of the source code of the compiler modules'''
+    return ObjectStore.hashFiles(os.path.dirname(os.path.abspath(__file__)), COMPILER_MODULES)
+
+
+def vmFileName(inputFile):
+    '''Returns the name of the VM file that is compiled from the given .jack file, as VMWriter names it'''
+    return inputFile.rpartition(".")[0] + ".vm"
+
+
+def mapFileName(inputFile):
+    '''Returns the name of the source map of the VM file that is compiled from the given .jack file'''
+    return vmFileName(inputFile) + SourceMap.EXTENSION
+
+
+class BuildCache:
+    '''An on-disk cache of compiled classes. The VM code of a class is stored under a hash of its file name,
+       its source code and the compiler, so an unchanged class is restored from the cache instead of compiled again'''
+
+    def __init__(self, directory, maxBytes=MAX_CACHE_BYTES, sourceMaps=False):
+        '''Opens (or creates) the cache of the given directory.
+           With sourceMaps, the source maps of the VM files are stored and restored with them'''
+        self.sourceMaps = sourceMaps
+        self.compiler = compilerHash()
+        self.objects = ObjectStore.ObjectStore(os.path.join(directory, CACHE_DIRECTORY), [OBJECT, OBJECT_MAP], maxBytes,
+                                               {"compiler": self.compiler})
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, inputFile):
+        '''Returns the cache key of the given .jack file, or None if it can't be read.
+           The file's name is a part of the key, since the source map of the VM code names the file'''
+        try:
+            with open(inputFile, "rb") as input:
+                source = input.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(f"{self.compiler}\n{os.path.basename(inputFile)}\n".encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def restore(self, key, inputFile):
+        '''Writes the cached VM code of the given key as the VM file of the given .jack file.
+           Returns False if the key isn't in the cache'''
+
+        if key not in self.objects:
+            self.misses += 1
+            return False
+        try:
+            code = self.objects.read(key, OBJECT)
+            if self.sourceMaps:
+                mapData = self.objects.read(key, OBJECT_MAP)
+        except OSError:                                         # the object was deleted, or cached without its map
+            self.misses += 1
+            return False
+
+        # The VM file is left untouched if it is up to date, so its modification time tells when it last changed
+        fileName = vmFileName(inputFile)
+        try:
+            with open(fileName, "rb") as input:
+                upToDate = input.read() == code
+        except OSError:
+            upToDate = False
+        if not upToDate:
+            ObjectStore.writeAtomically(fileName, code)
+        if self.sourceMaps:
+            ObjectStore.writeAtomically(mapFileName(inputFile), mapData)
+
+        self.objects.touch(key)
+        self.hits += 1
+        return True
+
+    def store(self, key, inputFile):
+        '''Stores the VM file of the given .jack file under the given key'''
+        with open(vmFileName(inputFile), "rb") as input:
+            files = {OBJECT: input.read()}
+        if self.sourceMaps:
+            with open(mapFileName(inputFile), "rb") as input:
+                files[OBJECT_MAP] = input.read()
+        self.objects.write(key, files)
+
+    def save(self):
+        '''Evicts the least recently used objects until the cache fits in its size, and writes the manifest'''
+        self.objects.save()
\ No newline at end of file
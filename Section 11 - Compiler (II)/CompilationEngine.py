@@ -1,6 +1,13 @@
+import os
+import sys
+# JackTokenizer is shared by the compiler's sections: it is in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
 import JackTokenizer as Jt
 import SymbolTable as St
 import VMWriter as VMw
+import Expression as Ex
 
 THIS = "this"
 THAT = "that"
@@ -25,14 +32,25 @@ AND = "and"
 OR = "or"
 NOT = "not"
 
+# adapted to comply with XML notations
+BINARY_OPERATORS = {"+": Ex.ADD, "-": Ex.SUB, "*": Ex.MULTIPLY, "/": Ex.DIVIDE, "&amp;": Ex.AND, "|": Ex.OR,
+                    "&lt;": Ex.LT, "&gt;": Ex.GT, "=": Ex.EQ}
+
 
 class CompilationEngine:
     '''Compiles the input Jack code into a VM file'''
 
-    def __init__(self, inputName):
-        '''Creates a new compilation engine with the given input and output'''
-        self.tokenizer = Jt.JackTokenizer(inputName)
-        self.writer = VMw.VMWriter(inputName)
+    def __init__(self, inputName, source=None, output=None, instrumentation=None, sourceMap=None):
+        '''Creates a new compilation engine with the given input and output.
+           source (the Jack code) and output (a text stream for the VM code) replace the files when given.
+           instrumentation (an Instrumentation) times the tokenizing and the compilation.
+           sourceMap (a SourceMap) gets the Jack line and the subroutine of the VM commands, by their line in the VM code'''
+        self.tokenizer = Jt.JackTokenizer(inputName, source, instrumentation)
+        self.writer = VMw.VMWriter(inputName, output)
+        self.instrumentation = instrumentation
+        self.sourceMap = sourceMap
+        self.sourceName = os.path.basename(inputName)
+        self.subroutineLine = 0
         self.classTable = St.SymbolTable()
         self.subroutineTable = St.SymbolTable()
         self.className = ""
@@ -43,7 +61,22 @@ class CompilationEngine:
 
 
     def compileClass(self):
-        '''Compiles a complete class'''
+        '''Compiles a complete class. The VM file is written only if the whole class compiles'''
+
+        try:
+            if self.instrumentation is None:
+                self._compileClass()
+            else:
+                with self.instrumentation.timer("compile", self.tokenizer.fileName):
+                    self._compileClass()
+                self.instrumentation.count("compile", self.tokenizer.fileName, "VM commands", self.writer.commands)
+        except BaseException:
+            self.writer.discard()
+            raise
+        self.writer.close()
+
+    def _compileClass(self):
+        '''Compiles a complete class into the writer'''
 
         if self.tokenizer.hasMoreTokens():
 
@@ -62,8 +95,6 @@ class CompilationEngine:
 
             self._eat("}")
 
-            self.writer.close()
-
 
     def compileClassVarDec(self):
         '''Compiles a static variable declaration or a field declaration'''
@@ -91,6 +122,7 @@ class CompilationEngine:
         '''Compiles a complete method, function, or constructor'''
 
         self.subroutineTable.reset()
+        self.subroutineLine = self.tokenizer.position()[0]
         
         self.subroutineType = self._eat(self.tokenizer.keyWord())
 
@@ -137,6 +169,7 @@ class CompilationEngine:
         while self.tokenizer.keyWord() == "var":
             self.compileVarDec()
 
+        self._mapSource(self.subroutineLine)
         self.writer.writeFunction(f"{self.className}.{self.subroutineName}", self.nLocalVars)
 
         if self.subroutineType == CONSTRUCTOR:
@@ -183,6 +216,7 @@ class CompilationEngine:
 
         statement = self.tokenizer.keyWord()
         while statement == LET or statement == IF or statement == WHILE or statement == DO or statement == RETURN:
+            self._mapSource(self.tokenizer.position()[0])
             if statement == LET:
                 self.compileLet()
             elif statement == IF:
@@ -234,16 +268,15 @@ class CompilationEngine:
     def compileIf(self):
         '''Compiles an if statement, possibly with a trailing else clause'''
 
+        line = self.tokenizer.position()[0]
         self._eat(IF)
         self._eat("(")
-        self.compileExpression()
+        condition = self._expression()
         self._eat(")")
 
-        self.writer.writeArithmetic(NOT)
-
         firstLabel = f"L{self.labelIndex}"
         self.labelIndex += 1
-        self.writer.writeIf(firstLabel)
+        self._writeJumpUnless(condition, firstLabel)
 
         self._eat("{")
         self.compileStatements()
@@ -251,6 +284,7 @@ class CompilationEngine:
 
         secondLabel = f"L{self.labelIndex}"
         self.labelIndex += 1
+        self._mapSource(line)   # the jumps and labels after the clauses are the if statement's
         self.writer.writeGoto(secondLabel)
 
         self.writer.writeLabel(firstLabel)
@@ -260,6 +294,7 @@ class CompilationEngine:
             self._eat("{")
             self.compileStatements()
             self._eat("}")
+            self._mapSource(line)
 
         self.writer.writeLabel(secondLabel)
 
@@ -271,21 +306,21 @@ class CompilationEngine:
         self.labelIndex += 1
         self.writer.writeLabel(firstLabel)
 
+        line = self.tokenizer.position()[0]
         self._eat(WHILE)
         self._eat("(")
-        self.compileExpression()
+        condition = self._expression()
         self._eat(")")
 
-        self.writer.writeArithmetic(NOT)
-
         secondLabel = f"L{self.labelIndex}"
         self.labelIndex += 1
-        self.writer.writeIf(secondLabel)
+        self._writeJumpUnless(condition, secondLabel)
 
         self._eat("{")
         self.compileStatements()
         self._eat("}")
 
+        self._mapSource(line)   # the jump back is the while statement's
         self.writer.writeGoto(firstLabel)
         self.writer.writeLabel(secondLabel)
 
@@ -315,40 +350,69 @@ class CompilationEngine:
         self._eat(";")
 
 
+    def _writeJumpUnless(self, condition, label):
+        '''Writes the code that jumps to the label if the condition (an expression tree) is false'''
+
+        condition = Ex.unary(NOT, condition)
+        if isinstance(condition, Ex.Constant):      # the condition is known, so the jump is either never or always taken
+            if condition.value:
+                self.writer.writeGoto(label)
+        else:
+            Ex.write(condition, self.writer)
+            self.writer.writeIf(label)
+
+
     def compileExpression(self):
         '''Compiles an expression'''
+        Ex.write(self._expression(), self.writer)
+
+
+    def _expression(self):
+        '''Returns the tree of an expression. The code of its terms that aren't constants is written into the tree'''
+
+        tree = self._term()
+
+        while self.tokenizer.tokenType() == Jt.SYMBOL and self.tokenizer.symbol() in BINARY_OPERATORS:
+            operator = BINARY_OPERATORS[self._eat(self.tokenizer.symbol())]
+            tree = Ex.binary(operator, tree, self._term())
 
-        self.compileTerm()
-
-        while self.tokenizer.tokenType() == Jt.SYMBOL and self.tokenizer.symbol() in ["+", "-", "*", "/", "&amp;", "|", "&lt;", "&gt;", "="]:    # adapted to comply with XML notations
-
-            operator = self._eat(self.tokenizer.symbol())
-            self.compileTerm()
-
-            if operator == "+":
-                self.writer.writeArithmetic(ADD)
-            elif operator == "-":
-                self.writer.writeArithmetic(SUB)
-            elif operator == "*":
-                self.writer.writeCall("Math.multiply", 2)
-            elif operator == "/":
-                self.writer.writeCall("Math.divide", 2)
-            elif operator == "/":
-                self.writer.writeCall("Math.divide", 2)
-            elif operator == "&amp;":
-                self.writer.writeArithmetic(AND)
-            elif operator == "|":
-                self.writer.writeArithmetic(OR)
-            elif operator == "&lt;":
-                self.writer.writeArithmetic(LT)
-            elif operator == "&gt;":
-                self.writer.writeArithmetic(GT)
-            elif operator == "=":
-                self.writer.writeArithmetic(EQ)
+        return tree
 
 
     def compileTerm(self):
         '''Compiles a term'''
+        Ex.write(self._term(), self.writer)
+
+
+    def _term(self):
+        '''Returns the tree of a term'''
+
+        tokenType = self.tokenizer.tokenType()
+
+        if tokenType == Jt.INT_CONST:   # term is a constant
+            return Ex.Constant(self._eat(self.tokenizer.intVal()))
+
+        elif tokenType == Jt.KEYWORD and self.tokenizer.keyWord() in ["true", "false", "null"]:  # term is a keyword constant
+            return Ex.Constant(-1 if self._eat(self.tokenizer.keyWord()) == "true" else 0)
+
+        elif tokenType == Jt.SYMBOL and self.tokenizer.symbol() == "(":   # term is "(exp)"
+            self._eat("(")
+            tree = self._expression()
+            self._eat(")")
+            return tree
+
+        elif tokenType == Jt.SYMBOL and self.tokenizer.symbol() in ["-", "~"]:   # term is "unaryOp term"
+            symbol = self._eat(self.tokenizer.symbol())
+            return Ex.unary(NEG if symbol == "-" else NOT, self._term())
+
+        # the term is computed at run time: its code is captured, to be written when the tree is written
+        self.writer.startCapture()
+        self._compileRunTimeTerm()
+        return Ex.Code(self.writer.endCapture())
+
+
+    def _compileRunTimeTerm(self):
+        '''Compiles a term that is a variable, an array entry, a subroutine call, a string constant or this'''
 
         if self.tokenizer.tokenType() == Jt.IDENTIFIER:
             name = self._eat(self.tokenizer.identifier())
@@ -414,10 +478,6 @@ class CompilationEngine:
                     index = self.classTable.indexOf(name)
                 self.writer.writePush(segment, index)
 
-        elif self.tokenizer.tokenType() == Jt.INT_CONST: # term is a constant
-            number = self._eat(self.tokenizer.intVal())
-            self.writer.writePush(CONSTANT, number)
-
         elif self.tokenizer.tokenType() == Jt.STRING_CONST:
             string = self._eat(self.tokenizer.stringVal())
             self.writer.writePush(CONSTANT, len(string))
@@ -427,34 +487,9 @@ class CompilationEngine:
                 self.writer.writePush(CONSTANT, ord(letter))
                 self.writer.writeCall("String.appendChar", 2)
 
-        elif self.tokenizer.tokenType() == Jt.KEYWORD:   # term is a keyword constant
-            constant = self._eat(self.tokenizer.keyWord())
-
-            if constant == "true":
-                self.writer.writePush(CONSTANT, 1)
-                self.writer.writeArithmetic(NEG)
-
-            elif constant == "false" or constant == "null":
-                self.writer.writePush(CONSTANT, 0)
-
-            elif constant == THIS:
-                self.writer.writePush(POINTER, 0)
-
-        elif self.tokenizer.tokenType() == Jt.SYMBOL:
-
-            if self.tokenizer.symbol() == "(":  # term is "(exp)"
-                self._eat("(")
-                self.compileExpression()
-                self._eat(")")
-
-            elif self.tokenizer.symbol() in ["-", "~"]: # term is "unaryOp term"
-                symbol = self._eat(self.tokenizer.symbol())
-                self.compileTerm()
-
-                if symbol == "-":
-                    self.writer.writeArithmetic(NEG)
-                else:
-                    self.writer.writeArithmetic(NOT)
+        elif self.tokenizer.tokenType() == Jt.KEYWORD:   # term is this
+            self._eat(THIS)
+            self.writer.writePush(POINTER, 0)
 
 
     def compileExpressionList(self):
@@ -474,25 +509,21 @@ class CompilationEngine:
         return numberOfExpressions
 
 
+    def _mapSource(self, line):
+        '''Maps the next VM command (and the ones after it, until the next call) to the given Jack line'''
+        if self.sourceMap is not None:
+            self.sourceMap.add(self.writer.commands + 1, self.sourceName, line, f"{self.className}.{self.subroutineName}")
+
+
     def _eat(self, str):
         '''Private function used to process the tokens'''
 
-        currentTokenType = self.tokenizer.tokenType()
-
-        # Set currentToken according to currentTokenType
-        if currentTokenType == Jt.KEYWORD:
-            currentToken = self.tokenizer.keyWord()
-        elif currentTokenType == Jt.SYMBOL:
-            currentToken = self.tokenizer.symbol()
-        elif currentTokenType == Jt.IDENTIFIER:
-            currentToken = self.tokenizer.identifier()
-        elif currentTokenType == Jt.INT_CONST:
-            currentToken = self.tokenizer.intVal()
-        elif currentTokenType == Jt.STRING_CONST:
-            currentToken = self.tokenizer.stringVal()
+        currentToken = self.tokenizer.value()
 
         if str != currentToken:
-            raise Exception("Error")    # consider changing the message
+            line, column = self.tokenizer.position()
+            expected = "a name" if str is None else repr(str)
+            raise ValueError(f"{self.tokenizer.fileName}:{line}:{column}: expected {expected}, found {currentToken!r}")
         else:
             self.tokenizer.advance()
             return currentToken
\ No newline at end of file
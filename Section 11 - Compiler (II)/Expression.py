@@ -0,0 +1,219 @@
+'''Expression trees, which the CompilationEngine builds before it writes the VM code of an expression.
+   The nodes are folded as they are created: constant subexpressions are computed at compile time,
+   multiplications by powers of two become additions, and identities such as x+0, x*1, x&true and ~~x are removed.
+   Operands are never dropped, since the code of a term may have side effects (a call)'''
+
+ADD = "add"
+SUB = "sub"
+NEG = "neg"
+EQ = "eq"
+GT = "gt"
+LT = "lt"
+AND = "and"
+OR = "or"
+NOT = "not"
+MULTIPLY = "Math.multiply"
+DIVIDE = "Math.divide"
+
+MIN_VALUE = -32768
+MAX_VALUE = 32767
+MAX_DOUBLINGS = 14      # x*2^k is computed by doubling x k times, for k up to this
+SCRATCH_INDEX = 1       # the temp entry used to double a value (temp 0 is used by let and do)
+
+
+def wrap(value):
+    '''Returns the given integer as a 16-bit two's complement value, as the Hack ALU computes it'''
+    return ((value - MIN_VALUE) & 0xFFFF) + MIN_VALUE
+
+
+class Constant:
+    '''A value known at compile time'''
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Code:
+    '''A term that is computed at run time (a variable, an array entry, a call, a string or this), with its VM code'''
+
+    def __init__(self, code):
+        self.code = code
+        self.isPush = code.count("\n") == 1 and code.startswith("push ")    # a single push, which can be repeated
+
+
+class Unary:
+    '''neg or not of an operand'''
+
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
+
+class Binary:
+    '''A binary operator (a VM command, or the Math function that computes it) on two operands'''
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+
+class Doubled:
+    '''An operand that is doubled a number of times, which is the operand multiplied by 2^times'''
+
+    def __init__(self, operand, times):
+        self.operand = operand
+        self.times = times
+
+
+def _constantValue(node):
+    '''Returns the value of a Constant node, or None for other nodes'''
+    return node.value if isinstance(node, Constant) else None
+
+
+def _powerOfTwo(value):
+    '''Returns k if value is 2^k for 0 < k <= MAX_DOUBLINGS, and None otherwise'''
+    if value is not None and value > 1 and value & (value - 1) == 0 and value.bit_length() - 1 <= MAX_DOUBLINGS:
+        return value.bit_length() - 1
+    return None
+
+
+def _compute(operator, x, y):
+    '''Returns the value of x operator y as the VM code would compute it, or None when it is left to run time'''
+    if operator == ADD:
+        return wrap(x + y)
+    elif operator == SUB:
+        return wrap(x - y)
+    elif operator == MULTIPLY:
+        return wrap(x * y)
+    elif operator == DIVIDE:
+        if y == 0 or x == MIN_VALUE or y == MIN_VALUE:  # division by zero is a run time error, abs(-32768) overflows
+            return None
+        quotient = abs(x) // abs(y)     # Math.divide rounds toward zero
+        return -quotient if (x < 0) != (y < 0) else quotient
+    elif operator == AND:
+        return x & y
+    elif operator == OR:
+        return x | y
+    elif operator == EQ:
+        return -1 if x == y else 0
+    elif MIN_VALUE <= x - y <= MAX_VALUE:      # lt and gt compare x-y with 0, so they are folded only when it doesn't overflow
+        return -1 if (x < y if operator == LT else x > y) else 0
+    return None
+
+
+def unary(operator, operand):
+    '''Returns the (folded) node of a unary operator on the given operand'''
+
+    value = _constantValue(operand)
+    if value is not None:
+        return Constant(wrap(-value) if operator == NEG else ~value)
+
+    if isinstance(operand, Unary) and operand.operator == operator:     # --x and ~~x
+        return operand.operand
+
+    return Unary(operator, operand)
+
+
+def binary(operator, left, right):
+    '''Returns the (folded) node of a binary operator on the given operands'''
+
+    x = _constantValue(left)
+    y = _constantValue(right)
+
+    if x is not None and y is not None:
+        value = _compute(operator, x, y)
+        if value is not None:
+            return Constant(value)
+
+    if operator == ADD:
+        if y == 0:
+            return left
+        if x == 0:
+            return right
+        if y is not None and y < 0 and y != MIN_VALUE:  # x+(-c) is x-c, which saves negating the constant
+            return Binary(SUB, left, Constant(-y))
+
+    elif operator == SUB:
+        if y == 0:
+            return left
+        if x == 0:
+            return unary(NEG, right)
+        if y is not None and y < 0 and y != MIN_VALUE:
+            return Binary(ADD, left, Constant(-y))
+
+    elif operator == MULTIPLY:
+        if x is not None and y is None:     # a constant has no side effects, so the operands can be swapped
+            left, right, x, y = right, left, y, x
+        if y == 1:
+            return left
+        if y == -1:
+            return unary(NEG, left)
+        if _powerOfTwo(y) is not None:
+            if isinstance(left, Doubled):
+                return Doubled(left.operand, left.times + _powerOfTwo(y))
+            return Doubled(left, _powerOfTwo(y))
+        if y is not None and _powerOfTwo(-y) is not None:
+            return unary(NEG, Doubled(left, _powerOfTwo(-y)))
+
+    elif operator == DIVIDE:        # x/2^k rounds toward zero, which isn't a shift, so it is left to Math.divide
+        if y == 1:
+            return left
+        if y == -1:
+            return unary(NEG, left)
+
+    elif operator == AND:
+        if y == -1:
+            return left
+        if x == -1:
+            return right
+
+    elif operator == OR:
+        if y == 0:
+            return left
+        if x == 0:
+            return right
+
+    return Binary(operator, left, right)
+
+
+def write(node, writer):
+    '''Writes the VM code of the given tree with the given VMWriter'''
+
+    if isinstance(node, Constant):
+        if node.value >= 0:
+            writer.writePush("constant", node.value)
+        else:                                           # -n is ~(n-1), and n-1 fits in a push constant
+            writer.writePush("constant", -node.value - 1)
+            writer.writeArithmetic(NOT)
+
+    elif isinstance(node, Code):
+        writer.writeCode(node.code)
+
+    elif isinstance(node, Unary):
+        write(node.operand, writer)
+        writer.writeArithmetic(node.operator)
+
+    elif isinstance(node, Binary):
+        write(node.left, writer)
+        write(node.right, writer)
+        if node.operator == MULTIPLY or node.operator == DIVIDE:
+            writer.writeCall(node.operator, 2)
+        else:
+            writer.writeArithmetic(node.operator)
+
+    elif isinstance(node, Doubled):
+        operand = node.operand
+        times = node.times
+        if isinstance(operand, Code) and operand.isPush:   # x+x, without a copy of x
+            writer.writeCode(operand.code)
+            writer.writeCode(operand.code)
+            writer.writeArithmetic(ADD)
+            times -= 1
+        else:
+            write(operand, writer)
+        for _ in range(times):
+            writer.writePop("temp", SCRATCH_INDEX)
+            writer.writePush("temp", SCRATCH_INDEX)
+            writer.writePush("temp", SCRATCH_INDEX)
+            writer.writeArithmetic(ADD)
\ No newline at end of file
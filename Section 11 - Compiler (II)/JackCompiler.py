@@ -1,26 +1,128 @@
 import sys
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import CompilationEngine as Ce
+import BuildCache as Bc
+# Instrumentation and SourceMap are shared by the sections: they are in the Toolchain directory
+TOOLCHAIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Toolchain")
+if TOOLCHAIN_DIRECTORY not in sys.path:
+    sys.path.append(TOOLCHAIN_DIRECTORY)
+import Instrumentation
+import SourceMap
+
+
+def jackFiles(inputPath):
+    '''Returns the .jack files of the input path (the file itself, or the .jack files in the directory), sorted'''
+    if os.path.isdir(inputPath):
+        return [os.path.join(inputPath, file) for file in sorted(os.listdir(inputPath)) if file.endswith(".jack")]
+    return [inputPath]
+
+
+def compileFile(inputFile, instrumentation=None, sourceMap=False):
+    '''Compiles a single .jack file into a VM file, and with sourceMap, writes the map of its lines to the Jack lines.
+       Returns the file, the compilation time in seconds and the error message (None if it compiled).
+       Any exception is reported as the file's error, so it doesn't stop the compilation of the other files'''
+
+    start = time.perf_counter()
+    try:
+        fileMap = SourceMap.SourceMap() if sourceMap else None
+        compilationEngine = Ce.CompilationEngine(inputFile, instrumentation=instrumentation, sourceMap=fileMap)
+        compilationEngine.compileClass()
+        if fileMap is not None:
+            fileMap.write(Bc.mapFileName(inputFile))
+        error = None
+    except (ValueError, OSError) as exception:
+        error = str(exception)
+    except Exception as exception:      # a bug of the compiler: reported under the file's name, and the other files still compile
+        error = f"{inputFile}: internal error: {type(exception).__name__}: {exception}"
+    return inputFile, time.perf_counter() - start, error
+
+
+def _compileInProcess(inputFile, instrument, sourceMap):
+    '''Compiles a file in a worker process, and returns its compileFile result and its Instrumentation (or None)'''
+    instrumentation = Instrumentation.Instrumentation() if instrument else None
+    return compileFile(inputFile, instrumentation, sourceMap), instrumentation
+
+
+def compileFiles(inputFiles, jobs=1, cache=None, instrumentation=None, sourceMaps=False):
+    '''Compiles the given files, each in its own process when jobs > 1, and returns their compileFile results in order.
+       With a BuildCache, the files that are in it are restored from it instead, and the others are added to it.
+       instrumentation (an Instrumentation) gets the timings and the counters of the stages.
+       With sourceMaps, the source map of each VM file is written next to it'''
+
+    results = {}
+    keys = {}
+    for inputFile in inputFiles:
+        if cache is not None:
+            start = time.perf_counter()
+            keys[inputFile] = key = cache.key(inputFile)
+            if key is not None and cache.restore(key, inputFile):
+                results[inputFile] = (inputFile, time.perf_counter() - start, None)
+                if instrumentation is not None:
+                    instrumentation.addTime("cache", inputFile, results[inputFile][1])
+                    instrumentation.count("cache", inputFile, "hits")
+
+    missing = [inputFile for inputFile in inputFiles if inputFile not in results]
+    if jobs <= 1 or len(missing) <= 1:
+        compiled = [compileFile(inputFile, instrumentation, sourceMaps) for inputFile in missing]
+    else:
+        # each process has its own Instrumentation, whose records are added to the given one
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            compiled = []
+            for result, fileInstrumentation in executor.map(_compileInProcess, missing, [instrumentation is not None] * len(missing),
+                                                            [sourceMaps] * len(missing)):
+                compiled.append(result)
+                if instrumentation is not None:
+                    instrumentation.merge(fileInstrumentation)
+
+    for inputFile, seconds, error in compiled:
+        results[inputFile] = (inputFile, seconds, error)
+        if cache is not None and error is None and keys[inputFile] is not None:
+            cache.store(keys[inputFile], inputFile)
+    if cache is not None:
+        cache.save()
+
+    return [results[inputFile] for inputFile in inputFiles]
+
 
 class JackAnalyzer:
     '''Creates a CompilationEngine object from the input file and calls compileClass to start the compilation'''
 
-    def run(inputPath):
-        '''Determines wheter the input path is a file or a directiory and creates VM file/s accordingly'''
+    @staticmethod
+    def run(inputPath, jobs=1, useCache=True, instrumentation=None, sourceMaps=False):
+        '''Determines wheter the input path is a file or a directiory and creates VM file/s accordingly.
+           Unless useCache is False, unchanged classes are restored from the build cache of the directory'''
+        cache = None
+        if useCache:
+            cache = Bc.BuildCache(inputPath if os.path.isdir(inputPath) else os.path.dirname(inputPath) or ".", sourceMaps=sourceMaps)
+        return compileFiles(jackFiles(inputPath), jobs, cache, instrumentation, sourceMaps)
 
-        # If the input is a directory, compile each .jack file in it
-        if os.path.isdir(inputPath):
-            for file in os.listdir(inputPath):
-                if file.endswith(".jack"):
-                    inputFile = os.path.join(inputPath, file)
-                    compilationEngine = Ce.CompilationEngine(inputFile)
-                    compilationEngine.compileClass()
 
-        else:
-            compilationEngine = Ce.CompilationEngine(inputPath)
-            compilationEngine.compileClass()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles a .jack file, or the .jack files in a directory, into VM files")
+    parser.add_argument("inputPath")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes that compile the files (default: 1)")
+    parser.add_argument("--timings", action="store_true", help="print the compilation time of each file")
+    parser.add_argument("--no-cache", action="store_true", help=f"compile every file, without the {Bc.CACHE_DIRECTORY} build cache")
+    parser.add_argument("--report", help="write the timings and the counters of each stage and file to this file (.json or .csv)")
+    parser.add_argument("--source-map", action="store_true", help=f"write the map of each VM file's lines to the Jack lines (Main.vm{SourceMap.EXTENSION})")
+    args = parser.parse_args()
 
+    instrumentation = Instrumentation.Instrumentation() if args.report else None
+    start = time.perf_counter()
+    results = JackAnalyzer.run(args.inputPath, args.jobs, not args.no_cache, instrumentation, args.source_map)
+    errors = 0
+    for inputFile, seconds, error in results:
+        if error is not None:
+            errors += 1
+            print(error, file=sys.stderr)
+        elif args.timings:
+            print(f"{seconds * 1000:9.1f} ms  {inputFile}")
 
-    if __name__ == "__main__":
-        run(sys.argv[1])
-        string = "   "
\ No newline at end of file
+    if args.timings or errors:
+        print(f"{len(results) - errors} of {len(results)} files compiled in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+    if instrumentation is not None:
+        instrumentation.writeReport(args.report)
+    sys.exit(1 if errors else 0)
\ No newline at end of file
@@ -1,46 +1,95 @@
+import io
+import os
+
+
 class VMWriter:
     '''Emits VM commands into a file, using the VM command syntax'''
     
-    def __init__(self, fileName):
-        '''Creates a new file and prepares it for writing'''
-        self.output = open(fileName.rpartition(".")[0] + ".vm", "w")
+    def __init__(self, fileName, output=None):
+        '''Creates a new file and prepares it for writing.
+           The commands are written to a temporary file, which replaces the .vm file when it is closed,
+           or to the given output (a text stream), which is left open'''
+        self.fileName = fileName.rpartition(".")[0] + ".vm"
+        self.temporaryName = None
+        self.output = output
+        if output is None:
+            self.temporaryName = f"{self.fileName}.{os.getpid()}.tmp"
+            self.output = open(self.temporaryName, "w")
+        self.outputs = []   # the outputs to go back to when the current capture ends
+        self.commands = 0   # the number of commands written to the output (not counting captured ones)
+
+    def startCapture(self):
+        '''Starts collecting the written commands, instead of writing them to the file'''
+        self.outputs.append(self.output)
+        self.output = io.StringIO()
+
+    def endCapture(self):
+        '''Ends the current capture, and returns the commands that were written since it started'''
+        code = self.output.getvalue()
+        self.output = self.outputs.pop()
+        self.commands -= code.count("\n")     # they are counted again if they are written
+        return code
+
+    def writeCode(self, code):
+        '''Writes VM commands that were captured before'''
+        self.commands += code.count("\n")
+        self.output.write(code)
 
     def writePush(self, segment, index):
         '''Writes a VM push command'''
+        self.commands += 1
         self.output.write(f"push {segment} {index}\n")
 
     def writePop(self, segment, index):
         '''Writes a VM pop command'''
+        self.commands += 1
         self.output.write(f"pop {segment} {index}\n")
     
     def writeArithmetic(self, command):
         '''Writes a VM arithmetic command'''
+        self.commands += 1
         self.output.write(f"{command}\n")
 
     def writeLabel(self, label):
         '''Writes a VM label command'''
+        self.commands += 1
         self.output.write(f"label {label}\n")
 
     def writeGoto(self, label):
         '''Writes a VM goto command'''
+        self.commands += 1
         self.output.write(f"goto {label}\n")
 
     def writeIf(self, label):
         '''Writes a VM if-goto command'''
+        self.commands += 1
         self.output.write(f"if-goto {label}\n")
 
     def writeCall(self, name, nVars):
         '''Writes a VM call command'''
+        self.commands += 1
         self.output.write(f"call {name} {nVars}\n")
 
     def writeFunction(self, name, nVars):
         '''Writes a VM function command'''
+        self.commands += 1
         self.output.write(f"function {name} {nVars}\n")
 
     def writeReturn(self):
         '''Writes a VM return command'''
+        self.commands += 1
         self.output.write("return\n")
 
     def close(self):
         '''Closes the output file'''
-        self.output.close()
\ No newline at end of file
+        if self.temporaryName is not None:
+            self.output.close()
+            os.replace(self.temporaryName, self.fileName)
+
+    def discard(self):
+        '''Closes and deletes the output file, leaving the previous .vm file (if any) as it was'''
+        while self.outputs:     # an error in the middle of a captured term
+            self.output = self.outputs.pop()
+        if self.temporaryName is not None:
+            self.output.close()
+            os.remove(self.temporaryName)
\ No newline at end of file
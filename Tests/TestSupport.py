@@ -0,0 +1,92 @@
+'''Helpers of the tests: builds the test programs with the toolchain and the command lines of the stages, runs them
+   in the emulator, and runs their VM code in the VM interpreter, which the translated programs are checked against'''
+
+import os
+import sys
+import itertools
+import subprocess
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIRECTORY), "Toolchain"))
+import JackToolchain
+import JackTokenizer
+import ObjectStore
+import SourceMap
+
+FIB_DIRECTORY = os.path.join(TESTS_DIRECTORY, "Fib")    # Main.jack, and the .vm files of the functions of the OS it uses
+RESULT_ADDRESS = 6      # Sys.init pops the result of Main.main to temp 1
+MAX_CYCLES = 10_000_000
+MAX_STEPS = 10_000_000
+
+# The translator's options that change its code: sharedCalls, optimize and cacheTop
+TRANSLATOR_OPTIONS = list(itertools.product([False, True], repeat=3))
+
+assembler = JackToolchain.loadSection(JackToolchain.ASSEMBLER_DIRECTORY, ["HackEmulator", "HackMemory", "HackBinary", "HackProfiler"])
+translator = JackToolchain.loadSection(JackToolchain.TRANSLATOR_DIRECTORY, ["VMTranslator", "PeepholeOptimizer", "FragmentCache", "VMInterpreter"])
+compiler = JackToolchain.loadSection(JackToolchain.COMPILER_DIRECTORY, ["JackCompiler", "CompilationEngine", "Expression", "BuildCache"])
+HackEmulator = assembler["HackEmulator"]
+HackMemory = assembler["HackMemory"]
+HackBinary = assembler["HackBinary"]
+HackProfiler = assembler["HackProfiler"]
+VMTranslator = translator["VMTranslator"]
+PeepholeOptimizer = translator["PeepholeOptimizer"]
+FragmentCache = translator["FragmentCache"]
+VMInterpreter = translator["VMInterpreter"]
+JackCompiler = compiler["JackCompiler"]
+CompilationEngine = compiler["CompilationEngine"]
+Expression = compiler["Expression"]
+BuildCache = compiler["BuildCache"]
+
+
+def optionsName(sharedCalls, optimize, cacheTop):
+    '''Names a combination of the translator's options, as the command line gives them'''
+    flags = [flag for flag, given in (("--shared-calls", sharedCalls), ("--optimize", optimize), ("--cache-top", cacheTop)) if given]
+    return " ".join(flags) or "no options"
+
+
+def build(directory, sharedCalls=False, optimize=False, cacheTop=False):
+    '''Builds a program with the toolchain, and returns its words and the labels of its assembly code'''
+    toolchain = JackToolchain.JackToolchain(sharedCalls, optimize, cacheTop)
+    vmSources = []
+    for fileName, source in sorted(JackToolchain.readSources(directory).items()):
+        name, extension = os.path.splitext(os.path.basename(fileName))
+        vmSources.append((name + ".vm", toolchain.compileClass(fileName, source) if extension == ".jack" else source))
+    assemblyCode = toolchain.translate(vmSources)
+    labels = toolchain.assemblyParser.parseProgram(assemblyCode.splitlines())[1]
+    return HackBinary.toWords(toolchain.assemble(assemblyCode)), labels
+
+
+def runStage(directory, script, *arguments):
+    '''Runs the command line of a stage (a script in a section's directory), and returns its output'''
+    return subprocess.run([sys.executable, os.path.join(directory, script), *arguments],
+                          check=True, capture_output=True, text=True).stdout
+
+
+def compileProgram(directory, outputDirectory):
+    '''Compiles the .jack files of a directory into outputDirectory, with a copy of its .vm files'''
+    toolchain = JackToolchain.JackToolchain()
+    for fileName, source in JackToolchain.readSources(directory).items():
+        name, extension = os.path.splitext(os.path.basename(fileName))
+        with open(os.path.join(outputDirectory, name + ".vm"), "w") as output:
+            output.write(toolchain.compileClass(fileName, source) if extension == ".jack" else source)
+
+
+def assemble(assemblyCode):
+    '''Assembles a program, and returns its words'''
+    return HackBinary.toWords(JackToolchain.JackToolchain().assemble(assemblyCode))
+
+
+def emulate(words, compileBlocks=True):
+    '''Runs a program in the emulator until it halts, and returns the emulator'''
+    emulator = HackEmulator.HackEmulator(words, compileBlocks)
+    emulator.run(MAX_CYCLES)
+    assert emulator.halted, f"the program didn't halt in {MAX_CYCLES} cycles"
+    return emulator
+
+
+def interpret(vmPath):
+    '''Runs a .vm file or the .vm files of a directory in the VM interpreter until they halt, and returns the interpreter'''
+    interpreter = VMInterpreter.VMInterpreter(VMInterpreter.VMProgram(vmPath))
+    interpreter.run(MAX_STEPS)
+    assert interpreter.halted, f"the program didn't halt in {MAX_STEPS} steps"
+    return interpreter
\ No newline at end of file
@@ -0,0 +1,82 @@
+'''Tests of HackBinary: the words written in each format are read back as they were, and broken files are rejected'''
+
+import os
+import array
+import shutil
+import tempfile
+import unittest
+import TestSupport
+
+HackBinary = TestSupport.HackBinary
+
+WORDS = array.array("H", [0, 1, 0x7FFF, 0x8000, 0xEC10, 0xFFFF, 0x1234])
+
+
+class BinaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fileName(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_raw_round_trip(self):
+        for byteOrder in (HackBinary.LITTLE, HackBinary.BIG):
+            with self.subTest(byteOrder):
+                fileName = self.fileName(f"Prog.{byteOrder}.bin")
+                HackBinary.writeRaw(fileName, WORDS, byteOrder)
+                with open(fileName, "rb") as input:
+                    data = input.read()
+                self.assertEqual(data[:4], b"\x00\x00\x01\x00" if byteOrder == HackBinary.LITTLE else b"\x00\x00\x00\x01")
+                self.assertEqual(list(HackBinary.readRaw(fileName, byteOrder)), list(WORDS))
+                self.assertEqual(list(HackBinary.readProgram(fileName, byteOrder)), list(WORDS))
+
+    def test_raw_truncated(self):
+        fileName = self.fileName("Prog.bin")
+        HackBinary.writeRaw(fileName, WORDS)
+        with open(fileName, "ab") as output:
+            output.write(b"\x01")
+        with self.assertRaises(ValueError):
+            HackBinary.readRaw(fileName)
+
+    def test_hackbin_round_trip(self):
+        fileName = self.fileName("Prog.hackbin")
+        HackBinary.writeHackBin(fileName, WORDS)
+        with open(fileName, "rb") as input:
+            data = input.read()
+        self.assertEqual(HackBinary.HACKBIN_HEADER.unpack_from(data),
+                         (HackBinary.HACKBIN_MAGIC, HackBinary.HACKBIN_VERSION, 0, len(WORDS)))
+        self.assertEqual(len(data), HackBinary.HACKBIN_HEADER.size + 2 * len(WORDS))
+        self.assertEqual(list(HackBinary.readHackBin(fileName)), list(WORDS))
+        self.assertEqual(list(HackBinary.readProgram(fileName)), list(WORDS))
+
+    def test_hackbin_broken(self):
+        fileName = self.fileName("Prog.hackbin")
+        HackBinary.writeHackBin(fileName, WORDS)
+        with open(fileName, "rb") as input:
+            data = input.read()
+        header = HackBinary.HACKBIN_HEADER.size
+        broken = {"magic": b"HACKBIX\0" + data[8:],
+                  "version": data[:8] + b"\x02\x00" + data[10:],
+                  "truncated words": data[:-1],
+                  "truncated header": data[:header - 1],
+                  "empty": b""}
+        for name, brokenData in broken.items():
+            with self.subTest(name):
+                with open(fileName, "wb") as output:
+                    output.write(brokenData)
+                with self.assertRaises(ValueError):
+                    HackBinary.readHackBin(fileName)
+
+    def test_hack_round_trip(self):
+        fileName = self.fileName("Prog.hack")
+        with open(fileName, "w") as output:
+            output.write("".join(f"{word:016b}\n" for word in WORDS))
+        self.assertEqual(list(HackBinary.readProgram(fileName)), list(WORDS))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,56 @@
+'''Tests of the Jack compiler's command line: the VM code is the same in one or more processes and from its build cache,
+   and an error of the compiler on a file is reported under the file's name'''
+
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import TestSupport
+
+COMPILER_DIRECTORY = TestSupport.JackToolchain.COMPILER_DIRECTORY
+CARS_DIRECTORY = os.path.join(TestSupport.JackToolchain.ROOT_DIRECTORY, 'Section 09 - "Cars" Game')
+
+
+class CompilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cars = os.path.join(self.directory, "Cars")
+        os.mkdir(self.cars)
+        for fileName in glob.glob(os.path.join(CARS_DIRECTORY, "*.jack")):
+            shutil.copy(fileName, self.cars)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile(self, *arguments):
+        '''Compiles the Cars classes with the command line of the compiler, and returns their VM code by file name'''
+        for fileName in glob.glob(os.path.join(self.cars, "*.vm")):
+            os.remove(fileName)
+        TestSupport.runStage(COMPILER_DIRECTORY, "JackCompiler.py", self.cars, *arguments)
+        code = {}
+        for fileName in glob.glob(os.path.join(self.cars, "*.vm")):
+            with open(fileName, "r") as input:
+                code[os.path.basename(fileName)] = input.read()
+        return code
+
+    def test_jobs_and_cache_compile_the_same_code(self):
+        expected = self.compile("--no-cache")
+        self.assertEqual(len(expected), len(glob.glob(os.path.join(self.cars, "*.jack"))))
+        self.assertEqual(self.compile("--no-cache", "--jobs", "2"), expected)
+        self.assertEqual(self.compile("--jobs", "2"), expected)    # not cached yet
+        self.assertEqual(self.compile(), expected)                  # cached
+
+    def test_internal_errors_are_reported_per_file(self):
+        inputFiles = TestSupport.JackCompiler.jackFiles(self.cars)
+        with mock.patch.object(TestSupport.CompilationEngine.CompilationEngine, "compileClass", side_effect=KeyError("class")):
+            results = TestSupport.JackCompiler.compileFiles(inputFiles)
+        self.assertEqual([inputFile for inputFile, _, _ in results], inputFiles)
+        for inputFile, _, error in results:
+            self.assertTrue(error.startswith(f"{inputFile}: internal error: KeyError"), error)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+'''Tests of HackEmulator: the Section 04 programs, assembled, leave the RAM as their specifications say, the compiled
+   blocks run a program to the same state as its instructions, and only the blocks of the last ROMs are kept'''
+
+import os
+import unittest
+import TestSupport
+
+PROGRAMS_DIRECTORY = os.path.join(TestSupport.JackToolchain.ROOT_DIRECTORY, "Section 04 - Assembly Programs")
+HackMemory = TestSupport.HackMemory
+FILL_CYCLES = 200_000   # Fill takes about 100000 instructions to fill or clear the screen, and never halts
+
+
+def assembleProgram(name):
+    '''Assembles a program of Section 04, and returns its words'''
+    with open(os.path.join(PROGRAMS_DIRECTORY, name), "r") as input:
+        return TestSupport.assemble(input.read())
+
+
+class EmulatorTest(unittest.TestCase):
+
+    def test_mult(self):
+        words = assembleProgram("Mult.asm")
+        for r0, r1 in ((0, 5), (3, 0), (1, 1), (7, 9), (181, 181), (2, 16383)):
+            for compileBlocks in (False, True):
+                with self.subTest(r0=r0, r1=r1, compileBlocks=compileBlocks):
+                    emulator = TestSupport.HackEmulator.HackEmulator(words, compileBlocks)
+                    emulator.ram[0], emulator.ram[1], emulator.ram[2] = r0, r1, -1
+                    emulator.run(TestSupport.MAX_CYCLES)
+                    self.assertTrue(emulator.halted)
+                    self.assertEqual(emulator.ram[2], r0 * r1)
+                    self.assertEqual((emulator.ram[0], emulator.ram[1]), (r0, 0) if r0 and r1 else (r0, r1))
+
+    def test_fill(self):
+        words = assembleProgram("Fill.asm")
+        for compileBlocks in (False, True):
+            with self.subTest(compileBlocks=compileBlocks):
+                emulator = TestSupport.HackEmulator.HackEmulator(words, compileBlocks)
+                emulator.memory.setKey(ord("A"))
+                emulator.run(FILL_CYCLES)
+                self.assertFalse(emulator.halted)
+                self.assertEqual(set(emulator.memory.screen()), {-1})
+                self.assertEqual(emulator.memory.takeDirtyWords(), set(range(HackMemory.SCREEN_WORDS)))
+
+                emulator.memory.setKey(0)
+                emulator.run(FILL_CYCLES)
+                self.assertEqual(set(emulator.memory.screen()), {0})
+
+    def test_blocks_run_as_instructions(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            with self.subTest(TestSupport.optionsName(*options)):
+                words, _ = TestSupport.build(TestSupport.FIB_DIRECTORY, *options)
+                instructions = TestSupport.emulate(words, compileBlocks=False)
+                blocks = TestSupport.emulate(words, compileBlocks=True)
+                self.assertEqual((blocks.pc, blocks.a, blocks.d, blocks.cycles),
+                                 (instructions.pc, instructions.a, instructions.d, instructions.cycles))
+                self.assertEqual(blocks.ram, instructions.ram)
+
+    def test_compiled_blocks_are_bounded(self):
+        HackEmulator = TestSupport.HackEmulator
+        words = assembleProgram("Mult.asm")
+        first = HackEmulator.BlockCompiler(*HackEmulator.predecode(words)).blocks
+        self.assertIs(HackEmulator.BlockCompiler(*HackEmulator.predecode(words)).blocks, first)
+        for padding in range(1, HackEmulator.MAX_COMPILED_ROMS + 1):
+            HackEmulator.BlockCompiler(*HackEmulator.predecode(list(words) + [0] * padding))
+            self.assertLessEqual(len(HackEmulator._compiledBlocks), HackEmulator.MAX_COMPILED_ROMS)
+        self.assertIsNot(HackEmulator.BlockCompiler(*HackEmulator.predecode(words)).blocks, first)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,152 @@
+'''Tests of the folding of expressions: constants are computed as the VM code would compute them, comparisons that
+   overflow are left to run time, multiplications by powers of two compute what Math.multiply computes, and a program
+   compiled with folding runs in the VM interpreter to the same results as without it'''
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import TestSupport
+
+Ex = TestSupport.Expression
+RESULTS = 1000      # the RAM address where the test program stores its results
+
+# Stores x times powers of two, as multiplications that are folded and as calls of Math.multiply, for some values of x,
+# and the values of constant expressions that are folded
+PROGRAM = """class Main {
+    function void multiply(int at, int x) {
+        var Array m;
+        let m = 0;
+        let m[at] = x * 8;
+        let m[at + 1] = 8 * x;
+        let m[at + 2] = Math.multiply(x, 8);
+        let m[at + 3] = x * 16384;
+        let m[at + 4] = Math.multiply(x, 16384);
+        let m[at + 5] = (x * 2) * 4;
+        let m[at + 6] = x * -4;
+        let m[at + 7] = Math.multiply(x, -4);
+        let m[at + 8] = x + x * 2;
+        let m[at + 9] = Math.multiply(x + x, 2);
+        return;
+    }
+
+    function int main() {
+        var Array m;
+        let m = 0;
+        do Main.multiply(1000, 3);
+        do Main.multiply(1010, -5);
+        do Main.multiply(1020, 4097);
+        do Main.multiply(1030, -32767 - 1);
+        do Main.multiply(1040, 32767);
+        let m[1050] = 7 / -2;
+        let m[1051] = -7 / 2;
+        let m[1052] = -7 / -2;
+        let m[1053] = 32767 + 1;
+        let m[1054] = (-32767 - 1) - 1;
+        let m[1055] = 200 * 200;
+        let m[1056] = 32767 > -1;
+        let m[1057] = (-32767 - 1) < 1;
+        let m[1058] = -(-32767 - 1);
+        return 0;
+    }
+}
+"""
+MULTIPLIED = [3, -5, 4097, -32768, 32767]
+CONSTANTS = [-3, -3, 3, -32768, 32767, Ex.wrap(40000)]
+
+
+def code(name):
+    '''Returns the node of a local variable'''
+    return Ex.Code(f"push local {name}\n")
+
+
+class ExpressionTest(unittest.TestCase):
+
+    def test_division_rounds_toward_zero(self):
+        for x, y, quotient in ((7, 2, 3), (-7, 2, -3), (7, -2, -3), (-7, -2, 3), (-1, 2, 0), (32767, -1, -32767)):
+            with self.subTest(x=x, y=y):
+                self.assertEqual(Ex.binary(Ex.DIVIDE, Ex.Constant(x), Ex.Constant(y)).value, quotient)
+        for x, y in ((1, 0), (-32768, 2), (-32768, 3), (5, -32768)):    # left to run time
+            with self.subTest(x=x, y=y):
+                self.assertIsInstance(Ex.binary(Ex.DIVIDE, Ex.Constant(x), Ex.Constant(y)), Ex.Binary)
+
+    def test_values_wrap_around(self):
+        self.assertEqual(Ex.wrap(32768), -32768)
+        self.assertEqual(Ex.wrap(-32769), 32767)
+        self.assertEqual(Ex.wrap(65536), 0)
+        self.assertEqual(Ex.binary(Ex.ADD, Ex.Constant(32767), Ex.Constant(1)).value, -32768)
+        self.assertEqual(Ex.binary(Ex.SUB, Ex.Constant(-32768), Ex.Constant(1)).value, 32767)
+        self.assertEqual(Ex.binary(Ex.MULTIPLY, Ex.Constant(256), Ex.Constant(128)).value, -32768)
+        self.assertEqual(Ex.binary(Ex.MULTIPLY, Ex.Constant(-32768), Ex.Constant(-1)).value, -32768)
+        self.assertEqual(Ex.unary(Ex.NEG, Ex.Constant(-32768)).value, -32768)
+        self.assertEqual(Ex.unary(Ex.NOT, Ex.Constant(0)).value, -1)
+
+    def test_comparisons_that_overflow_are_not_folded(self):
+        for operator, x, y in ((Ex.GT, 32767, -1), (Ex.LT, -32768, 1), (Ex.GT, -2, 32767), (Ex.LT, 16384, -16385)):
+            with self.subTest(operator=operator, x=x, y=y):
+                self.assertIsInstance(Ex.binary(operator, Ex.Constant(x), Ex.Constant(y)), Ex.Binary)
+        for operator, x, y, value in ((Ex.GT, 32767, 0, -1), (Ex.LT, -16384, 16383, -1), (Ex.GT, -32768, -1, 0),
+                                      (Ex.LT, 5, 5, 0), (Ex.EQ, -32768, -32768, -1)):
+            with self.subTest(operator=operator, x=x, y=y):
+                self.assertEqual(Ex.binary(operator, Ex.Constant(x), Ex.Constant(y)).value, value)
+
+    def test_multiplications_by_powers_of_two_are_doubled(self):
+        x = code(0)
+        for left, right in ((x, Ex.Constant(8)), (Ex.Constant(8), x)):
+            node = Ex.binary(Ex.MULTIPLY, left, right)
+            self.assertIsInstance(node, Ex.Doubled)
+            self.assertEqual((node.operand, node.times), (x, 3))
+        node = Ex.binary(Ex.MULTIPLY, Ex.binary(Ex.MULTIPLY, x, Ex.Constant(2)), Ex.Constant(4))
+        self.assertEqual((node.operand, node.times), (x, 3))
+        self.assertEqual(Ex.binary(Ex.MULTIPLY, x, Ex.Constant(16384)).times, Ex.MAX_DOUBLINGS)
+        negated = Ex.binary(Ex.MULTIPLY, x, Ex.Constant(-4))
+        self.assertIsInstance(negated, Ex.Unary)
+        self.assertEqual((negated.operator, negated.operand.times), (Ex.NEG, 2))
+        for y in (3, 6, 0, -32768):
+            self.assertIsInstance(Ex.binary(Ex.MULTIPLY, x, Ex.Constant(y)), Ex.Binary)
+
+
+class FoldedProgramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compileAndInterpret(self, name):
+        '''Compiles the test program, runs it with the OS functions of the Fib program, and returns its VM code and RAM'''
+        programDirectory = os.path.join(self.directory, name)
+        os.mkdir(programDirectory)
+        for fileName in ("Sys.vm", "Math.vm"):
+            shutil.copy(os.path.join(TestSupport.FIB_DIRECTORY, fileName), programDirectory)
+        output = io.StringIO()
+        TestSupport.CompilationEngine.CompilationEngine("Main.jack", PROGRAM, output).compileClass()
+        with open(os.path.join(programDirectory, "Main.vm"), "w") as vmFile:
+            vmFile.write(output.getvalue())
+        return output.getvalue(), [Ex.wrap(word) for word in TestSupport.interpret(programDirectory).ram]
+
+    def test_folded_program_runs_as_unfolded(self):
+        foldedCode, folded = self.compileAndInterpret("Folded")
+        with mock.patch.object(Ex, "binary", Ex.Binary), mock.patch.object(Ex, "unary", Ex.Unary):
+            unfoldedCode, unfolded = self.compileAndInterpret("Unfolded")
+        self.assertLess(foldedCode.count("call Math.multiply"), unfoldedCode.count("call Math.multiply"))
+        self.assertNotIn("call Math.divide", foldedCode)
+
+        results = slice(RESULTS, RESULTS + 10 * len(MULTIPLIED) + 9)
+        self.assertEqual(folded[results], unfolded[results])
+        self.assertEqual(folded[TestSupport.RESULT_ADDRESS], unfolded[TestSupport.RESULT_ADDRESS])
+
+        for index, x in enumerate(MULTIPLIED):
+            with self.subTest(x=x):
+                at = RESULTS + 10 * index
+                self.assertEqual(folded[at:at + 10], [Ex.wrap(x * 8)] * 3 + [Ex.wrap(x * 16384)] * 2 + [Ex.wrap(x * 8)]
+                                 + [Ex.wrap(x * -4)] * 2 + [Ex.wrap(x * 4)] * 2)
+        at = RESULTS + 10 * len(MULTIPLIED)
+        self.assertEqual(folded[at:at + len(CONSTANTS)], CONSTANTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+'''Tests of HackMemory: the screen words written are tracked by word and by row, and the frame draws them into
+   the PNG image with pixel 0 of a word leftmost and the set bits black'''
+
+import zlib
+import struct
+import unittest
+import TestSupport
+
+HackMemory = TestSupport.HackMemory
+
+
+def pngPixels(png):
+    '''Decodes the PNG image of a ScreenFrame, and returns its rows of pixels (1 for white)'''
+    data = b""
+    position = 8
+    while position < len(png):
+        length, chunkType = struct.unpack_from(">I4s", png, position)
+        if chunkType == b"IHDR":
+            header = struct.unpack_from(">IIBBBBB", png, position + 8)
+        elif chunkType == b"IDAT":
+            data += png[position + 8:position + 8 + length]
+        position += 12 + length
+    width, height, bitDepth, colorType = header[:4]
+    assert (width, height, bitDepth, colorType) == (HackMemory.SCREEN_COLUMNS, HackMemory.SCREEN_ROWS, 1, 0)
+    image = zlib.decompress(data)
+    rowSize = 1 + width // 8
+    rows = []
+    for row in range(height):
+        rowBytes = image[row * rowSize:(row + 1) * rowSize]
+        assert rowBytes[0] == 0     # no filter
+        rows.append([(byte >> (7 - bit)) & 1 for byte in rowBytes[1:] for bit in range(8)])
+    return rows
+
+
+class MemoryTest(unittest.TestCase):
+
+    def test_dirty_words_and_rows(self):
+        memory = HackMemory.HackMemory()
+        memory.write(0, 5)
+        memory.write(HackMemory.KBD, 1)
+        self.assertEqual(memory.takeDirtyWords(), set())
+
+        memory.write(HackMemory.SCREEN, 1)
+        memory.write(HackMemory.SCREEN + 31, 1)                     # the last word of row 0
+        memory.write(HackMemory.SCREEN + 32 * 200 + 3, -1)
+        memory.write(HackMemory.KBD - 1, 0)                         # rewriting a word with its value still marks it
+        self.assertEqual(memory.dirtyRows(), [0, 200, 255])
+        self.assertEqual(memory.takeDirtyWords(), {0, 31, 32 * 200 + 3, HackMemory.SCREEN_WORDS - 1})
+        self.assertEqual(memory.takeDirtyWords(), set())
+        self.assertEqual(memory.dirtyRows(), [])
+
+    def test_emulator_marks_the_words_it_writes(self):
+        program = ["@1", "D=-A", "@SCREEN", "M=D", "@16416", "M=D", "@R0", "M=D"]
+        emulator = TestSupport.HackEmulator.HackEmulator(TestSupport.assemble("\n".join(program)))
+        emulator.run(len(program))
+        self.assertEqual(emulator.memory.dirtyRows(), [0, 1])
+        self.assertEqual(emulator.memory.takeDirtyWords(), {0, 32})
+
+    def test_frame_pixels(self):
+        memory = HackMemory.HackMemory()
+        frame = HackMemory.ScreenFrame(memory)
+        self.assertEqual(pngPixels(frame.png()), [[1] * HackMemory.SCREEN_COLUMNS] * HackMemory.SCREEN_ROWS)
+
+        memory.write(HackMemory.SCREEN, 0b1)                        # pixel 0 of row 0
+        memory.write(HackMemory.SCREEN + 1, -0x8000 | 0b10)         # pixels 17 and 31: bits 1 and 15, the sign
+        memory.write(HackMemory.SCREEN + 32 * 10 + 31, -1)          # the last 16 pixels of row 10
+        self.assertEqual(frame.update(), 3)
+        rows = pngPixels(frame.png())
+        black = {(row, column) for row in range(HackMemory.SCREEN_ROWS)
+                 for column in range(HackMemory.SCREEN_COLUMNS) if rows[row][column] == 0}
+        self.assertEqual(black, {(0, 0), (0, 17), (0, 31)} | {(10, column) for column in range(496, 512)})
+
+        memory.write(HackMemory.SCREEN, 0)
+        frame.update()
+        self.assertEqual(pngPixels(frame.png())[0][0], 1)
+
+    def test_frame_draws_the_screen_in_full_when_created(self):
+        memory = HackMemory.HackMemory()
+        memory.ram[HackMemory.SCREEN + 32 * 255] = 0b1000   # written without tracking
+        rows = pngPixels(HackMemory.ScreenFrame(memory).png())
+        self.assertEqual([column for column, pixel in enumerate(rows[255]) if pixel == 0], [3])
+        self.assertEqual(memory.dirtyWords, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
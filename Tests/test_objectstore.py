@@ -0,0 +1,64 @@
+'''Tests of ObjectStore, which the build cache and the fragment cache keep their objects in: the least recently used
+   objects are evicted past the store's size, the manifest keeps the entries, and deleted objects are forgotten'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import TestSupport
+
+ObjectStore = TestSupport.ObjectStore
+EXTENSIONS = [".txt", ".txt.map"]
+
+
+class ObjectStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, maxBytes=100):
+        return ObjectStore.ObjectStore(os.path.join(self.directory, "cache"), EXTENSIONS, maxBytes, {"tool": "test"})
+
+    def test_least_recently_used_objects_are_evicted(self):
+        store = self.open()
+        store.write("a", {".txt": b"a" * 40, ".txt.map": b"m" * 10})
+        store.write("b", {".txt": b"b" * 40}, extra=1)
+        store.write("c", {".txt": b"c" * 40})
+        store.entries["a"]["used"] = store.entries["b"]["used"] + 1      # a was used after b
+        store.entries["c"]["used"] = store.entries["a"]["used"] + 1
+        store.save()
+        self.assertEqual(set(store.entries), {"a", "c"})
+        self.assertFalse(os.path.exists(store.fileName("b", ".txt")))
+
+        store = self.open()
+        self.assertEqual(set(store.entries), {"a", "c"})
+        self.assertEqual((store.entries["a"]["size"], store.read("a", ".txt.map")), (50, b"m" * 10))
+        with open(os.path.join(store.directory, ObjectStore.MANIFEST), "r") as input:
+            self.assertIn('"tool": "test"', input.read())
+
+    def test_deleted_objects_are_forgotten(self):
+        store = self.open()
+        store.write("a", {".txt": b"a"})
+        store.write("b", {".txt": b"b"})
+        with self.assertRaises(OSError):
+            store.read("a", ".txt.map")     # stored without a map
+        self.assertIn("a", store)
+        os.remove(store.fileName("b", ".txt"))
+        with self.assertRaises(OSError):
+            store.read("b", ".txt")
+        self.assertNotIn("b", store)
+
+    def test_build_cache_keys_name_the_file(self):
+        for name in ("Main", "Other"):
+            with open(os.path.join(self.directory, name + ".jack"), "w") as output:
+                output.write("class Main { function void main() { return; } }")
+        cache = TestSupport.BuildCache.BuildCache(self.directory)
+        self.assertNotEqual(cache.key(os.path.join(self.directory, "Main.jack")),
+                            cache.key(os.path.join(self.directory, "Other.jack")))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,44 @@
+'''Tests of HackProfiler: the stacks it samples are those of the VM functions, with every option of the translator'''
+
+import unittest
+import TestSupport
+
+CALL_STUB = "$$CALL"
+RETURN_STUB = "$$RETURN"
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def profile(self, options):
+        '''Profiles the test program, sampling every block, until it halts'''
+        words, labels = TestSupport.build(TestSupport.FIB_DIRECTORY, *options)
+        profiler = TestSupport.HackProfiler.HackProfiler(words, labels, sampleInterval=1)
+        profiler.run(10_000_000)
+        self.assertTrue(profiler.emulator.halted)
+        return profiler
+
+    def test_inclusive_counts_include_exclusive_counts(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            with self.subTest(TestSupport.optionsName(*options)):
+                profiler = self.profile(options)
+                functions = profiler.functions()
+                self.assertIn("Main.fib", functions)
+                for name, (exclusive, inclusive) in functions.items():
+                    self.assertGreaterEqual(inclusive, exclusive, name)
+                self.assertEqual(sum(profiler.stacks.values()), profiler.emulator.cycles)
+
+    def test_shared_code_runs_under_its_caller(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            if not options[0]:
+                continue
+            with self.subTest(TestSupport.optionsName(*options)):
+                stacks = self.profile(options).stacks
+                self.assertIn(("Sys.init", "Main.main", "Main.fib", CALL_STUB), stacks)
+                self.assertIn(("Sys.init", "Main.main", "Main.fib", "Main.fib", RETURN_STUB), stacks)
+                for stack in stacks:
+                    if stack[-1] in (CALL_STUB, RETURN_STUB):
+                        self.assertGreater(len(stack), 1, stack)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+'''Tests of SourceMap: ranges are added, extended and composed, the binary form reads back as it was written,
+   and the ROM addresses of the test program resolve to its Jack lines, from the toolchain and from the map files
+   that the command lines of the stages write next to each other'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import TestSupport
+
+SourceMap = TestSupport.SourceMap
+JackToolchain = TestSupport.JackToolchain
+Origin = SourceMap.Origin
+
+
+def origins(sourceMap, positions):
+    '''Returns the Origins of the given positions in a map'''
+    return [sourceMap.lookup(position) for position in positions]
+
+
+class SourceMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_add_and_lookup(self):
+        sourceMap = SourceMap.SourceMap()
+        sourceMap.add(0, "", 0)             # the bootstrap code comes from no file
+        sourceMap.add(3, "Main.vm", 1, "Main.main")
+        sourceMap.add(5, "Main.vm", 1, "Main.main")     # the same origin: the range goes on
+        sourceMap.add(7, "Main.vm", 2, "Main.main")
+        sourceMap.add(7, "Main.vm", 4, "Main.main")     # the same start: replaces the range
+        sourceMap.add(9, "Sys.vm", 2)
+        self.assertEqual(len(sourceMap), 4)
+        self.assertEqual(origins(sourceMap, range(11)), [None] * 3 + [Origin("Main.vm", 1, "Main.main")] * 4
+                         + [Origin("Main.vm", 4, "Main.main")] * 2 + [Origin("Sys.vm", 2, "")] * 2)
+        self.assertIsNone(SourceMap.SourceMap().lookup(0))
+
+    def test_extend(self):
+        fragment = SourceMap.SourceMap()
+        fragment.add(0, "Math.vm", 1, "Math.multiply")
+        fragment.add(4, "Math.vm", 2, "Math.multiply")
+        sourceMap = SourceMap.SourceMap()
+        sourceMap.add(0, "Main.vm", 7)
+        sourceMap.extend(fragment, 10)
+        sourceMap.extend(fragment, 20)
+        self.assertEqual(list(sourceMap.starts), [0, 10, 14, 20, 24])
+        self.assertEqual(sourceMap.lookup(15), Origin("Math.vm", 2, "Math.multiply"))
+        self.assertEqual(sourceMap.names.count("Math.vm"), 1)
+
+    def test_compose(self):
+        romMap = SourceMap.SourceMap()      # ROM addresses --> .asm lines
+        romMap.add(0, "Prog.asm", 1)
+        romMap.add(2, "Prog.asm", 5)
+        romMap.add(4, "Prog.asm", 9)
+        asmMap = SourceMap.SourceMap()      # .asm lines --> .vm lines
+        asmMap.add(1, "", 0)
+        asmMap.add(5, "Main.vm", 3, "Main.main")
+        asmMap.add(9, "Sys.vm", 1, "Sys.init")
+        vmMap = SourceMap.SourceMap()       # Main.vm lines --> Main.jack lines
+        vmMap.add(1, "Main.jack", 2)
+        vmMap.add(3, "Main.jack", 4)
+
+        composed = romMap.compose(lambda fileName: asmMap).compose({"Main.vm": vmMap}.get)
+        self.assertEqual(origins(composed, range(6)), [None] * 2 + [Origin("Main.jack", 4, "Main.main")] * 2
+                         + [Origin("Sys.vm", 1, "Sys.init")] * 2)    # Sys.vm has no map: it keeps its VM lines
+
+    def test_binary_round_trip(self):
+        sourceMap = SourceMap.SourceMap()
+        sourceMap.add(0, "", 0)
+        sourceMap.add(2, "Main.jack", 3, "Main.main")
+        sourceMap.add(70000, "Ünïcode.jack", 123456, "Ünïcode.f")
+        fileName = os.path.join(self.directory, "Prog" + SourceMap.EXTENSION)
+        sourceMap.write(fileName)
+        self.assertEqual(os.listdir(self.directory), ["Prog" + SourceMap.EXTENSION])     # no temporary file is left
+        read = SourceMap.SourceMap.read(fileName)
+        for values in ("starts", "files", "lines", "symbols", "names"):
+            self.assertEqual(list(getattr(read, values)), list(getattr(sourceMap, values)), values)
+        self.assertEqual(read.lookup(70001), Origin("Ünïcode.jack", 123456, "Ünïcode.f"))
+        self.assertEqual(read.toBytes(), sourceMap.toBytes())
+
+        data = sourceMap.toBytes()
+        for broken in (b"HACKMAX\0" + data[8:], data[:8] + b"\x02\x00" + data[10:], data[:5], b""):
+            with self.assertRaises(ValueError):
+                SourceMap.SourceMap.fromBytes(broken, fileName)
+
+    def test_rom_addresses_resolve_to_jack_lines(self):
+        toolchain = JackToolchain.JackToolchain(sourceMaps=True)
+        binaryCodes = toolchain.build(JackToolchain.readSources(TestSupport.FIB_DIRECTORY), debugDirectory=self.directory)
+        with open(os.path.join(self.directory, "Program.asm"), "r") as input:
+            labels = toolchain.assemblyParser.parseProgram(input.read().splitlines())[1]
+        romMap = toolchain.sourceMap
+        self.assertEqual(romMap.lookup(labels["Main.fib"]), Origin("Main.jack", 6, "Main.fib"))
+        self.assertEqual(romMap.lookup(labels["Sys.init"]), Origin("Sys.vm", 2, "Sys.init"))
+        fibLines = {origin.line for origin in origins(romMap, range(len(binaryCodes)))
+                    if origin is not None and origin.symbol == "Main.fib"}
+        self.assertEqual(fibLines, {6, 7, 9})
+
+        # The command lines write a map next to each output file, which resolve() composes
+        fib = os.path.join(self.directory, "Fib")
+        shutil.copytree(TestSupport.FIB_DIRECTORY, fib)
+        TestSupport.runStage(JackToolchain.COMPILER_DIRECTORY, "JackCompiler.py", fib, "--source-map")
+        TestSupport.runStage(JackToolchain.TRANSLATOR_DIRECTORY, "VMTranslator.py", fib, "--source-map")
+        TestSupport.runStage(JackToolchain.ASSEMBLER_DIRECTORY, "HackAssembler.py", os.path.join(fib, "Fib.asm"), "--source-map")
+        resolved = SourceMap.resolve(os.path.join(fib, "Fib" + SourceMap.EXTENSION))
+        self.assertEqual(origins(resolved, range(len(binaryCodes))), origins(romMap, range(len(binaryCodes))))
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+'''Tests of JackTokenizer: strings, comments and integer constants are matched by the single token pattern,
+   errors are reported where they are, and the tokens of the Cars game are those of the original tokenizer'''
+
+import os
+import glob
+import unittest
+import TestSupport
+
+JackTokenizer = TestSupport.JackTokenizer
+CARS_DIRECTORY = os.path.join(TestSupport.JackToolchain.ROOT_DIRECTORY, 'Section 09 - "Cars" Game')
+
+# The tokens of the Cars classes as the original tokenizer wrote them. It removed the comments before it tokenized,
+# so it cut the string of StartWindow that has a "//": that string was written back into StartWindowT.xml
+TOKENS_DIRECTORY = os.path.join(TestSupport.TESTS_DIRECTORY, "Tokens")
+
+
+def tokens(source):
+    '''Returns the (type, value, line, column) of the tokens of the given source code'''
+    return [tuple(token) for token in JackTokenizer.tokenize(source, "Test.jack")]
+
+
+def tokenXML(tokenizer):
+    '''Returns the tokens of a JackTokenizer in the XML of the tokenizer's test files'''
+    lines = ["<tokens>"]
+    while tokenizer.hasMoreTokens():
+        tokenizer.advance()
+        lines.append(f"<{tokenizer.tokenType()}> {tokenizer.value()} </{tokenizer.tokenType()}>")
+    lines.append("</tokens>")
+    return "\n".join(lines) + "\n"
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def assertError(self, source, message):
+        with self.assertRaises(ValueError) as context:
+            tokens(source)
+        self.assertEqual(str(context.exception), message)
+
+    def test_strings(self):
+        self.assertEqual(tokens('let s = "a // b /* c */";'),
+                         [("keyword", "let", 1, 1), ("identifier", "s", 1, 5), ("symbol", "=", 1, 7),
+                          ("stringConstant", "a // b /* c */", 1, 9), ("symbol", ";", 1, 25)])
+        self.assertEqual(tokens('"" "class"'), [("stringConstant", "", 1, 1), ("stringConstant", "class", 1, 4)])
+        self.assertError('do f("abc);', "Test.jack:1:6: unterminated string")
+        self.assertError('do f("abc\n");', "Test.jack:1:6: unterminated string")
+
+    def test_comments(self):
+        source = "// line comment \"\n/* a\n   block */ let /** doc */ x\n/*/ still a comment */ = 1; // end"
+        self.assertEqual(tokens(source), [("keyword", "let", 3, 13), ("identifier", "x", 3, 28),
+                                          ("symbol", "=", 4, 24), ("integerConstant", "1", 4, 26), ("symbol", ";", 4, 27)])
+        self.assertEqual(tokens("x/y//z"), [("identifier", "x", 1, 1), ("symbol", "/", 1, 2), ("identifier", "y", 1, 3)])
+        self.assertError("let x;\n  /* no end", "Test.jack:2:3: unterminated comment")
+
+    def test_keywords_and_identifiers(self):
+        self.assertEqual(tokens("classy class _do do2 do"),
+                         [("identifier", "classy", 1, 1), ("keyword", "class", 1, 8), ("identifier", "_do", 1, 14),
+                          ("identifier", "do2", 1, 18), ("keyword", "do", 1, 22)])
+        self.assertError("let x = 1 # 2;", "Test.jack:1:11: unexpected character '#'")
+
+    def test_integer_bounds(self):
+        self.assertEqual(tokens("0 32767 007"), [("integerConstant", "0", 1, 1), ("integerConstant", "32767", 1, 3),
+                                                 ("integerConstant", "007", 1, 9)])
+        self.assertError("let x = 32768;", "Test.jack:1:9: integer constant 32768 is greater than 32767")
+        self.assertError("let x = -99999;", "Test.jack:1:10: integer constant 99999 is greater than 32767")
+
+    def test_tokenizer_values(self):
+        tokenizer = JackTokenizer.JackTokenizer("Test.jack", 'if (x < 12) { do f("&"); }')
+        values = []
+        while tokenizer.hasMoreTokens():
+            tokenizer.advance()
+            values.append((tokenizer.keyWord(), tokenizer.symbol(), tokenizer.identifier(), tokenizer.intVal(),
+                           tokenizer.stringVal()))
+        self.assertEqual([value for entry in values for value in entry if value is not None],
+                         ["if", "(", "x", "&lt;", 12, ")", "{", "do", "f", "(", "&", ")", ";", "}"])
+        self.assertEqual(tokenizer.position(), (1, 26))
+
+    def test_cars_tokens(self):
+        fileNames = sorted(glob.glob(os.path.join(CARS_DIRECTORY, "*.jack")))
+        self.assertEqual(len(fileNames), len(glob.glob(os.path.join(TOKENS_DIRECTORY, "*T.xml"))))
+        for fileName in fileNames:
+            name = os.path.splitext(os.path.basename(fileName))[0]
+            with self.subTest(name):
+                with open(os.path.join(TOKENS_DIRECTORY, f"{name}T.xml"), "r") as input:
+                    self.assertEqual(tokenXML(JackTokenizer.JackTokenizer(fileName)), input.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
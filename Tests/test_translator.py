@@ -0,0 +1,140 @@
+'''Differential tests of the VM translator: the programs translated with every combination of its options, in one or
+   more processes, and restored from its cache or not, run in the emulator to the same state as in the VM interpreter'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import TestSupport
+
+TRANSLATOR_DIRECTORY = TestSupport.JackToolchain.TRANSLATOR_DIRECTORY
+VM_REGISTERS = range(13)    # SP, LCL, ARG, THIS, THAT and the temp segment, which the VM code sets the same way
+
+# A file whose labels before its first function have the names of the labels that the translator creates
+LABELS_PROGRAM = """push constant 3
+push constant 3
+eq
+if-goto EQ0
+push constant 1
+pop temp 1
+goto ret.0
+label EQ0
+push constant 2
+pop temp 1
+label ret.0
+goto ret.0
+function Labels.unused 0
+push constant 0
+return
+"""
+
+
+def registers(ram):
+    '''Returns the VM registers of a RAM, as unsigned words'''
+    return [ram[address] & 0xFFFF for address in VM_REGISTERS]
+
+
+class TranslatorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.fib = os.path.join(cls.directory, "Fib")
+        os.mkdir(cls.fib)
+        TestSupport.compileProgram(TestSupport.FIB_DIRECTORY, cls.fib)
+        cls.labels = os.path.join(cls.directory, "Labels.vm")
+        with open(cls.labels, "w") as output:
+            output.write(LABELS_PROGRAM)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def translate(self, inputPath, options, *arguments):
+        '''Translates a .vm file or a directory with the command line of the translator,
+           and returns the assembly code and the report of the optimizer (its last line)'''
+        flags = TestSupport.optionsName(*options).split() if any(options) else []
+        output = TestSupport.runStage(TRANSLATOR_DIRECTORY, "VMTranslator.py", inputPath, *flags, *arguments)
+        if os.path.isdir(inputPath):
+            outputFile = os.path.join(inputPath, os.path.basename(inputPath) + ".asm")
+        else:
+            outputFile = inputPath.rpartition(".")[0] + ".asm"
+        with open(outputFile, "r") as input:
+            return input.read(), output.strip().rpartition("\n")[2]
+
+    def assertRunsAsInterpreted(self, assemblyCode, vmPath):
+        expected = registers(TestSupport.interpret(vmPath).ram)
+        words = TestSupport.assemble(assemblyCode)
+        for compileBlocks in (False, True):
+            self.assertEqual(registers(TestSupport.emulate(words, compileBlocks).ram), expected)
+
+    def test_options_run_as_interpreted(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            with self.subTest(TestSupport.optionsName(*options)):
+                assemblyCode, _ = self.translate(self.fib, options, "--no-cache")
+                self.assertRunsAsInterpreted(assemblyCode, self.fib)
+
+    def test_jobs_and_cache_translate_the_same_code(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            with self.subTest(TestSupport.optionsName(*options)):
+                shutil.rmtree(os.path.join(self.directory, TestSupport.FragmentCache.CACHE_DIRECTORY), ignore_errors=True)
+                expected = self.translate(self.fib, options, "--no-cache")
+                self.assertEqual(self.translate(self.fib, options, "--no-cache", "--jobs", "2"), expected)
+                self.assertEqual(self.translate(self.fib, options, "--jobs", "2"), expected)     # not cached yet
+                self.assertEqual(self.translate(self.fib, options), expected)                   # cached
+                self.assertEqual(self.translate(self.fib, options, "--jobs", "2"), expected)
+
+    def test_cache_keys_include_the_options(self):
+        fib = os.path.join(self.directory, "CachedFib")
+        shutil.copytree(self.fib, fib)
+        outputFile = os.path.join(self.directory, "CachedFib.asm")
+
+        def translate(options, cache):
+            sharedCalls, optimize, cacheTop = options
+            optimizer = TestSupport.PeepholeOptimizer.PeepholeOptimizer() if optimize else None
+            TestSupport.VMTranslator.translateProgram(fib, outputFile, sharedCalls, optimizer, cacheTop, cache)
+            with open(outputFile, "r") as input:
+                return input.read()
+
+        expected = {options: translate(options, None) for options in TestSupport.TRANSLATOR_OPTIONS}
+        for _ in range(2):      # the second time, every option's fragments are cached
+            for options in TestSupport.TRANSLATOR_OPTIONS:
+                with self.subTest(TestSupport.optionsName(*options)):
+                    self.assertEqual(translate(options, TestSupport.FragmentCache.FragmentCache(fib)), expected[options])
+
+    def test_labels_before_the_first_function(self):
+        for options in TestSupport.TRANSLATOR_OPTIONS:
+            with self.subTest(TestSupport.optionsName(*options)):
+                assemblyCode, _ = self.translate(self.labels, options, "--no-cache")
+                self.assertRunsAsInterpreted(assemblyCode, self.labels)
+
+    def test_workers_optimize_with_the_given_rules(self):
+        inputFile = os.path.join(self.fib, "Main.vm")
+        defaultOptimizer = TestSupport.PeepholeOptimizer.PeepholeOptimizer()
+        optimizer = TestSupport.PeepholeOptimizer.PeepholeOptimizer([rule for rule in defaultOptimizer.rules if rule.name != "redundant A load"])
+        expected = TestSupport.VMTranslator.translateFile(inputFile, optimizer=optimizer.copy())
+        self.assertNotEqual(TestSupport.VMTranslator.translateFile(inputFile, optimizer=defaultOptimizer), expected)
+        fragment, fileOptimizer, _, _ = TestSupport.VMTranslator._translateInProcess(inputFile, False, optimizer.copy(), False, False, False)
+        self.assertEqual(fragment, expected)
+        self.assertNotIn("redundant A load", fileOptimizer.hits)
+
+        cache = TestSupport.FragmentCache.FragmentCache(self.directory)
+        self.assertNotEqual(cache.key(inputFile, optimizer.signature()), cache.key(inputFile, defaultOptimizer.signature()))
+
+
+class PeepholeTest(unittest.TestCase):
+
+    def optimize(self, lines):
+        optimizer = TestSupport.PeepholeOptimizer.PeepholeOptimizer()
+        return optimizer.feed(lines) + optimizer.finish()
+
+    def test_pop_to_segment(self):
+        popThroughR13 = ["@R13", "M=D", "@SP", "AM=M-1", "D=M", "@R13", "A=M", "M=D"]
+        self.assertEqual(self.optimize(["@LCL", "D=M", "@2", "D=D+A"] + popThroughR13),
+                         ["@SP", "AM=M-1", "D=M", "@LCL", "A=M+1", "A=A+1", "M=D"])
+        # RAM[SP]+1 is computed before the pop changes SP: the pop can't read it afterwards
+        self.assertEqual(self.optimize(["@SP", "D=M", "@1", "D=D+A"] + popThroughR13)[:4], ["@SP", "D=M", "@1", "D=D+A"])
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
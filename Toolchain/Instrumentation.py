@@ -0,0 +1,86 @@
+'''Timers and counters for the stages of the toolchain (tokenizing, compiling, translating, linking, assembling),
+   kept per stage and per file, so a slow build shows which stage and which file take the time.
+   The assembler, the VM translator and the compiler import it from this directory'''
+
+import io
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+SECONDS = "seconds"
+CALLS = "calls"
+
+
+class Instrumentation:
+    '''Collects the time spent in each stage of a run on each file, and counters such as the number of tokens.
+       The stages get it as an optional argument, and do nothing with it when it is None'''
+
+    def __init__(self):
+        self.records = {}       # (stage, file) --> {SECONDS: total time, CALLS: number of timings, counter: total}
+
+    def _record(self, stage, fileName):
+        record = self.records.get((stage, fileName))
+        if record is None:
+            record = self.records[(stage, fileName)] = {SECONDS: 0.0, CALLS: 0}
+        return record
+
+    @contextmanager
+    def timer(self, stage, fileName=""):
+        '''Times the code in the with statement, as a part of the given stage on the given file'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(stage, fileName, time.perf_counter() - start)
+
+    def addTime(self, stage, fileName, seconds):
+        '''Adds a timing that was measured elsewhere to the given stage on the given file'''
+        record = self._record(stage, fileName)
+        record[SECONDS] += seconds
+        record[CALLS] += 1
+
+    def count(self, stage, fileName, counter, amount=1):
+        '''Adds the given amount to a counter of the given stage on the given file'''
+        record = self._record(stage, fileName)
+        record[counter] = record.get(counter, 0) + amount
+
+    def merge(self, other):
+        '''Adds the records of another Instrumentation (of a worker process, for example) to this one's'''
+        for (stage, fileName), otherRecord in other.records.items():
+            record = self._record(stage, fileName)
+            for name, value in otherRecord.items():
+                record[name] = record.get(name, 0) + value
+
+    def rows(self):
+        '''Returns the records as a list of dictionaries, one per stage and file, in the order they were first recorded'''
+        return [{"stage": stage, "file": fileName, **record} for (stage, fileName), record in self.records.items()]
+
+    def totals(self):
+        '''Returns the records summed over the files, as a dictionary of stages'''
+        totals = {}
+        for (stage, _), record in self.records.items():
+            total = totals.setdefault(stage, {})
+            for name, value in record.items():
+                total[name] = total.get(name, 0) + value
+        return totals
+
+    def toJSON(self):
+        return json.dumps({"totals": self.totals(), "files": self.rows()}, indent=1)
+
+    def toCSV(self):
+        '''Returns the rows in CSV, with a column for each counter (empty where a stage doesn't have it)'''
+        rows = self.rows()
+        columns = ["stage", "file", SECONDS, CALLS]
+        for row in rows:
+            columns += [name for name in row if name not in columns]
+        output = io.StringIO()
+        writer = csv.DictWriter(output, columns, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def writeReport(self, fileName):
+        '''Writes the report to the given file, in CSV if its name ends with .csv, and in JSON otherwise'''
+        with open(fileName, "w") as output:
+            output.write(self.toCSV() if fileName.endswith(".csv") else self.toJSON())
\ No newline at end of file
@@ -0,0 +1,193 @@
+import re
+import array
+from collections import namedtuple
+
+KEYWORD = "keyword"
+SYMBOL = "symbol"
+INT_CONST = "integerConstant"
+STRING_CONST = "stringConstant"
+IDENTIFIER = "identifier"
+TYPES = [KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER]     # a token's type is stored as its index in this list
+TYPE_CODES = {tokenType: code for code, tokenType in enumerate(TYPES)}
+
+KEYWORDS = ["class", "constructor", "function", "method", "static", "field", "var", "int", "char", "boolean", "void",
+            "true", "false", "null", "this", "let", "do", "if", "else", "while", "return"]
+MAX_INT = 32767     # integer constants are 0 - 32767, and -32768 can only be computed
+
+'''A single pattern for all the tokens, white space and comments, with a named group for each of them.
+   The input is matched once from start to end, so tokenizing takes linear time'''
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<keyword>(?:""" + "|".join(KEYWORDS) + r""")(?![A-Za-z0-9_]))
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<integerConstant>\d+)
+  | (?P<stringConstant>"[^"\n]*")
+  | (?P<unterminated>/\*|")
+  | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+  | (?P<error>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Modify the returned value for "<", ">", """ and "&" to comply with XML notations
+XML_SYMBOLS = {"<": "&lt;", ">": "&gt;", "\"": "&quot;", "&": "&amp;"}
+
+# A token: its type, its text (without the double quotes of a string constant), and where it starts in the input
+Token = namedtuple("Token", ["type", "value", "line", "column"])
+
+
+def tokenize(source, fileName=""):
+    '''Generates the tokens of the given Jack source code, in a single pass over it'''
+
+    line = 1
+    lineStart = 0       # the position where the current line starts
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        text = match.group()
+        start = match.start()
+
+        if kind == "space" or kind == "comment":
+            newLines = text.count("\n")
+            if newLines:
+                line += newLines
+                lineStart = start + text.rindex("\n") + 1
+
+        elif kind == "unterminated":
+            raise ValueError(f"{fileName}:{line}:{start - lineStart + 1}: unterminated {'comment' if text == '/*' else 'string'}")
+
+        elif kind == "error":
+            raise ValueError(f"{fileName}:{line}:{start - lineStart + 1}: unexpected character {text!r}")
+
+        elif kind == INT_CONST and int(text) > MAX_INT:
+            raise ValueError(f"{fileName}:{line}:{start - lineStart + 1}: integer constant {text} is greater than {MAX_INT}")
+
+        elif kind == STRING_CONST:
+            yield Token(kind, text[1:-1], line, start - lineStart + 1)
+
+        else:
+            yield Token(kind, text, line, start - lineStart + 1)
+
+
+class TokenStream:
+    '''The tokens of a file, packed into parallel arrays: the type code of each token, the index of its value
+       in a table of distinct values, and its line and column. Each distinct value is stored once, in the form
+       the tokenizer returns it (XML notation for symbols, int for integer constants)'''
+
+    def __init__(self, tokens):
+        '''Packs the given Tokens'''
+        self.types = array.array("B")
+        self.valueIndexes = array.array("I")
+        self.lines = array.array("I")
+        self.columns = array.array("I")
+        self.values = []
+        valueIndexes = {}       # (type code, text) --> index in values
+
+        for tokenType, text, line, column in tokens:
+            code = TYPE_CODES[tokenType]
+            key = (code, text)
+            index = valueIndexes.get(key)
+            if index is None:
+                index = valueIndexes[key] = len(self.values)
+                if tokenType == SYMBOL:
+                    self.values.append(XML_SYMBOLS.get(text, text))
+                elif tokenType == INT_CONST:
+                    self.values.append(int(text))
+                else:
+                    self.values.append(text)
+            self.types.append(code)
+            self.valueIndexes.append(index)
+            self.lines.append(line)
+            self.columns.append(column)
+
+    def __len__(self):
+        return len(self.types)
+
+
+class JackTokenizer:
+    '''Breaks the input stream into Jack-language tokens, as specified by the Jack grammar.
+       The tokens are kept in a TokenStream, and the current token is the one at the cursor'''
+
+    def __init__(self, fileName, source=None, instrumentation=None):
+        '''Opens the input file and tokenizes it, or tokenizes the given source code (fileName only names it then).
+           instrumentation (an Instrumentation) times the tokenizing and counts the tokens'''
+
+        if source is None:
+            with open(fileName, "r") as input:
+                source = input.read()
+        if instrumentation is None:
+            self.stream = TokenStream(tokenize(source, fileName))
+        else:
+            with instrumentation.timer("tokenize", fileName):
+                self.stream = TokenStream(tokenize(source, fileName))
+            instrumentation.count("tokenize", fileName, "tokens", len(self.stream))
+            instrumentation.count("tokenize", fileName, "characters read", len(source))
+        self.fileName = fileName
+        self.count = len(self.stream)
+        self.types = self.stream.types
+        self.valueIndexes = self.stream.valueIndexes
+        self.values = self.stream.values
+        self.index = -1         # the cursor: the index of the current token
+        self.currentToken = ""
+        self.type = ""
+
+    def hasMoreTokens(self):
+        '''Checks if there are more tokens in the input'''
+        return self.index + 1 < self.count
+
+    def advance(self):
+        '''Gets the next token from the input and makes it the current token'''
+        index = self.index + 1
+        if index < self.count:
+            self.index = index
+            self.type = TYPES[self.types[index]]
+            self.currentToken = self.values[self.valueIndexes[index]]
+
+    def value(self):
+        '''Returns the current token, whatever its type is, as the method of its type would return it'''
+        return self.currentToken
+
+    def peekType(self, offset=1):
+        '''Returns the type of the token at the given offset from the current token, or None past the end'''
+        index = self.index + offset
+        if 0 <= index < self.count:
+            return TYPES[self.types[index]]
+
+    def peekValue(self, offset=1):
+        '''Returns the token at the given offset from the current token, as value() would return it, or None past the end'''
+        index = self.index + offset
+        if 0 <= index < self.count:
+            return self.values[self.valueIndexes[index]]
+
+    def tokenType(self):
+        '''Returns the type of the current token'''
+        return self.type
+
+    def keyWord(self):
+        '''Returns the keyword which is the current token'''
+        if self.type == KEYWORD:
+            return self.currentToken
+
+    def symbol(self):
+        '''Returns the character which is the current token'''
+        if self.type == SYMBOL:
+            return self.currentToken
+
+    def identifier(self):
+        '''Returns the identifier which is the current token'''
+        if self.type == IDENTIFIER:
+            return self.currentToken
+
+    def intVal(self):
+        '''Returns the integer value of the current token'''
+        if self.type == INT_CONST:
+            return self.currentToken
+
+    def stringVal(self):
+        '''Returns the string value of the current token, without the double quotes'''
+        if self.type == STRING_CONST:
+            return self.currentToken
+
+    def position(self):
+        '''Returns the line and column where the current token starts'''
+        if self.index < 0:
+            return 0, 0
+        return self.stream.lines[self.index], self.stream.columns[self.index]
\ No newline at end of file
@@ -0,0 +1,201 @@
+'''Builds a Jack program into Hack machine code in a single process: the classes are compiled, translated and assembled
+   in memory, with the modules of the compiler (section 11), the VM translator (sections 7-8) and the assembler (section 6).
+   The intermediate .vm and .asm files are only written when a debug directory is given'''
+
+import os
+import io
+import sys
+import time
+import argparse
+import importlib
+import Instrumentation
+import SourceMap
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSEMBLER_DIRECTORY = os.path.join(ROOT_DIRECTORY, "Section 06 - Assembler")
+TRANSLATOR_DIRECTORY = os.path.join(ROOT_DIRECTORY, "Section 07, 08 - VM Translator")
+COMPILER_DIRECTORY = os.path.join(ROOT_DIRECTORY, "Section 11 - Compiler (II)")
+ASSEMBLY_NAME = "Program.asm"   # names the assembly code in the ROM map, which is composed with the map of its lines
+
+
+def loadSection(directory, moduleNames):
+    '''Imports the given modules from a section's directory, and returns them in a dictionary by name.
+       Sections have modules with the same names (SymbolTable is both the assembler's and the compiler's), so the modules
+       that are loaded from the directory are removed from sys.modules afterwards: the loaded modules keep
+       their references to their own siblings, and the next section loads its own modules'''
+
+    loadedBefore = set(sys.modules)
+    sys.path.insert(0, directory)
+    try:
+        modules = {name: importlib.import_module(name) for name in moduleNames}
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - loadedBefore:
+            fileName = getattr(sys.modules[name], "__file__", None)
+            if fileName is not None and os.path.dirname(os.path.abspath(fileName)) == directory:
+                del sys.modules[name]
+    return modules
+
+
+class JackToolchain:
+    '''Compiles, translates and assembles Jack programs, passing the code from stage to stage in memory'''
+
+    def __init__(self, sharedCalls=False, optimize=False, cacheTop=False, instrumentation=None, sourceMaps=False):
+        '''Loads the modules of the stages. The options are those of the VM translator.
+           instrumentation (an Instrumentation) gets the timings and the counters of all the stages.
+           With sourceMaps, each stage maps its output to its input, and a build composes the maps into sourceMap'''
+        assembler = loadSection(ASSEMBLER_DIRECTORY, ["Parser", "HackAssembler", "HackBinary"])
+        translator = loadSection(TRANSLATOR_DIRECTORY, ["VMTranslator", "PeepholeOptimizer"])
+        compiler = loadSection(COMPILER_DIRECTORY, ["CompilationEngine"])
+
+        self.assemblyParser = assembler["Parser"]
+        self.hackAssembler = assembler["HackAssembler"]
+        self.hackBinary = assembler["HackBinary"]
+        self.vmTranslator = translator["VMTranslator"]
+        self.peepholeOptimizer = translator["PeepholeOptimizer"]
+        self.compilationEngine = compiler["CompilationEngine"]
+
+        self.sharedCalls = sharedCalls
+        self.optimize = optimize
+        self.cacheTop = cacheTop
+        self.optimizer = None   # the PeepholeOptimizer of the last translation, for its report
+        self.instrumentation = instrumentation
+        self.sourceMaps = sourceMaps
+        self.vmMaps = {}        # VM file name --> the SourceMap of its lines to the Jack lines of its class
+        self.assemblyMap = None # the SourceMap of the lines of the last translation to the VM lines
+        self.romMap = None      # the SourceMap of the ROM addresses of the last assembly to its lines
+        self.sourceMap = None   # the SourceMap of the ROM addresses of the last build to the Jack lines (or VM lines, for .vm sources)
+
+    def compileClass(self, fileName, source):
+        '''Compiles the Jack code of a class (fileName names it in error messages), and returns its VM code'''
+        output = io.StringIO()
+        classMap = SourceMap.SourceMap() if self.sourceMaps else None
+        self.compilationEngine.CompilationEngine(fileName, source, output, self.instrumentation, classMap).compileClass()
+        if classMap is not None:
+            self.vmMaps[os.path.basename(fileName).rpartition(".")[0] + ".vm"] = classMap
+        return output.getvalue()
+
+    def translate(self, vmSources, isDir=True):
+        '''Translates a program, given as (file name, VM code) pairs, and returns its assembly code.
+           isDir tells whether the program starts by calling Sys.init, as the translation of a directory does'''
+
+        self.optimizer = self.peepholeOptimizer.PeepholeOptimizer() if self.optimize else None
+        fragmentMaps = [SourceMap.SourceMap() if self.sourceMaps else None for _ in vmSources]
+        fragments = [self.vmTranslator.translateFile(fileName, self.sharedCalls, self.optimizer, self.cacheTop, code.splitlines(),
+                                                     self.instrumentation, fragmentMap)
+                     for (fileName, code), fragmentMap in zip(vmSources, fragmentMaps)]
+        start = time.perf_counter()
+        pieces = list(self.vmTranslator.linkedCode(fragments, isDir, self.sharedCalls, self.optimizer, self.cacheTop))
+        assemblyCode = "".join(pieces)
+        if self.instrumentation is not None:
+            self.instrumentation.addTime("link", "", time.perf_counter() - start)
+        if self.sourceMaps:
+            self.assemblyMap = self.vmTranslator.linkedSourceMap([piece.count("\n") for piece in pieces], fragmentMaps)
+        return assemblyCode
+
+    def assemble(self, assemblyCode):
+        '''Assembles a program, and returns its binary codes (a string of 16 '0'/'1' characters per instruction)'''
+        start = time.perf_counter()
+        lines = assemblyCode.splitlines()
+        instructions, labels = self.assemblyParser.parseProgram(lines)
+        if self.sourceMaps:
+            self.romMap = self.assemblyParser.mapProgram(lines, ASSEMBLY_NAME)
+        parsed = time.perf_counter()
+        binaryCodes = self.hackAssembler.assembleProgram(instructions, labels)
+        if self.instrumentation is not None:
+            self.instrumentation.addTime("parse", "", parsed - start)
+            self.instrumentation.count("parse", "", "instructions", len(instructions))
+            self.instrumentation.addTime("assemble", "", time.perf_counter() - parsed)
+            self.instrumentation.count("assemble", "", "labels resolved", len(labels))
+        return binaryCodes
+
+    def build(self, sources, isDir=True, debugDirectory=None, programName="Program"):
+        '''Builds a program from its source files, given as a dictionary of file names and code: .jack files
+           are compiled, and .vm files (such as the OS's) are translated as they are. Returns the binary codes.
+           With a debugDirectory, the VM code of the classes and the assembly code (programName.asm) are written there too'''
+
+        vmSources = []
+        self.vmMaps = {}
+        for fileName in sorted(sources, key=os.path.basename):     # the order of VMTranslator.vmFiles
+            name, extension = os.path.splitext(os.path.basename(fileName))
+            if extension == ".jack":
+                code = self.compileClass(fileName, sources[fileName])
+                if debugDirectory is not None:
+                    with open(os.path.join(debugDirectory, name + ".vm"), "w") as output:
+                        output.write(code)
+            else:
+                code = sources[fileName]
+            vmSources.append((name + ".vm", code))
+
+        assemblyCode = self.translate(vmSources, isDir)
+        if debugDirectory is not None:
+            with open(os.path.join(debugDirectory, programName + ".asm"), "w") as output:
+                output.write(assemblyCode)
+
+        binaryCodes = self.assemble(assemblyCode)
+        if self.sourceMaps:
+            self.sourceMap = self.romMap.compose(lambda fileName: self.assemblyMap).compose(self.vmMaps.get)
+        return binaryCodes
+
+
+def readSources(inputPath):
+    '''Reads the source files of a program: a .jack or .vm file, or the .jack files in a directory
+       and its .vm files that have no .jack file (such as the OS's)'''
+
+    if not os.path.isdir(inputPath):
+        fileNames = [inputPath]
+    else:
+        names = sorted(os.listdir(inputPath))
+        jackNames = {name.rpartition(".")[0] for name in names if name.endswith(".jack")}
+        fileNames = [os.path.join(inputPath, name) for name in names
+                     if name.endswith(".jack") or (name.endswith(".vm") and name.rpartition(".")[0] not in jackNames)]
+
+    sources = {}
+    for fileName in fileNames:
+        with open(fileName, "r") as input:
+            sources[fileName] = input.read()
+    return sources
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Builds a Jack program (a .jack file or a directory) into Hack machine code, without intermediate files")
+    argumentParser.add_argument("inputPath", help="a .jack or .vm file, or a directory of .jack and .vm files")
+    argumentParser.add_argument("--debug-dir", help="a directory to write the intermediate .vm and .asm files to")
+    argumentParser.add_argument("--shared-calls", action="store_true", help="see VMTranslator.py")
+    argumentParser.add_argument("--optimize", action="store_true", help="see VMTranslator.py")
+    argumentParser.add_argument("--cache-top", action="store_true", help="see VMTranslator.py")
+    argumentParser.add_argument("--format", action="append", choices=["hack", "bin", "hackbin"], dest="formats",
+                                help="output format, may be given more than once (see HackAssembler.py)")
+    argumentParser.add_argument("--report", help="write the timings and the counters of each stage and file to this file (.json or .csv)")
+    argumentParser.add_argument("--source-map", action="store_true", help="write the map of the ROM addresses to the Jack lines (Prog.map)")
+    arguments = argumentParser.parse_args()
+
+    inputPath = arguments.inputPath
+    isDir = os.path.isdir(inputPath)
+    if isDir:
+        outputFilePath = os.path.join(inputPath, os.path.basename(os.path.normpath(inputPath)))
+    else:
+        outputFilePath = inputPath.rpartition(".")[0]
+    if arguments.debug_dir is not None:
+        os.makedirs(arguments.debug_dir, exist_ok=True)
+
+    toolchain = JackToolchain(arguments.shared_calls, arguments.optimize, arguments.cache_top, sourceMaps=arguments.source_map)
+    if arguments.report:
+        toolchain.instrumentation = Instrumentation.Instrumentation()
+    try:
+        binaryCodes = toolchain.build(readSources(inputPath), isDir, arguments.debug_dir, os.path.basename(outputFilePath))
+    except ValueError as error:
+        sys.exit(str(error))
+
+    start = time.perf_counter()
+    written = toolchain.hackAssembler.writeProgram(binaryCodes, outputFilePath, arguments.formats or ["hack"])
+    if toolchain.instrumentation is not None:
+        toolchain.instrumentation.addTime("write", outputFilePath, time.perf_counter() - start)
+        toolchain.instrumentation.count("write", outputFilePath, "bytes written", written)
+        toolchain.instrumentation.writeReport(arguments.report)
+    if toolchain.sourceMap is not None:
+        toolchain.sourceMap.write(outputFilePath + SourceMap.EXTENSION)
+
+    if toolchain.optimizer is not None:
+        print("\n".join(toolchain.optimizer.report()))
\ No newline at end of file
@@ -0,0 +1,99 @@
+'''A content-addressed store of files on disk, which the build cache of the compiler and the fragment cache of the VM
+   translator keep their objects in. An object is stored under a key (a hash of everything its contents depend on),
+   as one file per extension, and a manifest holds the size and the last use time of each object, for the eviction.
+   The compiler and the VM translator import it from this directory'''
+
+import os
+import json
+import time
+import hashlib
+
+OBJECTS_DIRECTORY = "objects"       # holds the files of the objects, named after their keys
+MANIFEST = "manifest.json"
+
+
+def writeAtomically(fileName, data):
+    '''Writes the given bytes to a temporary file, which then replaces the given file'''
+    temporaryName = f"{fileName}.{os.getpid()}.tmp"
+    with open(temporaryName, "wb") as output:
+        output.write(data)
+    os.replace(temporaryName, fileName)
+
+
+def hashFiles(directory, fileNames):
+    '''Returns a hash of the contents of the given files, whose names are relative to the given directory
+       (or absolute)'''
+    digest = hashlib.sha256()
+    for fileName in fileNames:
+        with open(os.path.join(directory, fileName), "rb") as input:
+            digest.update(input.read())
+    return digest.hexdigest()
+
+
+class ObjectStore:
+    '''The objects of a cache directory. The files of an object are its key followed by one of the store's extensions;
+       an object may be stored without some of them. The manifest entry of an object is a dictionary with its size
+       in bytes ("size"), its last use time ("used"), and the data that the cache keeps with it'''
+
+    def __init__(self, directory, extensions, maxBytes, description):
+        '''Opens (or creates) the store in the given directory. description (a dictionary) is written at the top
+           of the manifest, to tell what produced the objects'''
+        self.directory = directory
+        self.objects = os.path.join(directory, OBJECTS_DIRECTORY)
+        self.extensions = extensions
+        self.maxBytes = maxBytes
+        self.description = description
+        os.makedirs(self.objects, exist_ok=True)
+
+        try:
+            with open(os.path.join(directory, MANIFEST), "r") as input:
+                self.entries = json.load(input)["entries"]     # key --> {"size": bytes, "used": time, ...}
+        except (OSError, ValueError, KeyError):                 # no manifest yet, or a broken one
+            self.entries = {}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def fileName(self, key, extension):
+        '''Returns the name of the file of the given object with the given extension'''
+        return os.path.join(self.objects, key + extension)
+
+    def read(self, key, extension):
+        '''Returns the bytes of the file of the given object with the given extension. Raises OSError if it is missing,
+           and forgets the object if its first file is missing, since it was deleted'''
+        try:
+            with open(self.fileName(key, extension), "rb") as input:
+                return input.read()
+        except OSError:
+            if not os.path.exists(self.fileName(key, self.extensions[0])):
+                self.entries.pop(key, None)
+            raise
+
+    def write(self, key, files, **data):
+        '''Stores an object: files maps extensions to the bytes of the object's files, and data is kept in its entry'''
+        size = 0
+        for extension, contents in files.items():
+            writeAtomically(self.fileName(key, extension), contents)
+            size += len(contents)
+        self.entries[key] = {"size": size, "used": time.time(), **data}
+
+    def touch(self, key):
+        '''Marks the given object as just used'''
+        self.entries[key]["used"] = time.time()
+
+    def save(self):
+        '''Evicts the least recently used objects until the store fits in its size, and writes the manifest'''
+
+        size = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["used"]):
+            if size <= self.maxBytes:
+                break
+            size -= self.entries.pop(key)["size"]
+            for extension in self.extensions:
+                try:
+                    os.remove(self.fileName(key, extension))
+                except OSError:
+                    pass
+
+        manifest = {**self.description, "entries": self.entries}
+        writeAtomically(os.path.join(self.directory, MANIFEST), json.dumps(manifest, indent=1).encode())
\ No newline at end of file
@@ -0,0 +1,181 @@
+'''Source maps, which link the output of a stage of the toolchain back to its input: the compiler maps the lines
+   of a .vm file to the lines of its .jack file, the VM translator maps the lines of the .asm file to the lines
+   of the .vm files, and the assembler maps ROM addresses to the lines of the .asm file.
+   A map is a list of ranges of positions, kept in sorted parallel arrays, so a position is resolved by a binary search.
+   The maps of the stages compose into a map from ROM addresses to Jack lines.
+   The assembler, the VM translator and the compiler import it from this directory'''
+
+import os
+import sys
+import array
+import bisect
+import struct
+import argparse
+from collections import namedtuple
+
+EXTENSION = ".map"      # the map of an output file is named after it: Main.vm.map, Prog.asm.map (Prog.map for the ROM)
+
+MAGIC = b"HACKMAP\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHII")    # magic, version, size of the names in bytes, number of ranges
+
+# Where a position comes from: the input file, the line in it, and the function (or subroutine, or label) around it
+Origin = namedtuple("Origin", ["file", "line", "symbol"])
+
+
+class SourceMap:
+    '''Maps positions in the output of a stage (line numbers or ROM addresses) to Origins. A range starts at a position
+       and ends where the next one starts. File names and symbols are kept once, in a table of names (the name 0 is "",
+       the file of the positions that don't come from any input, such as the bootstrap code)'''
+
+    def __init__(self):
+        self.starts = array.array("I")      # the first position of each range, in increasing order
+        self.files = array.array("I")       # the index of the range's file in names
+        self.lines = array.array("I")
+        self.symbols = array.array("I")     # the index of the range's symbol in names
+        self.names = [""]
+        self.nameIndexes = {"": 0}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _nameIndex(self, name):
+        index = self.nameIndexes.get(name)
+        if index is None:
+            index = self.nameIndexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def add(self, start, fileName, line, symbol=""):
+        '''Starts a range at the given position, which can't be before the last range's start.
+           A range that starts where the last one starts replaces it, and a range with the last one's origin extends it'''
+
+        file = self._nameIndex(fileName)
+        symbol = self._nameIndex(symbol)
+        starts = self.starts
+        if starts and starts[-1] == start:
+            for values in (starts, self.files, self.lines, self.symbols):
+                values.pop()
+        if starts and self.files[-1] == file and self.lines[-1] == line and self.symbols[-1] == symbol:
+            return
+        starts.append(start)
+        self.files.append(file)
+        self.lines.append(line)
+        self.symbols.append(symbol)
+
+    def extend(self, other, offset):
+        '''Adds the ranges of another map (of a fragment of the code, for example), with their positions moved by offset'''
+        names = other.names
+        for start, file, line, symbol in zip(other.starts, other.files, other.lines, other.symbols):
+            self.add(start + offset, names[file], line, names[symbol])
+
+    def lookup(self, position):
+        '''Returns the Origin of the given position, or None if it doesn't come from any input'''
+        index = bisect.bisect_right(self.starts, position) - 1
+        if index < 0 or self.files[index] == 0:
+            return None
+        return Origin(self.names[self.files[index]], self.lines[index], self.names[self.symbols[index]])
+
+    def compose(self, innerMap):
+        '''Returns a map from this map's positions to the origins of their origins. innerMap(fileName) returns the map
+           of one of this map's files (a map of the stage before), or None, and then the positions keep their origin'''
+
+        composed = SourceMap()
+        names = self.names
+        innerMaps = {}
+        for start, file, line, symbol in zip(self.starts, self.files, self.lines, self.symbols):
+            fileName = names[file]
+            if fileName not in innerMaps:
+                innerMaps[fileName] = innerMap(fileName) if fileName else None
+            inner = innerMaps[fileName]
+            if inner is None:
+                composed.add(start, fileName, line, names[symbol])
+                continue
+            index = bisect.bisect_right(inner.starts, line) - 1
+            if index < 0:
+                composed.add(start, "", 0, names[symbol])
+            else:
+                composed.add(start, inner.names[inner.files[index]], inner.lines[index],
+                             inner.names[inner.symbols[index]] or names[symbol])
+        return composed
+
+    def toBytes(self):
+        '''Returns the map in its binary form: a header, the names (separated by line breaks),
+           and the four arrays of 32-bit values in little endian order'''
+        names = "\n".join(self.names).encode()
+        parts = [HEADER.pack(MAGIC, VERSION, len(names), len(self.starts)), names]
+        for values in (self.starts, self.files, self.lines, self.symbols):
+            if sys.byteorder != "little":
+                values = array.array("I", values)
+                values.byteswap()
+            parts.append(values.tobytes())
+        return b"".join(parts)
+
+    @staticmethod
+    def fromBytes(data, fileName=""):
+        '''Returns the map of the given binary form (fileName only names it in errors)'''
+        try:
+            magic, version, namesSize, count = HEADER.unpack_from(data)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{fileName} is not a version {VERSION} source map")
+
+        sourceMap = SourceMap()
+        position = HEADER.size + namesSize
+        sourceMap.names = data[HEADER.size:position].decode().split("\n")
+        sourceMap.nameIndexes = {name: index for index, name in enumerate(sourceMap.names)}
+        for values in (sourceMap.starts, sourceMap.files, sourceMap.lines, sourceMap.symbols):
+            values.frombytes(data[position:position + 4 * count])
+            if sys.byteorder != "little":
+                values.byteswap()
+            position += 4 * count
+        return sourceMap
+
+    def write(self, fileName):
+        '''Writes the map to a temporary file, which then replaces the given file, so a reader never sees half a map'''
+        temporaryName = f"{fileName}.{os.getpid()}.tmp"
+        with open(temporaryName, "wb") as output:
+            output.write(self.toBytes())
+        os.replace(temporaryName, fileName)
+
+    @staticmethod
+    def read(fileName):
+        '''Reads the map in the given file'''
+        with open(fileName, "rb") as input:
+            return SourceMap.fromBytes(input.read(), fileName)
+
+
+def resolve(fileName, resolved=None):
+    '''Reads the map in the given file, and composes it with the maps of its files that are found next to it
+       (and so on, with their own maps), so its positions resolve to the first stage that has maps'''
+
+    resolved = {} if resolved is None else resolved      # map file name --> its resolved map (or None if there is none)
+    directory = os.path.dirname(fileName)
+
+    def innerMap(inputName):
+        innerFileName = os.path.join(directory, os.path.basename(inputName) + EXTENSION)
+        if innerFileName not in resolved:
+            resolved[innerFileName] = resolve(innerFileName, resolved) if os.path.isfile(innerFileName) else None
+        return resolved[innerFileName]
+
+    return SourceMap.read(fileName).compose(innerMap)
+
+
+if __name__ == "__main__":
+
+    argumentParser = argparse.ArgumentParser(description="Resolves positions (ROM addresses, or lines of the mapped file) through source maps")
+    argumentParser.add_argument("mapFile", help="a source map, such as Prog.map; the maps of its files are looked for next to it")
+    argumentParser.add_argument("positions", type=int, nargs="*", help="the positions to resolve")
+    argumentParser.add_argument("--compose", metavar="OUTPUT", help="write the composed map to this file")
+    arguments = argumentParser.parse_args()
+
+    try:
+        sourceMap = resolve(arguments.mapFile)
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+    for position in arguments.positions:
+        origin = sourceMap.lookup(position)
+        print(f"{position}: " + ("no source" if origin is None else f"{origin.file}:{origin.line} ({origin.symbol})"))
+    if arguments.compose is not None:
+        sourceMap.write(arguments.compose)
\ No newline at end of file